@@ -0,0 +1,257 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import dspy
+
+from utils.config import get_data_path
+from utils.fake_lm import FakeSentimentLM
+from utils.instrumentation import InstrumentedLM
+from utils.rate_limiter import RateLimitedLM, TokenBucketRateLimiter
+
+SCENARIOS = ("startup", "load", "evaluation", "optimization", "mipro")
+
+# Executado em um processo novo: importa main.py e os fluxos pedidos, sem rodá-los
+_STARTUP_SNIPPET = (
+    "import time; start = time.perf_counter(); import app.main as m; "
+    "[m.load_strategy(c) for c in {choices!r}]; print(time.perf_counter() - start)"
+)
+
+_POSITIVE = ["ótimo", "excelente", "recomendo", "chegou rápido", "bem embalado", "adorei"]
+_NEGATIVE = ["péssimo", "quebrado", "não recomendo", "atrasou", "defeito", "horrível"]
+_NEUTRAL = ["ok", "razoável", "cumpre o que promete", "nada demais", "dentro do esperado"]
+
+
+class TimedTokenBucketRateLimiter(TokenBucketRateLimiter):
+    """Token bucket que acumula o tempo total de espera, para o relatório."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_total = 0.0
+        self.waits = 0
+
+    def reserve(self, **costs) -> float:
+        wait_time = super().reserve(**costs)
+        with self.lock:
+            self.wait_total += wait_time
+            self.waits += wait_time > 0
+        return wait_time
+
+
+def write_synthetic_dataset(path: Path, rows: int, seed: int = 42) -> None:
+    """CSV no formato do B2W (review_text, overall_rating) com textos repetidos, como no dataset real."""
+    import pandas as pd
+
+    rng = random.Random(seed)
+    texts, ratings = [], []
+    for _ in range(rows):
+        rating = rng.randint(1, 5)
+        words = _POSITIVE if rating > 3 else _NEGATIVE if rating < 3 else _NEUTRAL
+        texts.append(f"Produto {rng.choice(words)}, {rng.choice(words)}. Pedido {rng.randint(1, rows // 2)}")
+        ratings.append(rating)
+    pd.DataFrame({"review_text": texts, "overall_rating": ratings}).to_csv(path, index=False)
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _load_scenarios(args):
+    """Importado só depois do chdir: os módulos de avaliação criam results/ no diretório atual."""
+    from domain.dataset.b2w_review import B2WReviews
+    from domain.evaluation.sentiment_eval import run_evaluation
+    from domain.evaluation.sentiment_opt_fewshot import run_optimization
+    from domain.evaluation.sentiment_opt_mipro_v2 import SentimentMiproManager
+
+    def load():
+        B2WReviews(sample=args.sample, use_cache=False).get_train_test_split()
+        B2WReviews(sample=args.sample, use_cache=True).get_train_test_split()
+
+    return {
+        "load": load,
+        "evaluation": run_evaluation,
+        "optimization": run_optimization,
+        "mipro": lambda: SentimentMiproManager().run_mipro_optimization(),
+    }
+
+
+def measure_startup(repeats: int = 3) -> dict:
+    """
+    Tempo de inicialização do main.py por OPTIMIZER_TYPE, em processos novos
+    (mediana de `repeats`). "ALL" importa todos os fluxos, como o main.py fazia
+    antes do carregamento sob demanda. `created_files` lista o que o import
+    criou no diretório atual (deve ficar vazio). "HELP" mede `main.py --help`.
+    """
+    from app.main import STRATEGIES
+
+    env = {**os.environ, "PYTHONPATH": str(Path(__file__).parent.parent)}
+    timings = {}
+    for choice in [*STRATEGIES, "ALL"]:
+        choices = list(STRATEGIES) if choice == "ALL" else [choice]
+        cwd = tempfile.mkdtemp(prefix="dspy_startup_")
+        process, imports = [], []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            stdout = subprocess.run(
+                [sys.executable, "-c", _STARTUP_SNIPPET.format(choices=choices)],
+                cwd=cwd, env=env, capture_output=True, text=True, check=True,
+            ).stdout
+            process.append(time.perf_counter() - start)
+            imports.append(float(stdout.split()[-1]))
+        timings[choice] = {
+            "process_seconds": round(statistics.median(process), 4),
+            "import_seconds": round(statistics.median(imports), 4),
+            "created_files": sorted(os.listdir(cwd)),
+        }
+        shutil.rmtree(cwd, ignore_errors=True)
+
+    process = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, str(Path(__file__).parent / "main.py"), "--help"], capture_output=True, check=True)
+        process.append(time.perf_counter() - start)
+    timings["HELP"] = {"process_seconds": round(statistics.median(process), 4), "import_seconds": None, "created_files": []}
+    return timings
+
+
+def run_scenario(name, fn, fake_lm, limiter, verbose=False) -> dict:
+    fake_lm.reset_stats()
+    limiter.wait_total, limiter.waits = 0.0, 0
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    error = None
+    with output:
+        try:
+            fn()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    wall = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "scenario": name,
+        "wall_seconds": round(wall, 4),
+        "lm_calls": fake_lm.calls,
+        "requests_per_second": round(fake_lm.calls / wall, 3) if wall else 0.0,
+        "limiter_wait_seconds": round(limiter.wait_total, 4),
+        "limiter_waits": limiter.waits,
+        "rate_limited": fake_lm.rate_limited,
+        "peak_memory_mb": round(peak / 2 ** 20, 2),
+        "error": error,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks do pipeline com um LM simulado (sem gastar cota)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Lista separada por vírgula: {', '.join(SCENARIOS)}")
+    parser.add_argument("--sample", type=int, default=200, help="Tamanho da amostra do dataset (LIMIT_DATASET_EVAL)")
+    parser.add_argument("--synthetic-rows", type=int, default=5000, help="Linhas do CSV sintético, usado se o B2W não existir")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Mediana da latência simulada por chamada")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Dispersão (log-normal) da latência")
+    parser.add_argument("--accuracy", type=float, default=0.8, help="Fração de rótulos corretos devolvidos pelo LM simulado")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fração das chamadas que recebem 429")
+    parser.add_argument("--max-req", type=int, default=50, help="Requisições por janela do rate limiter")
+    parser.add_argument("--window", type=int, default=1, help="Janela do rate limiter em segundos")
+    parser.add_argument("--burst", type=int, default=5, help="Rajada máxima do rate limiter")
+    parser.add_argument("--threads", type=int, default=4, help="DSPY_NUM_THREADS")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--startup-repeats", type=int, default=3, help="Processos por fluxo no cenário startup")
+    parser.add_argument("--output", default=None, help="Arquivo JSON (padrão: results/benchmarks/benchmark_<data>.json)")
+    parser.add_argument("--verbose", action="store_true", help="Mostra a saída dos cenários")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    output = Path(args.output or f"results/benchmarks/benchmark_{timestamp}.json").resolve()
+
+    # Diretório isolado: checkpoints e logs de execuções anteriores não podem ser reaproveitados
+    workdir = Path(tempfile.mkdtemp(prefix="dspy_bench_"))
+    os.chdir(workdir)
+    if not os.path.exists(get_data_path()):
+        os.environ["B2W_DATA_PATH"] = str(workdir / "synthetic_b2w.csv")
+        write_synthetic_dataset(Path(os.environ["B2W_DATA_PATH"]), args.synthetic_rows)
+    os.environ.update({
+        "LIMIT_DATASET_EVAL": str(args.sample),
+        "DSPY_NUM_THREADS": str(args.threads),
+        "DSPY_LM_CACHE": "off",
+        # Mesma cota do limiter abaixo, para o planejador de orçamento do MIPRO
+        "DSPY_API_MAX_REQ": str(args.max_req),
+        "DSPY_API_WINDOW": str(args.window),
+        "DSPY_PLAN_LATENCY": str(args.latency_ms / 1000),
+    })
+    os.environ.setdefault("EVAL_MODE", "full")
+
+    scenarios = _load_scenarios(args)
+    from domain.dataset.b2w_review import B2WReviews
+
+    train_set, test_set = B2WReviews(sample=args.sample).get_train_test_split()
+    fake_lm = FakeSentimentLM(
+        labels_by_text={ex.text.strip(): ex.sentiment for ex in [*train_set, *test_set]},
+        accuracy=args.accuracy,
+        latency=args.latency_ms / 1000,
+        latency_sigma=args.latency_sigma,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed,
+    )
+    limiter = TimedTokenBucketRateLimiter(max_requests=args.max_req, window_seconds=args.window, burst=args.burst)
+    dspy.settings.configure(lm=InstrumentedLM(RateLimitedLM(fake_lm, limiter)))
+
+    results = []
+    for name in [s.strip() for s in args.scenarios.split(",") if s.strip()]:
+        if name not in scenarios and name != "startup":
+            raise SystemExit(f"Cenário desconhecido: {name}")
+        print(f"--- Benchmark: {name} ---")
+        if name == "startup":
+            result = {"scenario": name, "startup": measure_startup(args.startup_repeats)}
+            for choice, timing in result["startup"].items():
+                print(
+                    f"startup {choice}: {timing['process_seconds']:.2f}s por processo"
+                    + (f" (imports {timing['import_seconds']:.2f}s)" if timing["import_seconds"] is not None else "")
+                    + (f" | arquivos criados: {timing['created_files']}" if timing["created_files"] else "")
+                )
+            results.append(result)
+            continue
+        result = run_scenario(name, scenarios[name], fake_lm, limiter, verbose=args.verbose)
+        print(
+            f"{name}: {result['wall_seconds']:.2f}s | {result['lm_calls']} chamadas "
+            f"({result['requests_per_second']:.1f} req/s) | espera no limiter {result['limiter_wait_seconds']:.2f}s "
+            f"| pico de memória {result['peak_memory_mb']:.1f} MB" + (f" | ERRO: {result['error']}" if result["error"] else "")
+        )
+        results.append(result)
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(
+            {"timestamp": timestamp, "commit": _git_commit(), "params": vars(args), "results": results},
+            f, ensure_ascii=False, indent=2,
+        )
+    print(f"Resultados salvos em {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import argparse
+import importlib
 import os
 import sys
 import warnings
@@ -5,45 +7,95 @@ from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from domain.evaluation.sentiment_eval import run_evaluation
 from dotenv import load_dotenv
-from domain.evaluation.sentiment_opt_fewshot import run_optimization
-from domain.evaluation.sentiment_opt_mipro_v2 import SentimentMiproManager
-from utils.config import setup_llm
+
+# Módulo e função de cada fluxo; o módulo só é importado quando OPTIMIZER_TYPE
+# o seleciona (MIPROv2, Evaluate e pandas ficam fora das outras execuções)
+STRATEGIES = {
+    "EVALUATION": ("domain.evaluation.sentiment_eval", "run_evaluation"),
+    "BOOTSTRAP": ("domain.evaluation.sentiment_opt_fewshot", "run_optimization"),
+    "MIPRO": ("domain.evaluation.sentiment_opt_mipro_v2", "SentimentMiproManager"),
+}
 
 # Suprimir TODOS os warnings do console
 warnings.filterwarnings('ignore')
 
+def load_strategy(choice):
+    """Importa o módulo do fluxo escolhido (padrão: EVALUATION) e retorna a função ou classe do fluxo."""
+    module_name, attribute = STRATEGIES.get(choice, STRATEGIES["EVALUATION"])
+    return getattr(importlib.import_module(module_name), attribute)
+
 # Funções de fluxo do miprov2
-def run_mipro_flow():
+def run_mipro_flow(resume=False, plan_only=False, over_budget=False):
     """Encapsula a sequência de comandos do MIPROv2"""
+    SentimentMiproManager = load_strategy("MIPRO")
     # O MIPRO é mais pesado pois propõe candidatos e analisa o dataset
     manager = SentimentMiproManager()
-    manager.run_mipro_optimization(num_candidates=3)
+    # Candidatos, trials e tamanhos dos conjuntos saem do orçamento (DSPY_BUDGET_REQUESTS / DSPY_BUDGET_MINUTES)
+    plan = manager.plan()
+    if plan_only:
+        from domain.evaluation.budget import budget_from_env, report
+
+        print(plan)
+        report(plan.predicted_calls, {}, budget_from_env())
+        return
+    manager.run_mipro_optimization(plan=plan, resume=resume, over_budget=over_budget)
     manager.save_checkpoint("sentiment_mipro_final.json")
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Avaliação e otimização de sentimento com DSPy")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continua a otimização a partir do último checkpoint em results/checkpoints/",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Só mostra o plano do MIPRO e as chamadas ao LM previstas, sem executar",
+    )
+    parser.add_argument(
+        "--over-budget",
+        action="store_true",
+        help="Executa o MIPRO/BOOTSTRAP mesmo quando nem o plano mais enxuto cabe no orçamento",
+    )
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
+    # dspy (e litellm) só são importados depois do parse: `--help` responde na hora
+    from domain.evaluation.budget import BudgetExceededError
+    from utils.config import setup_llm
+    from utils.instrumentation import metrics
+
     load_dotenv()
     setup_llm()
 
     # 1. Mapeamento de Opções
+    # (cada entrada importa o seu fluxo só ao ser executada)
     strategies = {
-        "EVALUATION": run_evaluation,
-        "BOOTSTRAP": run_optimization,
-        "MIPRO": run_mipro_flow
+        "EVALUATION": lambda: load_strategy("EVALUATION")(),
+        "BOOTSTRAP": lambda: load_strategy("BOOTSTRAP")(resume=args.resume, over_budget=args.over_budget),
+        "MIPRO": lambda: run_mipro_flow(resume=args.resume, plan_only=args.plan, over_budget=args.over_budget)
         }
     
     # 3. Execução
     choice = os.getenv("OPTIMIZER_TYPE", "MIPRO").upper()
     
     # Busca a função no dicionário. Se não achar, usa run_evaluation como padrão.
-    action = strategies.get(choice, run_evaluation)
+    action = strategies.get(choice, strategies["EVALUATION"])
     
     print(f"--- Iniciando: {choice} ---")
     
     # AGORA sim nós executamos a função escolhida
-    action()
+    # (com p50/p95/p99 das chamadas ao LM ao final, em results/metrics/)
+    with metrics.phase(choice.lower()):
+        try:
+            action()
+        except BudgetExceededError as e:
+            sys.exit(str(e))
     
 if __name__ == "__main__":
     main()
\ No newline at end of file
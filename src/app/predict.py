@@ -0,0 +1,69 @@
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from dotenv import load_dotenv
+
+DEFAULT_PROGRAM = Path("results") / "sentiment_mipro_final.json"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Classificação em lote com um programa otimizado salvo")
+    parser.add_argument("input", type=Path, help="Reviews em CSV ou JSONL")
+    parser.add_argument("output", type=Path, help="Saída rotulada (.jsonl ou .csv)")
+    parser.add_argument("--program", type=Path, default=DEFAULT_PROGRAM,
+                        help=f"Programa salvo pelo otimizador (padrão: {DEFAULT_PROGRAM})")
+    parser.add_argument("--text-column", default=None, help="Coluna com o texto (padrão: review_text ou text)")
+    parser.add_argument("--id-column", default=None, help="Coluna copiada para o campo id (padrão: número da linha)")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("DSPY_NUM_THREADS", "8")),
+                        help="Reviews classificados ao mesmo tempo (padrão: DSPY_NUM_THREADS ou 8)")
+    parser.add_argument("--window", type=int, default=None,
+                        help="Máximo de reviews em memória (padrão: 4x a concorrência)")
+    parser.add_argument("--resume", action="store_true", help="Continua a partir do progresso salvo junto da saída")
+    parser.add_argument("--limit", type=int, default=None, help="Classifica no máximo N reviews nesta execução")
+    parser.add_argument("--include-text", action="store_true", help="Copia o texto do review para a saída")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    load_dotenv()
+    # As métricas por chamada e o histórico do dspy crescem com o número de
+    # linhas; em lote ficam desligados, a menos que DSPY_METRICS=true
+    os.environ.setdefault("DSPY_METRICS", "false")
+
+    import dspy
+
+    from domain.inference.batch import BatchInference, load_program, print_summary
+    from utils.config import setup_llm
+
+    setup_llm()
+    dspy.settings.configure(disable_history=True)
+
+    if not args.program.exists():
+        sys.exit(f"Programa não encontrado: {args.program} (rode o MIPRO ou informe --program)")
+    program = load_program(args.program)
+    print(f"Programa carregado de {args.program}")
+
+    inference = BatchInference(
+        program,
+        concurrency=args.concurrency,
+        window=args.window,
+        include_text=args.include_text,
+    )
+    summary = inference.run(
+        args.input,
+        args.output,
+        resume=args.resume,
+        text_column=args.text_column,
+        id_column=args.id_column,
+        limit=args.limit,
+    )
+    print_summary(summary, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,32 @@
+import argparse
 import sys
 from pathlib import Path
-from domain.dataset.download_b2w import download_b2w_reviews
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from domain.dataset.download_b2w import B2W_REVIEWS_URL, download_b2w_reviews
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Download do dataset B2W Reviews")
+    parser.add_argument("--force", action="store_true", help="Baixa de novo mesmo se o arquivo já existir")
+    parser.add_argument("--url", default=B2W_REVIEWS_URL)
+    parser.add_argument("--output", type=Path, default=None, help="Destino (padrão: src/domain/dataset/data/b2w_reviews.csv)")
+    parser.add_argument("--sha256", default=None, help="SHA-256 esperado (padrão: variável B2W_SHA256)")
+    parser.add_argument("--convert", action="store_true", help="Gera o cache em colunas durante o download")
+    return parser.parse_args()
 
 
 def main():
-    download_b2w_reviews()
+    args = parse_args()
+    download_b2w_reviews(
+        force=args.force,
+        url=args.url,
+        output_file=args.output,
+        sha256=args.sha256,
+        convert=args.convert,
+    )
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
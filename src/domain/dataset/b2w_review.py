@@ -1,32 +1,268 @@
+from __future__ import annotations
+
 import os
-import pandas as pd
+from typing import TYPE_CHECKING
+
+import numpy as np
 from dspy import Example
-from tqdm import tqdm
 
+from domain.dataset import cache
+from domain.dataset.compact import CompactExamples, CompactSplit
 from utils.config import get_data_path
 
+if TYPE_CHECKING:
+    # pandas is only imported when the CSV is parsed; cache hits skip it entirely
+    import pandas as pd
+
+SENTIMENT_LABELS = ('negativo', 'neutro', 'positivo')
+DATASET_COLUMNS = ['review_text', 'overall_rating']
+DEFAULT_CHUNKSIZE = 10_000
+
+
+def _split_keys(row_index) -> np.ndarray:
+    """Uniform [0, 1) key per CSV row, from a SplitMix64 hash of the row index.
+
+    Rows whose key is below `train_size` go to the train split, in every
+    loading path (full read, reservoir sample or streaming).
+    """
+    x = np.asarray(row_index, dtype=np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return (x >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+
+def _iter_csv_chunks(path, chunksize: int = DEFAULT_CHUNKSIZE):
+    """Reads only the columns we use, chunk by chunk, dropping incomplete rows.
+
+    `path` may also be a binary file object (e.g. the read end of a pipe).
+    """
+    import pandas as pd
+
+    for chunk in pd.read_csv(path, usecols=DATASET_COLUMNS, chunksize=chunksize):
+        yield chunk.dropna(subset=DATASET_COLUMNS)
+
+
+def _reservoir_sample(chunks, k: int, seed: int = 42) -> pd.DataFrame:
+    """Seeded reservoir sampling (Algorithm R) over a stream of DataFrame chunks.
+
+    Only the reservoir and the current chunk are held in memory.
+    """
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    row_index, texts, ratings = [], [], []
+    seen = 0
+    for chunk in chunks:
+        chunk_index = chunk.index.tolist()
+        chunk_texts = chunk['review_text'].tolist()
+        chunk_ratings = chunk['overall_rating'].tolist()
+        n = len(chunk_texts)
+
+        fill = min(max(k - seen, 0), n)
+        row_index.extend(chunk_index[:fill])
+        texts.extend(chunk_texts[:fill])
+        ratings.extend(chunk_ratings[:fill])
+
+        if fill < n:
+            # Item i (0-based, global) replaces slot j ~ U[0, i] when j < k
+            slots = rng.integers(0, np.arange(seen + fill, seen + n) + 1)
+            for pos in np.flatnonzero(slots < k):
+                slot = slots[pos]
+                row_index[slot] = chunk_index[fill + pos]
+                texts[slot] = chunk_texts[fill + pos]
+                ratings[slot] = chunk_ratings[fill + pos]
+        seen += n
+
+    return pd.DataFrame({'review_text': texts, 'overall_rating': ratings}, index=row_index)
+
+
+def stream_b2w_examples(
+    path: str = None,
+    split: str = None,
+    train_size: float = 0.8,
+    limit: int = None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+):
+    """Yields dspy.Example objects while the CSV is still being read.
+
+    Each valid row is assigned to "train" or "test" by `_split_keys`, the same
+    rule `B2WReviews` uses, so a streamed test row is never in the train split
+    of a fully loaded dataset. With `split=None` every row is yielded.
+    """
+    labels = np.array(SENTIMENT_LABELS, dtype=object)
+    produced = 0
+    for chunk in _iter_csv_chunks(path if path else get_data_path(), chunksize):
+        is_train = _split_keys(chunk.index.to_numpy()) < train_size
+        if split == 'train':
+            chunk = chunk[is_train]
+        elif split == 'test':
+            chunk = chunk[~is_train]
+
+        sentiments = labels[B2WReviews._sentiment_codes(chunk['overall_rating'].to_numpy())]
+        for text, sentiment in zip(chunk['review_text'].tolist(), sentiments.tolist()):
+            if limit is not None and produced >= limit:
+                return
+            yield Example(text=text, sentiment=sentiment).with_inputs("text")
+            produced += 1
+
+
 class B2WReviews:
-    def __init__(self, path: str = None, sample: int = None, train_size: float = 0.8):
+    def __init__(self, path: str = None, sample: int = None, train_size: float = 0.8, use_cache: bool = True,
+                 streaming: bool = False, chunksize: int = DEFAULT_CHUNKSIZE):
         self.path = path if path else get_data_path()
         self.sample = sample
         self.train_size = train_size
+        self.use_cache = use_cache
+        self.streaming = streaming
+        self.chunksize = chunksize
+        self._df = None
+        self._arrays = None
         self._load_data()
 
+    @property
+    def df(self) -> pd.DataFrame:
+        """The labeled dataset; decoded from the cached arrays on first access."""
+        if self._df is None and self._arrays is not None:
+            self._df = self._frame_from_arrays(self._arrays)
+        return self._df
+
+    @df.setter
+    def df(self, value: pd.DataFrame) -> None:
+        self._df = value
+
     def _load_data(self) -> None:
-        """Loads the B2W reviews dataset from a CSV file."""
+        """Loads the B2W reviews dataset, preferring the preprocessed cache over the CSV."""
         if not os.path.exists(self.path):
             raise FileNotFoundError(f"The file {self.path} was not found.")
 
+        cache_file = None
+        if self.use_cache:
+            cache_file = self._cache_file()
+            arrays = cache.load_arrays(cache_file)
+            if arrays is not None:
+                self._load_from_arrays(arrays)
+                return
+
+        if self.streaming:
+            self._load_from_csv_streaming()
+        else:
+            self._load_from_csv()
+
+        if cache_file is not None:
+            self._arrays = self._to_arrays()
+            cache.save_arrays(cache_file, **self._arrays)
+
+    def _cache_file(self, csv_sha256: str = None):
+        """Cache entry for this CSV and these loading parameters."""
+        key = cache.cache_key(
+            csv_sha256 or cache.file_sha256(self.path),
+            sample=self.sample,
+            train_size=self.train_size,
+            streaming=self.streaming,
+        )
+        return cache.get_cache_dir(self.path) / f"b2w_{key}.npz"
+
+    @classmethod
+    def from_frame(cls, path: str, df: pd.DataFrame, train_size: float = 0.8,
+                   csv_sha256: str = None) -> B2WReviews:
+        """Builds the full dataset (no sampling) from an already-parsed frame of `path`.
+
+        `df` must hold the rows `_iter_csv_chunks` yields for the file (e.g. parsed
+        while it was being downloaded). The cache entry a later
+        `B2WReviews(path, train_size=train_size)` looks up is written, so the CSV
+        is not parsed again.
+        """
+        self = cls.__new__(cls)
+        self.path = path
+        self.sample = None
+        self.train_size = train_size
+        self.use_cache = True
+        self.streaming = False
+        self.chunksize = DEFAULT_CHUNKSIZE
+        self._df = df
+        self._arrays = None
+        self._label_and_split()
+        self._arrays = self._to_arrays()
+        cache.save_arrays(self._cache_file(csv_sha256), **self._arrays)
+        return self
+
+    def _load_from_csv(self) -> None:
+        """Parses the CSV, labels every review and computes the train/test split."""
+        import pandas as pd
+
         self.df = pd.read_csv(self.path)
 
         if self.sample:
             self.df = self.df.sample(n=self.sample, random_state=42)
 
-        self.df = self.df.dropna(subset=['review_text', 'overall_rating'])
-        self.df = self.df[['review_text', 'overall_rating']]
-        self.df['sentiment'] = self.df['overall_rating'].apply(self._classify_sentiment)
+        self.df = self.df.dropna(subset=DATASET_COLUMNS)
+        self.df = self.df[DATASET_COLUMNS]
+        self._label_and_split()
+
+    def _load_from_csv_streaming(self) -> None:
+        """Reads the CSV in chunks, keeping at most `sample` rows via reservoir sampling.
+
+        Unlike `_load_from_csv`, the sample is drawn after incomplete rows are
+        dropped, so `sample` rows are always returned when available.
+        """
+        chunks = _iter_csv_chunks(self.path, self.chunksize)
+        if self.sample:
+            self.df = _reservoir_sample(chunks, self.sample)
+        else:
+            import pandas as pd
+
+            self.df = pd.concat(list(chunks))
+        self._label_and_split()
+
+    def _label_and_split(self) -> None:
+        """Labels the reviews and computes the train/test split positions."""
+        self.df['sentiment'] = self._classify_sentiment_array(self.df['overall_rating'].to_numpy())
         self.df = self.df.rename(columns={'review_text': 'text'})
 
+        # Membership by hashed CSV row index (see `_split_keys`); train rows are
+        # ordered by their key, which doubles as a deterministic shuffle
+        keys = _split_keys(self.df.index.to_numpy())
+        is_train = keys < self.train_size
+        train_pos = np.flatnonzero(is_train)
+        self._train_pos = train_pos[np.argsort(keys[train_pos], kind="stable")]
+        self._test_pos = np.flatnonzero(~is_train)
+
+    def _to_arrays(self) -> dict[str, np.ndarray]:
+        """Serializes the labeled dataset and its split into column arrays."""
+        text_buffer, text_offsets = cache.encode_strings(self.df['text'])
+        return {
+            'row_index': self.df.index.to_numpy(dtype=np.int64),
+            'text_buffer': text_buffer,
+            'text_offsets': text_offsets,
+            'overall_rating': self.df['overall_rating'].to_numpy(dtype=np.float64),
+            'sentiment_code': self._sentiment_codes(self.df['overall_rating'].to_numpy()),
+            'train_pos': self._train_pos.astype(np.int64),
+            'test_pos': self._test_pos.astype(np.int64),
+        }
+
+    def _load_from_arrays(self, arrays: dict[str, np.ndarray]) -> None:
+        """Restores the split from cached column arrays; the DataFrame is built lazily."""
+        self._arrays = arrays
+        self._df = None
+        self._train_pos = arrays['train_pos']
+        self._test_pos = arrays['test_pos']
+
+    @staticmethod
+    def _frame_from_arrays(arrays: dict[str, np.ndarray]) -> pd.DataFrame:
+        """Rebuilds the labeled DataFrame from cached column arrays."""
+        import pandas as pd
+
+        labels = np.array(SENTIMENT_LABELS, dtype=object)
+        return pd.DataFrame(
+            {
+                'text': cache.decode_strings(arrays['text_buffer'], arrays['text_offsets']),
+                'overall_rating': arrays['overall_rating'],
+                'sentiment': labels[arrays['sentiment_code']],
+            },
+            index=arrays['row_index'],
+        )
+
     @staticmethod
     def _classify_sentiment(rating: float) -> str:
         """Classifies sentiment based on the overall rating."""
@@ -36,21 +272,53 @@ class B2WReviews:
             return 'negativo'
         return 'neutro'
 
+    @staticmethod
+    def _sentiment_codes(ratings: np.ndarray) -> np.ndarray:
+        """Maps ratings to indexes of SENTIMENT_LABELS (0=negativo, 1=neutro, 2=positivo)."""
+        return (np.sign(np.asarray(ratings, dtype=np.float64) - 3) + 1).astype(np.int8)
+
+    @classmethod
+    def _classify_sentiment_array(cls, ratings: np.ndarray) -> np.ndarray:
+        """Vectorized version of `_classify_sentiment`."""
+        return np.array(SENTIMENT_LABELS, dtype=object)[cls._sentiment_codes(ratings)]
+
     def _format_for_dspy(self, df: pd.DataFrame) -> list[Example]:
         """Formats a DataFrame into a list of dspy.Example objects."""
-        formatted_examples = []
-        for _, row in tqdm(df.iterrows(), total=df.shape[0], desc="Formatting examples"):
-            example = Example(
-                text=row['text'],
-                sentiment=row['sentiment']
-            ).with_inputs("text")
-            formatted_examples.append(example)
-        return formatted_examples
+        return [
+            Example(text=text, sentiment=sentiment).with_inputs("text")
+            for text, sentiment in zip(df['text'].tolist(), df['sentiment'].tolist())
+        ]
+
+    def iter_examples(self, split: str = None, limit: int = None):
+        """Streams examples straight from the CSV; see `stream_b2w_examples`."""
+        return stream_b2w_examples(
+            self.path,
+            split=split,
+            train_size=self.train_size,
+            limit=limit,
+            chunksize=self.chunksize,
+        )
+
+    def to_compact(self) -> CompactExamples:
+        """Returns the dataset as array-backed storage, reusing cached arrays when loaded from cache."""
+        if self._arrays is not None:
+            return CompactExamples(
+                self._arrays['text_buffer'],
+                self._arrays['text_offsets'],
+                self._arrays['sentiment_code'],
+                SENTIMENT_LABELS,
+            )
+        return CompactExamples.from_columns(self.df['text'], self.df['sentiment'], SENTIMENT_LABELS)
+
+    def get_compact_split(self) -> tuple[CompactSplit, CompactSplit]:
+        """Same split as `get_train_test_split`, as lazy index-backed views."""
+        store = self.to_compact()
+        return store.view(self._train_pos), store.view(self._test_pos)
 
     def get_train_test_split(self) -> tuple[list[Example], list[Example]]:
         """Splits the data into training and testing sets and formats them for dspy."""
-        train_df = self.df.sample(frac=self.train_size, random_state=42)
-        test_df = self.df.drop(train_df.index)
+        train_df = self.df.iloc[self._train_pos]
+        test_df = self.df.iloc[self._test_pos]
 
         train_set = self._format_for_dspy(train_df)
         test_set = self._format_for_dspy(test_df)
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+CACHE_VERSION = 2
+_HASH_CHUNK_SIZE = 1 << 20
+
+
+def get_cache_dir(csv_path: str) -> Path:
+    """Returns the cache directory that lives next to the dataset CSV."""
+    cache_dir = Path(csv_path).parent / "cache"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+def _read_fingerprints(memo_file: Path) -> dict:
+    if memo_file.exists():
+        try:
+            return json.loads(memo_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+    return {}
+
+
+def remember_sha256(path: str, sha: str) -> None:
+    """Stores an already-known digest (e.g. computed while downloading) in the fingerprint memo."""
+    stat = os.stat(path)
+    memo_file = get_cache_dir(path) / "fingerprints.json"
+    memo = _read_fingerprints(memo_file)
+    memo[os.path.abspath(path)] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha}
+    tmp_file = memo_file.with_suffix(".tmp")
+    tmp_file.write_text(json.dumps(memo), encoding="utf-8")
+    os.replace(tmp_file, memo_file)
+
+
+def file_sha256(path: str) -> str:
+    """Computes the SHA-256 of a file's content, reading it in fixed-size chunks.
+
+    The digest is memoized in the cache directory keyed on (size, mtime), so an
+    unchanged CSV is not re-hashed on every start.
+    """
+    stat = os.stat(path)
+    entry = _read_fingerprints(get_cache_dir(path) / "fingerprints.json").get(os.path.abspath(path))
+    if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+        return entry["sha256"]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    sha = digest.hexdigest()
+    remember_sha256(path, sha)
+    return sha
+
+
+def cache_key(csv_sha256: str, **params) -> str:
+    """Builds the cache key from the CSV fingerprint and the loading parameters."""
+    payload = json.dumps(
+        {"version": CACHE_VERSION, "csv": csv_sha256, **params},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def encode_strings(values) -> tuple[np.ndarray, np.ndarray]:
+    """Packs a sequence of strings into one UTF-8 buffer plus an offsets array."""
+    encoded = [str(v).encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    buffer = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return buffer, offsets
+
+
+def decode_strings(buffer: np.ndarray, offsets: np.ndarray) -> list[str]:
+    """Unpacks strings previously packed with `encode_strings`."""
+    raw = buffer.tobytes()
+    bounds = offsets.tolist()
+    return [raw[start:end].decode("utf-8") for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def save_arrays(path: Path, **arrays) -> None:
+    """Atomically writes the column arrays to an uncompressed `.npz` file."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_arrays(path: Path) -> dict[str, np.ndarray] | None:
+    """Loads the column arrays from a cache file, or None if it is missing or corrupt."""
+    if not path.exists():
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            return {name: data[name] for name in data.files}
+    except (OSError, ValueError, KeyError):
+        return None
@@ -0,0 +1,85 @@
+import random
+from collections.abc import Sequence
+
+import numpy as np
+from dspy import Example
+
+from domain.dataset import cache
+
+
+class CompactExamples:
+    """Array-backed storage for (text, sentiment) pairs.
+
+    All texts live in one contiguous UTF-8 buffer addressed by an offsets
+    array, and sentiments are int8 codes into `labels`. Nothing is decoded
+    until an example is actually requested.
+    """
+
+    def __init__(self, text_buffer: np.ndarray, text_offsets: np.ndarray, sentiment_codes: np.ndarray, labels: tuple[str, ...]):
+        self.text_buffer = text_buffer
+        self.text_offsets = text_offsets
+        self.sentiment_codes = sentiment_codes
+        self.labels = tuple(labels)
+
+    @classmethod
+    def from_columns(cls, texts, sentiments, labels: tuple[str, ...]) -> "CompactExamples":
+        """Builds the storage from plain text and sentiment label columns."""
+        text_buffer, text_offsets = cache.encode_strings(texts)
+        lookup = {label: code for code, label in enumerate(labels)}
+        codes = np.fromiter((lookup[s] for s in sentiments), dtype=np.int8, count=len(text_offsets) - 1)
+        return cls(text_buffer, text_offsets, codes, labels)
+
+    def __len__(self) -> int:
+        return len(self.sentiment_codes)
+
+    def text(self, i: int) -> str:
+        start, end = self.text_offsets[i], self.text_offsets[i + 1]
+        return self.text_buffer[start:end].tobytes().decode("utf-8")
+
+    def sentiment(self, i: int) -> str:
+        return self.labels[self.sentiment_codes[i]]
+
+    def example(self, i: int) -> Example:
+        """Materializes a single dspy.Example on demand."""
+        return Example(text=self.text(i), sentiment=self.sentiment(i)).with_inputs("text")
+
+    def view(self, indices) -> "CompactSplit":
+        return CompactSplit(self, np.asarray(indices, dtype=np.int64))
+
+    @property
+    def nbytes(self) -> int:
+        return self.text_buffer.nbytes + self.text_offsets.nbytes + self.sentiment_codes.nbytes
+
+
+class CompactSplit(Sequence):
+    """A read-only sequence of dspy.Example backed by an index array into CompactExamples.
+
+    Slicing and shuffling only create new index arrays; examples are built
+    when accessed and are not retained, so the split can be handed to
+    Evaluate, BootstrapFewShot and MIPROv2 in place of a list.
+    """
+
+    def __init__(self, store: CompactExamples, indices: np.ndarray):
+        self.store = store
+        self.indices = indices
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return CompactSplit(self.store, self.indices[item])
+        return self.store.example(int(self.indices[item]))
+
+    def __iter__(self):
+        for i in self.indices.tolist():
+            yield self.store.example(i)
+
+    def shuffled(self, seed: int = 42) -> "CompactSplit":
+        """Returns a shuffled view, matching `random.seed(seed); random.shuffle(list)`."""
+        order = list(range(len(self.indices)))
+        random.Random(seed).shuffle(order)
+        return CompactSplit(self.store, self.indices[order])
+
+    def sentiment_codes(self) -> np.ndarray:
+        return self.store.sentiment_codes[self.indices]
@@ -0,0 +1,52 @@
+import re
+import unicodedata
+
+from dspy import Example
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]", re.UNICODE)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Normalizes a review for duplicate detection: case, accents, punctuation and whitespace."""
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = _PUNCTUATION_RE.sub(" ", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+class DedupIndex:
+    """Hash index from each normalized text to all of its occurrences in a dataset.
+
+    `unique_examples()` returns one representative per distinct text (its first
+    occurrence), and `fan_out()` copies the per-unique results back to every
+    occurrence, so metrics are still computed over the full dataset.
+    """
+
+    def __init__(self, examples: list[Example]):
+        self.examples = examples
+        self.groups: dict[str, list[int]] = {}
+        for i, example in enumerate(examples):
+            self.groups.setdefault(normalize_text(example.text), []).append(i)
+        self._keys = list(self.groups)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def unique_examples(self) -> list[Example]:
+        return [self.examples[self.groups[key][0]] for key in self._keys]
+
+    def fan_out(self, unique_results: list) -> list:
+        """Maps results aligned with `unique_examples()` back to every occurrence."""
+        results = [None] * len(self.examples)
+        for key, result in zip(self._keys, unique_results):
+            for i in self.groups[key]:
+                results[i] = result
+        return results
+
+    @property
+    def saved_calls(self) -> int:
+        return len(self.examples) - len(self._keys)
+
+    def summary(self) -> str:
+        return f"{len(self._keys)} textos únicos em {len(self.examples)} exemplos ({self.saved_calls} chamadas evitadas)"
@@ -1,34 +1,195 @@
-import requests
+import hashlib
+import os
+import threading
+import time
 from pathlib import Path
 
+import requests
+
 
 B2W_REVIEWS_URL = (
     "https://raw.githubusercontent.com/b2w-digital/b2w-reviews01/main/B2W-Reviews01.csv"
 )
 
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
 
-def download_b2w_reviews(force: bool = False) -> Path:
+class _StreamingConverter:
+    """
+    Faz o parse do CSV em uma thread enquanto o download acontece.
+
+    Os bytes baixados são escritos em um pipe lido pelo `pd.read_csv` em
+    blocos (o mesmo `_iter_csv_chunks` do `B2WReviews`). Cada bloco já
+    limpo (só as colunas usadas, com o índice da linha original) é acrescentado
+    a `path` assim que fica pronto, então a memória do parse não cresce com o
+    dataset; o cache em colunas é montado depois a partir desse arquivo.
+    """
+
+    def __init__(self, path: Path):
+        from domain.dataset.b2w_review import _iter_csv_chunks
+
+        self.path = Path(path)
+        read_fd, write_fd = os.pipe()
+        self._writer = os.fdopen(write_fd, "wb")
+        self._reader = os.fdopen(read_fd, "rb")
+        self._written = False
+        self._error = None
+        self._thread = threading.Thread(target=self._parse, args=(_iter_csv_chunks,), daemon=True)
+        self._thread.start()
+
+    def _parse(self, iter_csv_chunks) -> None:
+        try:
+            for chunk in iter_csv_chunks(self._reader):
+                first = not self._written
+                chunk.to_csv(self.path, mode="w" if first else "a", header=first, index_label="row_index")
+                self._written = True
+        except Exception as e:
+            self._error = e
+        finally:
+            self._reader.close()
+
+    def feed(self, data: bytes) -> None:
+        if self._error is None:
+            try:
+                self._writer.write(data)
+            except BrokenPipeError:
+                pass  # o parser parou; o erro sobe em `finish`
+
+    def finish(self) -> Path | None:
+        """Fecha o pipe e retorna o arquivo com as linhas válidas (None se não houver nenhuma)."""
+        self.abort()
+        if self._error is not None:
+            raise self._error
+        return self.path if self._written else None
+
+    def abort(self) -> None:
+        try:
+            self._writer.close()
+        except BrokenPipeError:
+            pass
+        self._thread.join()
+
+
+def _open_stream(url: str, offset: int, timeout: float) -> requests.Response:
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    response = requests.get(url, headers=headers, stream=True, timeout=timeout)
+    if response.status_code == 416:
+        # O .part não corresponde ao arquivo remoto (ou já está completo): recomeça
+        response.close()
+        response = requests.get(url, stream=True, timeout=timeout)
+    response.raise_for_status()
+    return response
+
+
+def download_b2w_reviews(
+    force: bool = False,
+    url: str = B2W_REVIEWS_URL,
+    output_file: Path = None,
+    sha256: str = None,
+    convert: bool = False,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    max_retries: int = 5,
+    timeout: float = 60,
+) -> Path:
     """
     Faz o download do dataset B2W Reviews e salva localmente.
     Retorna o caminho do arquivo.
-    """
 
-    data_dir = Path(__file__).parent / "data"
-    data_dir.mkdir(parents=True, exist_ok=True)
+    O arquivo é baixado em blocos para `<arquivo>.part`; se a conexão cair, o
+    download continua de onde parou (HTTP Range), inclusive em uma nova
+    execução. O SHA-256 é calculado durante o download e conferido com
+    `sha256` (ou B2W_SHA256) antes do rename atômico para o destino.
+    Com `convert=True` o CSV é convertido para o cache em colunas (`.npz`)
+    enquanto é baixado.
+    """
 
-    output_file = data_dir / "b2w_reviews.csv"
+    if output_file is None:
+        output_file = Path(__file__).parent / "data" / "b2w_reviews.csv"
+    output_file = Path(output_file)
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    expected = (sha256 or os.getenv("B2W_SHA256") or "").lower() or None
 
     if output_file.exists() and not force:
         print("Dataset B2W Reviews já existe. Pulando download.")
         return output_file
 
+    part_file = output_file.with_name(output_file.name + ".part")
+    if force and part_file.exists():
+        part_file.unlink()
+
     print("Baixando dataset B2W Reviews...")
 
-    response = requests.get(B2W_REVIEWS_URL, timeout=60)
-    response.raise_for_status()
+    parsed_file = output_file.with_name(output_file.name + ".parsed.tmp")
+    converter = _StreamingConverter(parsed_file) if convert else None
+    digest = hashlib.sha256()
+    offset = 0
+    if part_file.exists():
+        # Bytes já baixados entram no hash (e no parser) antes de continuar
+        with open(part_file, "rb") as f:
+            for block in iter(lambda: f.read(chunk_size), b""):
+                digest.update(block)
+                if converter:
+                    converter.feed(block)
+                offset += len(block)
+        print(f"Retomando download a partir de {offset} bytes...")
 
-    output_file.write_bytes(response.content)
+    try:
+        attempt = 0
+        while True:
+            try:
+                response = _open_stream(url, offset, timeout)
+                with response:
+                    if offset and response.status_code != 206:
+                        # Servidor ignorou o Range: descarta o parcial e recomeça
+                        print("Servidor não aceita continuar o download; recomeçando do início.")
+                        offset, digest = 0, hashlib.sha256()
+                        if converter:
+                            converter.abort()
+                            converter = _StreamingConverter(parsed_file)
+                    with open(part_file, "ab" if offset else "wb") as f:
+                        for block in response.iter_content(chunk_size=chunk_size):
+                            f.write(block)
+                            digest.update(block)
+                            if converter:
+                                converter.feed(block)
+                            offset += len(block)
+                break
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                attempt += 1
+                if attempt > max_retries:
+                    raise
+                delay = min(2 ** attempt, 30)
+                print(f"Conexão interrompida em {offset} bytes ({type(e).__name__}); retomando em {delay}s...")
+                time.sleep(delay)
 
+        actual = digest.hexdigest()
+        if expected and actual != expected:
+            part_file.unlink()
+            raise ValueError(f"SHA-256 inválido para {url}: esperado {expected}, obtido {actual}")
+        print(f"SHA-256: {actual}")
+
+        parsed = converter.finish() if converter else None
+        converter = None
+    finally:
+        if converter:
+            converter.abort()
+            parsed_file.unlink(missing_ok=True)
+
+    os.replace(part_file, output_file)
     print(f"Dataset salvo em: {output_file}")
-    
-    return output_file
\ No newline at end of file
+
+    from domain.dataset import cache
+
+    # O hash já é conhecido: o B2WReviews não precisa reler o CSV para calculá-lo
+    cache.remember_sha256(str(output_file), actual)
+    if parsed is not None:
+        import pandas as pd
+
+        from domain.dataset.b2w_review import B2WReviews
+
+        frame = pd.read_csv(parsed, index_col="row_index")
+        parsed.unlink()
+        B2WReviews.from_frame(str(output_file), frame, csv_sha256=actual)
+        print(f"Cache em colunas gerado em: {cache.get_cache_dir(str(output_file))}")
+
+    return output_file
@@ -0,0 +1,295 @@
+import math
+import os
+from dataclasses import dataclass, field
+
+# Constantes do MIPROv2 (dspy.teleprompt.mipro_optimizer_v2)
+MIN_MINIBATCH_SIZE = 50
+VIEW_DATA_BATCH_SIZE = 10
+MAX_SUMMARY_CALLS = 10
+# Chamadas por instrução candidata e predictor: descrição do programa, do módulo e a proposta
+PROPOSER_CALLS_PER_CANDIDATE = 3
+
+# Perfis do mais completo ao mais enxuto: (candidatos, valset, minibatch, trainset máximo).
+# O segundo equivale ao auto="light" do MIPROv2 e é o padrão quando não há orçamento.
+DEFAULT_PROFILE = 1
+MIPRO_PROFILES = (
+    (12, 300, 35, 500),
+    (6, 100, 35, 200),
+    (6, 60, 25, 100),
+    (4, 40, 20, 60),
+    (3, 25, 15, 40),
+    (2, 15, 10, 20),
+)
+
+# Fases registradas em `metrics` durante cada fluxo
+MIPRO_PHASES = ("mipro_bootstrap", "mipro_propose", "mipro_trials", "mipro_evaluation")
+BOOTSTRAP_PHASES = ("bootstrap_compile", "evaluation_optimized")
+
+
+def quota_requests_per_second() -> float:
+    """
+    Vazão permitida pela cota configurada (DSPY_API_MAX_REQ / DSPY_API_WINDOW).
+    Com DSPY_LM_POOL as cotas dos backends remotos se somam; em modo local não há limite.
+    """
+    from utils.config import BACKENDS
+
+    def rate(prefix: str) -> float:
+        max_req = float(os.getenv(prefix + "MAX_REQ", os.getenv("DSPY_API_MAX_REQ", "1")))
+        window = float(os.getenv(prefix + "WINDOW", os.getenv("DSPY_API_WINDOW", "30")))
+        return max_req / window
+
+    pool = [name.strip().lower() for name in os.getenv("DSPY_LM_POOL", "").split(",") if name.strip()]
+    if pool:
+        remote = [name for name in pool if BACKENDS.get(name, (None, True))[1]]
+        if len(remote) < len(pool):
+            return math.inf
+        return sum(rate(f"DSPY_POOL_{name.upper()}_") for name in remote)
+    if (os.getenv("DSPY_AI_LOCAL_MODE") or "").lower() == "true":
+        return math.inf
+    return rate("DSPY_API_")
+
+
+@dataclass
+class Budget:
+    """
+    Orçamento de uma execução: número máximo de chamadas ao LM e/ou tempo.
+
+    O tempo vira chamadas pela vazão efetiva: o menor entre a cota
+    (`requests_per_second`) e o que `num_threads` threads conseguem com
+    `latency` segundos por chamada.
+    """
+
+    max_calls: int = None
+    max_seconds: float = None
+    requests_per_second: float = math.inf
+    latency: float = 1.0
+    num_threads: int = 1
+
+    @property
+    def throughput(self) -> float:
+        return min(self.requests_per_second, self.num_threads / self.latency)
+
+    @property
+    def limited(self) -> bool:
+        return self.max_calls is not None or self.max_seconds is not None
+
+    @property
+    def calls(self) -> float:
+        """Chamadas que cabem no orçamento (infinito se nenhum limite foi dado)."""
+        limits = [math.inf]
+        if self.max_calls is not None:
+            limits.append(self.max_calls)
+        if self.max_seconds is not None:
+            limits.append(self.max_seconds * self.throughput)
+        return min(limits)
+
+    def seconds_for(self, calls: int) -> float:
+        return calls / self.throughput
+
+
+def budget_from_env() -> Budget:
+    """
+    DSPY_BUDGET_REQUESTS e DSPY_BUDGET_MINUTES limitam a execução;
+    DSPY_PLAN_LATENCY é a latência média estimada por chamada (segundos).
+    Sem DSPY_NUM_THREADS, usa threads suficientes para saturar a cota
+    (até DSPY_API_MAX_CONCURRENCY).
+    """
+    requests_per_second = quota_requests_per_second()
+    latency = float(os.getenv("DSPY_PLAN_LATENCY", "1.0"))
+    if os.getenv("DSPY_NUM_THREADS"):
+        num_threads = int(os.getenv("DSPY_NUM_THREADS"))
+    else:
+        max_concurrency = int(os.getenv("DSPY_API_MAX_CONCURRENCY", "8"))
+        wanted = requests_per_second * latency if math.isfinite(requests_per_second) else max_concurrency
+        num_threads = max(1, min(max_concurrency, math.ceil(wanted)))
+    max_calls = os.getenv("DSPY_BUDGET_REQUESTS")
+    max_minutes = os.getenv("DSPY_BUDGET_MINUTES")
+    return Budget(
+        max_calls=int(max_calls) if max_calls else None,
+        max_seconds=float(max_minutes) * 60 if max_minutes else None,
+        requests_per_second=requests_per_second,
+        latency=latency,
+        num_threads=num_threads,
+    )
+
+
+def num_trials_for(num_candidates: int, num_predictors: int = 1, zeroshot: bool = False) -> int:
+    """Mesma regra do MIPROv2: max(2 * variáveis * log2(N), 1.5 * N)."""
+    num_vars = num_predictors if zeroshot else 2 * num_predictors
+    return int(max(2 * num_vars * math.log2(num_candidates), 1.5 * num_candidates))
+
+
+class BudgetExceededError(RuntimeError):
+    """Nem o plano mais enxuto cabe no orçamento e a execução não foi autorizada mesmo assim."""
+
+
+@dataclass
+class MiproPlan:
+    """Parâmetros de uma execução do MIPROv2 e as chamadas previstas por fase."""
+
+    num_candidates: int
+    num_instruct_candidates: int
+    num_trials: int
+    minibatch: bool
+    minibatch_size: int
+    minibatch_full_eval_steps: int
+    train_size: int
+    val_size: int
+    test_size: int
+    max_bootstrapped_demos: int
+    max_labeled_demos: int
+    num_threads: int
+    predicted_calls: dict = field(default_factory=dict)
+    fits_budget: bool = True
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.predicted_calls.values())
+
+    def compile_settings(self) -> dict:
+        """Configuração que identifica a execução (usada na chave do checkpoint)."""
+        return {
+            "num_candidates": self.num_candidates,
+            "num_instruct_candidates": self.num_instruct_candidates,
+            "num_trials": self.num_trials,
+            "minibatch": self.minibatch,
+            "minibatch_size": self.minibatch_size,
+            "train_size": self.train_size,
+            "val_size": self.val_size,
+            "max_bootstrapped_demos": self.max_bootstrapped_demos,
+            "max_labeled_demos": self.max_labeled_demos,
+        }
+
+
+def predict_mipro_calls(num_candidates, num_instruct_candidates, num_trials, minibatch, minibatch_size,
+                        minibatch_full_eval_steps, train_size, val_size, test_size, max_bootstrapped_demos,
+                        num_predictors: int = 1, accuracy: float = 0.7) -> dict[str, int]:
+    """
+    Chamadas ao LM previstas em cada fase do MIPROv2 (sem contar hits de cache).
+
+    - bootstrap: `num_candidates - 2` conjuntos de demos (os dois primeiros não
+      chamam o LM); o primeiro busca `max_bootstrapped_demos` demos e os demais
+      um número sorteado entre 1 e o máximo, com `accuracy` de acerto;
+    - propose: resumo do dataset (um lote de 10 exemplos por chamada) e 3
+      chamadas por instrução candidata;
+    - trials: avaliação do programa inicial no valset, um minibatch por trial e
+      uma avaliação completa a cada `minibatch_full_eval_steps` trials;
+    - evaluation: o testset final.
+    """
+    bootstrap_sets = max(num_candidates - 2, 0)
+    if bootstrap_sets and max_bootstrapped_demos:
+        demos = max_bootstrapped_demos + (bootstrap_sets - 1) * (1 + max_bootstrapped_demos) / 2
+        bootstrap = min(math.ceil(demos / accuracy), bootstrap_sets * train_size)
+    else:
+        bootstrap = 0
+
+    summary = min(math.ceil(train_size / VIEW_DATA_BATCH_SIZE), MAX_SUMMARY_CALLS) + 1
+    propose = summary + PROPOSER_CALLS_PER_CANDIDATE * num_instruct_candidates * num_predictors
+
+    if minibatch:
+        full_evals = math.ceil(num_trials / minibatch_full_eval_steps)
+        trials = val_size + minibatch_size * num_trials + val_size * full_evals
+    else:
+        trials = val_size * (num_trials + 1)
+
+    return {
+        "mipro_bootstrap": bootstrap * num_predictors,
+        "mipro_propose": propose,
+        "mipro_trials": trials * num_predictors,
+        "mipro_evaluation": test_size * num_predictors,
+    }
+
+
+def plan_mipro(num_train: int, num_test: int, budget: Budget, num_predictors: int = 1,
+               max_bootstrapped_demos: int = 2, max_labeled_demos: int = 2,
+               minibatch_full_eval_steps: int = 5, accuracy: float = 0.7) -> MiproPlan:
+    """
+    Escolhe o perfil mais completo de `MIPRO_PROFILES` cuja previsão de
+    chamadas cabe no orçamento (sem orçamento, o equivalente ao auto="light").
+    O valset sai do trainset (no máximo 80%, como no MIPROv2). Se nem o perfil
+    mais enxuto couber, o testset é reduzido e o plano é marcado com
+    `fits_budget=False` quando ainda assim não couber.
+    """
+    zeroshot = max_bootstrapped_demos == 0 and max_labeled_demos == 0
+    available = budget.calls
+
+    def build(profile, test_size):
+        num_candidates, val_target, minibatch_target, train_target = profile
+        val_size = max(1, min(val_target, int(num_train * 0.8)))
+        train_size = max(1, min(train_target, num_train - val_size))
+        minibatch = val_size > MIN_MINIBATCH_SIZE
+        num_instruct = num_candidates if zeroshot else max(num_candidates // 2, 1)
+        settings = dict(
+            num_candidates=num_candidates,
+            num_instruct_candidates=num_instruct,
+            num_trials=num_trials_for(num_candidates, num_predictors, zeroshot),
+            minibatch=minibatch,
+            minibatch_size=min(minibatch_target, val_size),
+            minibatch_full_eval_steps=minibatch_full_eval_steps,
+            train_size=train_size,
+            val_size=val_size,
+            test_size=test_size,
+            max_bootstrapped_demos=max_bootstrapped_demos,
+        )
+        predicted = predict_mipro_calls(**settings, num_predictors=num_predictors, accuracy=accuracy)
+        return MiproPlan(
+            **settings,
+            max_labeled_demos=max_labeled_demos,
+            num_threads=budget.num_threads,
+            predicted_calls=predicted,
+        )
+
+    profiles = MIPRO_PROFILES if budget.limited else MIPRO_PROFILES[DEFAULT_PROFILE:]
+    for profile in profiles:
+        plan = build(profile, num_test)
+        if plan.total_calls <= available:
+            return plan
+
+    # Perfil mais enxuto: o que sobrar do orçamento vai para o testset
+    plan = build(MIPRO_PROFILES[-1], 0)
+    remaining = available - plan.total_calls
+    test_size = num_test if math.isinf(remaining) else max(0, min(num_test, int(remaining // num_predictors)))
+    plan = build(MIPRO_PROFILES[-1], max(test_size, 1))
+    plan.fits_budget = plan.total_calls <= available
+    return plan
+
+
+def predict_bootstrap_calls(train_size: int, eval_size: int, max_bootstrapped_demos: int = 4,
+                            num_predictors: int = 1, accuracy: float = 0.7) -> dict[str, int]:
+    """BootstrapFewShot percorre o trainset até juntar as demos; depois o trainset é avaliado."""
+    compile_calls = min(math.ceil(max_bootstrapped_demos / accuracy), train_size)
+    return {
+        "bootstrap_compile": compile_calls * num_predictors,
+        "evaluation_optimized": eval_size * num_predictors,
+    }
+
+
+def actual_calls(phases) -> dict:
+    """Chamadas feitas ao LM em cada fase (sem hits de cache), segundo `metrics`; None sem instrumentação."""
+    from utils.instrumentation import metrics, metrics_enabled
+
+    if not metrics_enabled():
+        return {phase: None for phase in phases}
+    actual = {}
+    for phase in phases:
+        summary = metrics.summary(phase)
+        actual[phase] = summary["calls"] - summary["cache_hits"]
+    return actual
+
+
+def report(predicted: dict, actual: dict, budget: Budget = None) -> None:
+    """Imprime chamadas previstas x realizadas por fase."""
+    print(f"{'fase':<22}{'previstas':>10}{'realizadas':>12}{'diferença':>12}")
+    for phase, expected in predicted.items():
+        done = actual.get(phase)
+        if done is None:
+            print(f"{phase:<22}{expected:>10}{'-':>12}{'-':>12}")
+        else:
+            print(f"{phase:<22}{expected:>10}{done:>12}{done - expected:>+12}")
+    total_expected = sum(predicted.values())
+    done_values = [v for v in actual.values() if v is not None]
+    total_done = sum(done_values) if done_values else None
+    print(f"{'total':<22}{total_expected:>10}{total_done if total_done is not None else '-':>12}")
+    if budget is not None and math.isfinite(budget.throughput):
+        print(f"Tempo previsto: {budget.seconds_for(total_expected) / 60:.1f} min "
+              f"({budget.throughput:.2f} chamadas/s, {budget.num_threads} threads)")
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+
+import dspy
+
+from domain.dataset.dedup import normalize_text
+from domain.evaluation.logger import RESULTS_DIR
+from domain.evaluation.score_store import ScoreStore, get_score_store, memoized_predictors
+from domain.module.sentiment import prediction_error
+
+CHECKPOINT_DIR = RESULTS_DIR / "checkpoints"
+
+
+def example_id(example, normalize: bool = True) -> str:
+    """Id estável de um exemplo: hash do texto (normalizado) + rótulo esperado."""
+    text = normalize_text(example.text) if normalize else example.text
+    return hashlib.sha256(f"{text}\x1f{example.sentiment}".encode("utf-8")).hexdigest()[:16]
+
+
+def program_fingerprint(program) -> str:
+    """Hash do estado do programa (instruções + demos), do pré-processamento e do modelo configurado."""
+    state = {
+        "program": program.dump_state(),
+        "model": getattr(dspy.settings.lm, "model", None),
+    }
+    for attribute in ("text_budget", "demo_retriever"):
+        component = getattr(program, attribute, None)
+        if component is not None:
+            # Orçamento e demos recuperadas mudam o prompt (e a predição); sem eles o fingerprint não muda
+            state[attribute] = repr(component)
+    payload = json.dumps(state, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class EvaluationEngine:
+    """
+    Avaliação paralela e incremental.
+
+    Cada exemplo concluído é gravado imediatamente no `ScoreStore`, com a
+    chave (fingerprint do programa, id do exemplo); predições de fallback
+    (com `error`, ver `fallback_prediction`) não são gravadas. Reavaliar o mesmo
+    programa (em qualquer fase, ou depois de uma interrupção) só chama o LM
+    para os exemplos ainda não vistos; com `reuse_predictors`, um programa
+    que difere só em alguns predictors reaproveita as saídas dos demais.
+    As threads disputam o rate limiter instalado no LM, então `num_threads`
+    só aumenta a vazão até o limite da cota. Exemplos com o mesmo id (texto
+    normalizado + rótulo) são avaliados uma vez.
+    """
+
+    def __init__(self, program, metric, store: ScoreStore = None, num_threads: int = 1, dedup: bool = True,
+                 reuse_predictors: bool = True, name: str = "evaluation"):
+        self.program = program
+        self.metric = metric
+        self.store = store if store is not None else get_score_store()
+        self.num_threads = num_threads
+        self.dedup = dedup
+        self.reuse_predictors = reuse_predictors
+        self.name = name
+
+    def _evaluate_one(self, fingerprint: str, record_id: str, example) -> dict:
+        start = time.perf_counter()
+        prediction = self.program(**example.inputs())
+        latency = time.perf_counter() - start
+        record = {
+            "id": record_id,
+            "prediction": prediction.toDict(),
+            "score": float(self.metric(example, prediction)),
+            "latency": round(latency, 4),
+        }
+        # Predição de fallback (LM falhou): entra no resultado desta execução,
+        # mas não é gravada, para a próxima execução tentar de novo
+        if prediction_error(prediction) is None:
+            self.store.add_result(fingerprint, record)
+        return record
+
+    def run(self, dataset, on_record=None) -> list[dict]:
+        """Avalia o dataset e retorna os registros alinhados com os exemplos."""
+        dataset = list(dataset)
+        ids = [example_id(example, self.dedup) for example in dataset]
+        fingerprint = program_fingerprint(self.program)
+        records = self.store.get_results(fingerprint, ids)
+
+        pending = {}
+        for record_id, example in zip(ids, dataset):
+            if record_id in records:
+                # A predição gravada é pontuada de novo com a métrica atual (sem chamar o LM)
+                record = records[record_id]
+                record["score"] = float(self.metric(example, dspy.Prediction(**record["prediction"])))
+            elif record_id not in pending:
+                pending[record_id] = example
+
+        print(f"{self.name} (programa {fingerprint[:12]}): {len(records)} exemplos já avaliados, "
+              f"{len(pending)} pendentes ({self.num_threads} threads)")
+
+        reuse = memoized_predictors(self.program, self.store) if self.reuse_predictors else nullcontext()
+        with reuse, ThreadPoolExecutor(max_workers=self.num_threads) as pool:
+            futures = [
+                pool.submit(self._evaluate_one, fingerprint, record_id, example)
+                for record_id, example in pending.items()
+            ]
+            for future in as_completed(futures):
+                record = future.result()
+                records[record["id"]] = record
+                if on_record:
+                    on_record(pending[record["id"]], record)
+
+        errors = sum("error" in records[record_id]["prediction"] for record_id in pending)
+        if errors:
+            print(f"{self.name}: {errors} exemplos com erro na predição (não gravados; serão refeitos na próxima execução)")
+        return [records[record_id] for record_id in ids]
+
+
+def engine_from_env(program, metric, phase: str) -> EvaluationEngine:
+    """Engine com DSPY_NUM_THREADS threads e resultados em results/checkpoints/scores.sqlite."""
+    return EvaluationEngine(
+        program,
+        metric,
+        num_threads=int(os.getenv("DSPY_NUM_THREADS", "1")),
+        dedup=os.getenv("EVAL_DEDUP", "true").lower() == "true",
+        reuse_predictors=os.getenv("EVAL_REUSE_PREDICTORS", "true").lower() == "true",
+        name=phase,
+    )
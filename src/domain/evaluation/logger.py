@@ -3,10 +3,9 @@
 from datetime import datetime
 from pathlib import Path
 
-RESULTS_DIR = Path("results")
-RESULTS_DIR.mkdir(exist_ok=True)
+from domain.evaluation.results_store import get_store
 
-RESULTS_FILE = RESULTS_DIR / "dspy_results.txt"
+RESULTS_DIR = Path("results")
 
 
 def log_result(
@@ -17,6 +16,7 @@ def log_result(
     model_name: str,
     notes: str = ""
 ):
+    """Registra o resultado em results/dspy_results.sqlite (ver results_store.py)."""
     timestamp = datetime.utcnow().isoformat()
 
     line = (
@@ -26,8 +26,15 @@ def log_result(
         f"{metric_value:.4f};"
         f"{num_examples};"
         f"{model_name};"
-        f"{notes}\n"
+        f"{notes}"
+    )
+    print("Logging result:", line)
+    get_store().add(
+        phase=phase,
+        metric_name=metric_name,
+        metric_value=metric_value,
+        num_examples=num_examples,
+        model_name=model_name,
+        notes=notes,
+        timestamp=timestamp,
     )
-    print("Logging result:", line.strip())
-    with open(RESULTS_FILE, "a", encoding="utf-8") as f:
-        f.write(line)
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import dspy
+from dspy.evaluate.evaluate import EvaluationResult
+from dspy.teleprompt import MIPROv2
+
+from domain.evaluation.engine import CHECKPOINT_DIR, example_id, program_fingerprint
+from utils.instrumentation import metrics
+
+
+def run_key(program, trainset, **settings) -> str:
+    """Identifica uma execução do otimizador: programa inicial, dados e hiperparâmetros."""
+    payload = json.dumps(
+        {
+            "program": program_fingerprint(program),
+            "trainset": [example_id(example, normalize=False) for example in trainset],
+            "settings": settings,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def _demos_to_json(demo_candidates):
+    if demo_candidates is None:
+        return None
+    return {
+        str(i): [[demo.toDict() for demo in demo_set] for demo_set in demo_sets]
+        for i, demo_sets in demo_candidates.items()
+    }
+
+
+def _demos_from_json(data):
+    if data is None:
+        return None
+    return {
+        int(i): [[dspy.Example(**demo) for demo in demo_set] for demo_set in demo_sets]
+        for i, demo_sets in data.items()
+    }
+
+
+class OptimizerCheckpoint:
+    """
+    Estado parcial de um otimizador salvo em JSON (escrita atômica).
+
+    Guarda as etapas já concluídas (demos, instruções, estado do RNG),
+    os scores de cada avaliação de candidato e o caminho do programa final.
+    """
+
+    def __init__(self, path, resume: bool = False):
+        self.path = Path(path)
+        self.state = {"evaluations": {}}
+        if resume and self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                self.state = json.load(f)
+            print(f"Retomando otimização a partir de {self.path}")
+        elif self.path.exists():
+            print(f"Checkpoint existente em {self.path} será sobrescrito (use --resume para retomar)")
+
+    @classmethod
+    def for_run(cls, name: str, key: str, resume: bool = False) -> "OptimizerCheckpoint":
+        return cls(CHECKPOINT_DIR / f"{name}_{key}.json", resume=resume)
+
+    def get(self, name: str, default=None):
+        return self.state.get(name, default)
+
+    def set(self, name: str, value) -> None:
+        self.state[name] = value
+        self.save()
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, self.path)
+
+    @property
+    def program_path(self) -> Path:
+        return self.path.with_suffix(".program.json")
+
+    def save_program(self, program) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        program.save(self.program_path)
+        self.set("completed", True)
+
+    def load_program(self, program):
+        """Carrega o programa final no `program` se a execução anterior terminou; senão retorna None."""
+        if not self.get("completed") or not self.program_path.exists():
+            return None
+        program.load(self.program_path)
+        print(f"Otimização já concluída; programa carregado de {self.program_path}")
+        return program
+
+
+class CheckpointedEvaluate:
+    """
+    Envolve o `Evaluate` do MIPROv2 e grava o score de cada candidato.
+
+    A chave é o fingerprint do programa + ids dos exemplos avaliados, então
+    ao retomar uma execução os trials já feitos são respondidos sem chamar o LM
+    e o Optuna (com a mesma seed) refaz o mesmo caminho até o ponto da falha.
+    """
+
+    def __init__(self, evaluate, checkpoint: OptimizerCheckpoint):
+        self._evaluate = evaluate
+        self._checkpoint = checkpoint
+
+    def __getattr__(self, name):
+        return getattr(self._evaluate, name)
+
+    def __call__(self, program, devset=None, **kwargs):
+        devset = self._evaluate.devset if devset is None else devset
+        key_payload = program_fingerprint(program) + "".join(example_id(ex, normalize=False) for ex in devset)
+        key = hashlib.sha256(key_payload.encode("utf-8")).hexdigest()
+
+        evaluations = self._checkpoint.state.setdefault("evaluations", {})
+        if key in evaluations:
+            return EvaluationResult(score=evaluations[key]["score"], results=[])
+
+        result = self._evaluate(program, devset=devset, **kwargs)
+        metadata = kwargs.get("callback_metadata") or {}
+        evaluations[key] = {
+            "score": result.score,
+            "size": len(devset),
+            "kind": metadata.get("metric_key", "eval"),
+        }
+        self._checkpoint.save()
+        return result
+
+
+class ResumableMIPROv2(MIPROv2):
+    """
+    MIPROv2 com checkpoint de cada etapa: demos bootstrapped, instruções
+    propostas (com o estado do RNG ao final da proposta) e scores dos trials.
+    Etapas presentes no checkpoint não são executadas de novo.
+    Cada etapa é uma fase em `metrics` (mipro_bootstrap, mipro_propose,
+    mipro_trials), para comparar as chamadas com as previstas em `budget.py`.
+    """
+
+    def __init__(self, *args, checkpoint: OptimizerCheckpoint, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkpoint = checkpoint
+
+    def _bootstrap_fewshot_examples(self, *args, **kwargs):
+        if "demo_candidates" in self.checkpoint.state:
+            print("Demos carregadas do checkpoint")
+            return _demos_from_json(self.checkpoint.get("demo_candidates"))
+        with metrics.phase("mipro_bootstrap"):
+            demo_candidates = super()._bootstrap_fewshot_examples(*args, **kwargs)
+        self.checkpoint.set("demo_candidates", _demos_to_json(demo_candidates))
+        return demo_candidates
+
+    def _propose_instructions(self, *args, **kwargs):
+        if "instruction_candidates" in self.checkpoint.state:
+            print("Instruções candidatas carregadas do checkpoint")
+            version, internal, gauss = self.checkpoint.get("rng_state")
+            self.rng.setstate((version, tuple(internal), gauss))
+            return {int(i): list(c) for i, c in self.checkpoint.get("instruction_candidates").items()}
+        with metrics.phase("mipro_propose"):
+            instruction_candidates = super()._propose_instructions(*args, **kwargs)
+        self.checkpoint.state["rng_state"] = list(self.rng.getstate())
+        self.checkpoint.set("instruction_candidates", {str(i): c for i, c in instruction_candidates.items()})
+        return instruction_candidates
+
+    def _optimize_prompt_parameters(self, program, instruction_candidates, demo_candidates, evaluate, *args, **kwargs):
+        evaluate = CheckpointedEvaluate(evaluate, self.checkpoint)
+        with metrics.phase("mipro_trials"):
+            return super()._optimize_prompt_parameters(
+                program, instruction_candidates, demo_candidates, evaluate, *args, **kwargs
+            )
@@ -0,0 +1,268 @@
+import argparse
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+RESULTS_DB = Path("results") / "dspy_results.sqlite"
+TEXT_LOG = Path("results") / "dspy_results.txt"
+
+# Fase registrada por cada fluxo -> otimizador que gerou o programa avaliado
+PHASE_OPTIMIZERS = {
+    "evaluation": "baseline",
+    "evaluation_cascade": "cascade",
+    "evaluation_optimized": "BootstrapFewShot",
+    "MIPROv2_evaluation": "MIPROv2",
+}
+
+# Métricas de acurácia global (accuracy_local/accuracy_llm da cascata são parciais)
+ACCURACY_METRICS = ("accuracy", "accuracy_fewshot")
+
+# Antes de todas as fases usarem 0-1, a avaliação do MIPROv2 registrava a
+# acurácia em 0-100 (escala do `Evaluate`): essas linhas são convertidas
+LEGACY_PERCENT_METRICS = (("MIPROv2_evaluation", "accuracy"),)
+
+_COLUMNS = ("timestamp", "phase", "optimizer", "metric_name", "metric_value", "num_examples", "model_name", "notes")
+
+
+def optimizer_for_phase(phase: str) -> str:
+    return PHASE_OPTIMIZERS.get(phase, phase)
+
+
+class ResultsStore:
+    """
+    Resultados de avaliação em SQLite, com índices por fase, métrica, modelo e data.
+
+    `add` acumula linhas em memória e `flush` grava o lote em uma única
+    transação; `batch()` agrupa várias escritas. O modo WAL e o
+    `busy_timeout` permitem escritas de vários processos ao mesmo tempo.
+    Uma linha idêntica (mesmo timestamp, fase, métrica, modelo, valor e notas)
+    é ignorada, então importar o mesmo log duas vezes não duplica linhas;
+    escritas ignoradas fora da importação são avisadas.
+    """
+
+    def __init__(self, path=RESULTS_DB, batch_size: int = 1):
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self._pending: list[tuple] = []
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " id INTEGER PRIMARY KEY,"
+                " timestamp TEXT NOT NULL,"
+                " phase TEXT NOT NULL,"
+                " optimizer TEXT NOT NULL,"
+                " metric_name TEXT NOT NULL,"
+                " metric_value REAL NOT NULL,"
+                " num_examples INTEGER,"
+                " model_name TEXT NOT NULL,"
+                " notes TEXT)"
+            )
+            # O índice antigo (sem valor e notas) descartava uma segunda escrita no mesmo timestamp
+            conn.execute("DROP INDEX IF EXISTS idx_results_unique")
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_results_dedup"
+                " ON results (timestamp, phase, metric_name, model_name, metric_value, notes)"
+            )
+            for phase, metric_name in LEGACY_PERCENT_METRICS:
+                conn.execute(
+                    "UPDATE results SET metric_value = metric_value / 100.0"
+                    " WHERE phase = ? AND metric_name = ? AND metric_value > 1",
+                    (phase, metric_name),
+                )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_results_phase ON results (phase)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_results_metric ON results (metric_name)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_results_model ON results (model_name)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_results_timestamp ON results (timestamp)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_results_best"
+                " ON results (metric_name, optimizer, model_name, metric_value)"
+            )
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _row(phase, metric_name, metric_value, num_examples, model_name, notes="", timestamp=None) -> tuple:
+        return (
+            timestamp or datetime.utcnow().isoformat(),
+            phase,
+            optimizer_for_phase(phase),
+            metric_name,
+            float(metric_value),
+            num_examples,
+            model_name,
+            notes,
+        )
+
+    def add(self, phase: str, metric_name: str, metric_value: float, num_examples: int,
+            model_name: str, notes: str = "", timestamp: str = None) -> None:
+        row = self._row(phase, metric_name, metric_value, num_examples, model_name, notes, timestamp)
+        with self._lock:
+            self._pending.append(row)
+            should_flush = len(self._pending) >= self.batch_size
+        if should_flush:
+            self.flush()
+
+    def flush(self, warn_ignored: bool = True) -> int:
+        """Grava as linhas pendentes em uma transação; retorna quantas eram novas."""
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            before = conn.total_changes
+            conn.executemany(
+                f"INSERT OR IGNORE INTO results ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                rows,
+            )
+            inserted = conn.total_changes - before
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        if warn_ignored and inserted < len(rows):
+            print(f"Aviso: {len(rows) - inserted} resultado(s) ignorado(s): linha idêntica já registrada em {self.path}")
+        return inserted
+
+    @contextmanager
+    def batch(self):
+        """Adia a gravação até o fim do bloco (um único commit)."""
+        previous, self.batch_size = self.batch_size, float("inf")
+        try:
+            yield self
+        finally:
+            self.batch_size = previous
+            self.flush()
+
+    def query(self, sql: str, params=()) -> list[dict]:
+        conn = self._connect()
+        try:
+            return [dict(row) for row in conn.execute(sql, params).fetchall()]
+        finally:
+            conn.close()
+
+    def best_by_optimizer(self, metric_names=ACCURACY_METRICS) -> list[dict]:
+        """Melhor valor por otimizador e modelo (todas as fases registram a acurácia em 0-1)."""
+        placeholders = ", ".join("?" * len(metric_names))
+        return self.query(
+            "SELECT optimizer, model_name, MAX(metric_value) AS best_value, COUNT(*) AS runs,"
+            "       timestamp AS best_timestamp, num_examples"
+            f" FROM results WHERE metric_name IN ({placeholders})"
+            " GROUP BY optimizer, model_name"
+            " ORDER BY best_value DESC",
+            tuple(metric_names),
+        )
+
+    def trend(self, metric_names=ACCURACY_METRICS, optimizer: str = None, model_name: str = None,
+              period: str = "day") -> list[dict]:
+        """Média, máximo e quantidade de execuções por dia/semana/mês."""
+        formats = {"day": "%Y-%m-%d", "week": "%Y-W%W", "month": "%Y-%m"}
+        filters = [f"metric_name IN ({', '.join('?' * len(metric_names))})"]
+        params = [formats[period], *metric_names]
+        if optimizer:
+            filters.append("optimizer = ?")
+            params.append(optimizer)
+        if model_name:
+            filters.append("model_name = ?")
+            params.append(model_name)
+        return self.query(
+            "SELECT strftime(?, timestamp) AS period, optimizer, model_name, COUNT(*) AS runs,"
+            "       AVG(metric_value) AS mean_value, MAX(metric_value) AS best_value"
+            " FROM results"
+            f" WHERE {' AND '.join(filters)}"
+            " GROUP BY period, optimizer, model_name"
+            " ORDER BY period, optimizer, model_name",
+            tuple(params),
+        )
+
+    def import_text_log(self, path=TEXT_LOG) -> int:
+        """
+        Importa o antigo `dspy_results.txt` (linhas separadas por ';') em um único lote.
+        Retorna quantas linhas eram novas; repetir a importação não duplica nada.
+        """
+        rows = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                parts = line.rstrip("\n").split(";")
+                if len(parts) < 6:
+                    continue
+                timestamp, phase, metric_name, value, num_examples, model_name = parts[:6]
+                value = float(value)
+                if (phase, metric_name) in LEGACY_PERCENT_METRICS and value > 1:
+                    value /= 100
+                rows.append(self._row(
+                    phase,
+                    metric_name,
+                    value,
+                    int(num_examples) if num_examples else None,
+                    model_name,
+                    # Notas antigas podiam conter ';'
+                    ";".join(parts[6:]),
+                    timestamp,
+                ))
+        with self._lock:
+            self._pending.extend(rows)
+        return self.flush(warn_ignored=False)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> ResultsStore:
+    """Instância compartilhada, criada no primeiro uso."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ResultsStore()
+        return _store
+
+
+def _print_rows(rows: list[dict]) -> None:
+    if not rows:
+        print("(nenhum resultado)")
+        return
+    columns = list(rows[0])
+    print(" | ".join(columns))
+    for row in rows:
+        print(" | ".join(f"{v:.4f}" if isinstance(v, float) else str(v) for v in row.values()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consulta e importação dos resultados em SQLite")
+    parser.add_argument("--db", default=str(RESULTS_DB))
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="Importa o log em texto antigo")
+    importer.add_argument("path", nargs="?", default=str(TEXT_LOG))
+    commands.add_parser("best", help="Melhor acurácia por otimizador e modelo")
+    trend = commands.add_parser("trend", help="Evolução da acurácia ao longo do tempo")
+    trend.add_argument("--optimizer")
+    trend.add_argument("--model")
+    trend.add_argument("--period", choices=("day", "week", "month"), default="day")
+    args = parser.parse_args()
+
+    store = ResultsStore(args.db)
+    if args.command == "import":
+        print(f"{store.import_text_log(args.path)} resultados novos importados de {args.path}")
+    elif args.command == "best":
+        _print_rows(store.best_by_optimizer())
+    else:
+        _print_rows(store.trend(optimizer=args.optimizer, model_name=args.model, period=args.period))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import argparse
+import functools
+import hashlib
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import dspy
+
+from domain.evaluation.logger import RESULTS_DIR
+
+SCORE_DB = RESULTS_DIR / "checkpoints" / "scores.sqlite"
+
+
+def predictor_fingerprint(predictor) -> str:
+    """Hash do estado de um predictor (assinatura, instruções e demos) e do modelo configurado."""
+    state = {
+        "predictor": predictor.dump_state(),
+        "model": getattr(dspy.settings.lm, "model", None),
+    }
+    payload = json.dumps(state, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def inputs_key(inputs: dict) -> str:
+    payload = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ScoreStore:
+    """
+    Resultados de avaliação por exemplo, em SQLite, compartilhados entre fases.
+
+    `example_results` guarda a predição e o score de cada (fingerprint do
+    programa, id do exemplo): avaliar de novo o mesmo programa não chama o LM.
+    `predictor_outputs` guarda a saída de cada predictor por (fingerprint do
+    predictor, entradas), para programas que diferem só em alguns predictors
+    (ver `memoized_predictors`). Predições de fallback (com campo `error`)
+    nunca são gravadas: uma falha passageira do LM não vira resposta
+    permanente. `purge_errors` remove as que tenham sido gravadas antes disso.
+    """
+
+    def __init__(self, path=SCORE_DB):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS example_results ("
+            " program_fp TEXT NOT NULL,"
+            " example_id TEXT NOT NULL,"
+            " prediction TEXT NOT NULL,"
+            " score REAL NOT NULL,"
+            " latency REAL,"
+            " created TEXT NOT NULL,"
+            " PRIMARY KEY (program_fp, example_id))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS predictor_outputs ("
+            " predictor_fp TEXT NOT NULL,"
+            " inputs_key TEXT NOT NULL,"
+            " outputs TEXT NOT NULL,"
+            " created TEXT NOT NULL,"
+            " PRIMARY KEY (predictor_fp, inputs_key))"
+        )
+
+    def get_results(self, program_fp: str, example_ids) -> dict[str, dict]:
+        """Registros já avaliados deste programa, entre os ids pedidos."""
+        wanted = set(example_ids)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT example_id, prediction, score, latency FROM example_results WHERE program_fp = ?",
+                (program_fp,),
+            ).fetchall()
+        return {
+            example_id: {"id": example_id, "prediction": json.loads(prediction), "score": score, "latency": latency}
+            for example_id, prediction, score, latency in rows
+            if example_id in wanted
+        }
+
+    def add_result(self, program_fp: str, record: dict) -> None:
+        if "error" in record["prediction"]:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO example_results VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    program_fp,
+                    record["id"],
+                    json.dumps(record["prediction"], ensure_ascii=False, default=str),
+                    record["score"],
+                    record.get("latency"),
+                    datetime.utcnow().isoformat(),
+                ),
+            )
+
+    def get_outputs(self, predictor_fp: str, key: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT outputs FROM predictor_outputs WHERE predictor_fp = ? AND inputs_key = ?",
+                (predictor_fp, key),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add_outputs(self, predictor_fp: str, key: str, outputs: dict) -> None:
+        if "error" in outputs:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO predictor_outputs VALUES (?, ?, ?, ?)",
+                (predictor_fp, key, json.dumps(outputs, ensure_ascii=False, default=str), datetime.utcnow().isoformat()),
+            )
+
+
+    def purge_errors(self) -> int:
+        """Remove os registros com `error` na predição; retorna quantos foram removidos."""
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("DELETE FROM example_results WHERE json_extract(prediction, '$.error') IS NOT NULL")
+            self._conn.execute("DELETE FROM predictor_outputs WHERE json_extract(outputs, '$.error') IS NOT NULL")
+            return self._conn.total_changes - before
+
+    def purge_program(self, program_fp_prefix: str) -> int:
+        """
+        Remove os resultados de um programa (prefixo do fingerprint, como
+        aparece na saída do engine). Útil para registros de fallback gravados
+        antes do campo `error` existir, que não se distinguem de respostas reais.
+        """
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute(
+                "DELETE FROM example_results WHERE program_fp LIKE ?", (program_fp_prefix + "%",)
+            )
+            return self._conn.total_changes - before
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_score_store() -> ScoreStore:
+    """Instância compartilhada, criada no primeiro uso."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ScoreStore()
+        return _store
+
+
+@contextmanager
+def memoized_predictors(program, store: ScoreStore):
+    """
+    Durante o bloco, cada predictor do `program` responde do `store` quando
+    já viu as mesmas entradas com o mesmo estado; só as combinações novas
+    chamam o LM. Assim, trocar as instruções ou demos de um predictor não
+    refaz as chamadas dos demais.
+    """
+    patched = []
+    for _, predictor in program.named_predictors():
+        if any(predictor is other for other in patched):
+            continue
+        fingerprint = predictor_fingerprint(predictor)
+
+        # Pela classe: acessar `predictor.forward` fora do __call__ gera aviso no dspy
+        original = functools.partial(type(predictor).forward, predictor)
+
+        def forward(_original=original, _fingerprint=fingerprint, **kwargs):
+            key = inputs_key(kwargs)
+            outputs = store.get_outputs(_fingerprint, key)
+            if outputs is not None:
+                return dspy.Prediction(**outputs)
+            prediction = _original(**kwargs)
+            store.add_outputs(_fingerprint, key, prediction.toDict())
+            return prediction
+
+        predictor.forward = forward
+        patched.append(predictor)
+    try:
+        yield program
+    finally:
+        for predictor in patched:
+            del predictor.forward
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manutenção dos resultados por exemplo (scores.sqlite)")
+    parser.add_argument("--db", default=str(SCORE_DB))
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("purge-errors", help="Remove predições de fallback (LM falhou) gravadas")
+    purge = commands.add_parser("purge-program", help="Remove os resultados de um programa")
+    purge.add_argument("fingerprint", help="Fingerprint (ou prefixo) mostrado pelo engine")
+    args = parser.parse_args()
+
+    store = ScoreStore(args.db)
+    if args.command == "purge-errors":
+        print(f"{store.purge_errors()} registros com erro removidos de {args.db}")
+    else:
+        print(f"{store.purge_program(args.fingerprint)} resultados removidos de {args.db}")
+
+
+if __name__ == "__main__":
+    main()
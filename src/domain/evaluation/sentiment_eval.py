@@ -1,23 +1,73 @@
 import os
-from time import sleep
-from domain.module.sentiment import SentimentClassifier
-from domain.dataset.b2w_review import B2WReviews
+import dspy
+from domain.module.sentiment import (
+    BatchSentimentClassifier,
+    CascadeSentimentClassifier,
+    SentimentClassifier,
+    choose_cascade_threshold,
+)
+from domain.dataset.b2w_review import B2WReviews, stream_b2w_examples
+from domain.dataset.cache import get_cache_dir
+from domain.dataset.dedup import DedupIndex
+from domain.module.demo_retriever import demo_retriever_from_env
+from domain.module.preprocess import text_budget_from_env
+from domain.evaluation.engine import engine_from_env
 from domain.evaluation.logger import log_result
+from domain.evaluation.sentiment_eval_async import run_async_evaluation
+from domain.evaluation.token_savings import report_text_budget
+from domain.evaluation.sequential_eval import (
+    is_sequential_mode,
+    log_sequential_result,
+    sequential_evaluator_from_env,
+)
+from utils.config import get_data_path
 
 # Dataset de avaliação
-def get_train_test_split_data():
+def _streaming_enabled():
+    return os.getenv("DATASET_STREAMING", "false").lower() == "true"
+
+def _load_b2w_reviews():
     limit = os.getenv("LIMIT_DATASET_EVAL")
-    b2w_reviews = B2WReviews(sample=int(limit) if limit else None)
-    return b2w_reviews.get_train_test_split()
+    return B2WReviews(sample=int(limit) if limit else None, streaming=_streaming_enabled())
+
+def dedup_enabled():
+    return os.getenv("EVAL_DEDUP", "true").lower() == "true"
+
+def get_train_test_split_data():
+    return _load_b2w_reviews().get_train_test_split()
+
+def get_compact_split_data():
+    """
+    Mesmo split de `get_train_test_split_data`, mas com exemplos criados sob demanda.
+    """
+    return _load_b2w_reviews().get_compact_split()
 
 def sentiment_dataset_train():
     train_set, _ = get_train_test_split_data()
     return train_set
 
+def sentiment_dataset_train_compact():
+    train_set, _ = get_compact_split_data()
+    return train_set
+
 def sentiment_dataset_test():
     _, test_set = get_train_test_split_data()
     return test_set
 
+def demo_retriever():
+    """
+    Com DEMO_RETRIEVAL_K, demos recuperadas do split de treino para cada review
+    (índice persistido no diretório de cache do dataset).
+    """
+    return demo_retriever_from_env(sentiment_dataset_train, get_cache_dir(get_data_path()))
+
+def sentiment_dataset_test_stream():
+    """
+    Gera exemplos de teste conforme o CSV é lido (sem carregar o arquivo todo).
+    """
+    limit = os.getenv("LIMIT_DATASET_EVAL")
+    return stream_b2w_examples(split="test", limit=int(limit) if limit else None)
+
 # Métrica de avaliação
 def sentiment_accuracy(example, prediction, trace=None):
     """
@@ -30,32 +80,154 @@ def sentiment_accuracy(example, prediction, trace=None):
 
 
 def run_evaluation():
-    classifier = SentimentClassifier()
-    dataset = sentiment_dataset_test()
+    # TEXT_BUDGET_TOKENS limita o tamanho de cada review enviado ao LM
+    classifier = SentimentClassifier(text_budget=text_budget_from_env(), demo_retriever=demo_retriever())
+    # Em modo streaming a avaliação começa antes do CSV ser lido por completo
+    dataset = sentiment_dataset_test_stream() if _streaming_enabled() else sentiment_dataset_test()
 
-    scores = []
-    print("Iniciando avaliação de sentimento...")
-    for example in dataset:
-        prediction = classifier(text=example.text)
-        score = sentiment_accuracy(example, prediction)
-        print(f"Texto: {example.text}, Esperado: {example.sentiment}, Predito: {prediction.sentiment}, Score: {score}")
-        scores.append(score)
-        sleep(8)  # Pequena pausa para evitar sobrecarga
+    if is_sequential_mode():
+        return run_sequential_evaluation(classifier, list(dataset))
+    eval_mode = os.getenv("EVAL_MODE", "full").lower()
+    if eval_mode == "async":
+        return run_async_evaluation(dataset)
+    if eval_mode == "batch":
+        return run_batch_evaluation(list(dataset))
+    if eval_mode == "cascade":
+        return run_cascade_evaluation(list(dataset))
 
-        # print("Texto:", example.text)
-        # print("Esperado:", example.sentiment)
-        # print("Predito :", prediction.sentiment)
-        # print("Score   :", score)
-        # print("-" * 50)
+    print("Iniciando avaliação de sentimento...")
+    # Paralela, com checkpoint em results/checkpoints/: uma execução interrompida
+    # retoma de onde parou. O ritmo das chamadas é controlado pelo RateLimitedLM.
+    dataset = list(dataset)
+    records = engine_from_env(classifier, sentiment_accuracy, phase="evaluation").run(dataset)
+    scores = [record["score"] for record in records]
+    for example, record in zip(dataset, records):
+        print(f"Texto: {example.text}, Esperado: {example.sentiment}, "
+              f"Predito: {record['prediction'].get('sentiment')}, Score: {record['score']:g}")
 
     accuracy = sum(scores) / len(scores)
+    model_name = getattr(dspy.settings.lm, "model", "unknown")
     
     log_result(
         phase="evaluation",
         metric_name="accuracy",
         metric_value=accuracy,
         num_examples=len(scores),
-        model_name="ollama/llama3.1",
-        notes="baseline"
+        model_name=model_name,
+        notes=f"retrieval k={classifier.demo_retriever.k}" if classifier.demo_retriever else "baseline"
     )
     print(f"Acurácia final: {accuracy:.2f}")
+    if classifier.demo_retriever:
+        print(f"Demos recuperadas: {classifier.demo_retriever.summary()}")
+    report_text_budget(classifier, dataset, records, sentiment_accuracy, phase="evaluation", model_name=model_name)
+
+
+def run_sequential_evaluation(classifier, dataset):
+    """
+    Avalia em ordem estratificada e para quando o intervalo de confiança
+    da acurácia fica estreito o suficiente (ou o orçamento de requisições acaba).
+    """
+    evaluator = sequential_evaluator_from_env(sentiment_accuracy)
+    print("Iniciando avaliação sequencial de sentimento...")
+    result = evaluator(classifier, dataset, verbose=True)
+
+    log_sequential_result(result, phase="evaluation", metric_name="accuracy", notes="baseline")
+    print(
+        f"Acurácia final: {result.accuracy:.2f} "
+        f"(IC [{result.ci_low:.2f}, {result.ci_high:.2f}], "
+        f"{result.num_examples}/{result.total_examples} exemplos, parada: {result.stop_reason})"
+    )
+    return result
+
+
+def run_batch_evaluation(dataset):
+    """
+    Avalia enviando vários reviews por chamada ao LM (EVAL_MODE=batch).
+    EVAL_BATCH_SIZE e EVAL_BATCH_MAX_TOKENS controlam o tamanho dos lotes.
+    """
+    classifier = BatchSentimentClassifier(
+        batch_size=int(os.getenv("EVAL_BATCH_SIZE", "8")),
+        max_batch_tokens=int(os.getenv("EVAL_BATCH_MAX_TOKENS", "2000")),
+    )
+    print("Iniciando avaliação de sentimento em lotes...")
+    if dedup_enabled():
+        index = DedupIndex(dataset)
+        print(f"Deduplicação: {index.summary()}")
+        sentiments = index.fan_out(classifier(texts=[ex.text for ex in index.unique_examples()]).sentiments)
+    else:
+        sentiments = classifier(texts=[example.text for example in dataset]).sentiments
+
+    scores = []
+    for example, sentiment in zip(dataset, sentiments):
+        score = sentiment_accuracy(example, dspy.Prediction(sentiment=sentiment))
+        print(f"Texto: {example.text}, Esperado: {example.sentiment}, Predito: {sentiment}, Score: {score}")
+        scores.append(score)
+
+    accuracy = sum(scores) / len(scores)
+    requests = classifier.batch_calls + classifier.fallback_calls
+    log_result(
+        phase="evaluation",
+        metric_name="accuracy",
+        metric_value=accuracy,
+        num_examples=len(scores),
+        model_name=getattr(dspy.settings.lm, "model", "unknown"),
+        notes=f"batch size={classifier.batch_size} requests={requests} fallbacks={classifier.fallback_calls}"
+    )
+    print(f"Acurácia final: {accuracy:.2f} ({len(scores)} exemplos em {requests} chamadas ao LM)")
+    return accuracy
+
+
+def run_cascade_evaluation(dataset):
+    """
+    Avalia a cascata modelo local -> LLM (EVAL_MODE=cascade).
+
+    O modelo local é treinado no split de treino. O limiar vem de
+    CASCADE_THRESHOLD ou, se ausente, é escolhido em uma parte do treino para
+    atingir CASCADE_TARGET_ACCURACY no caminho local.
+    """
+    trainset = sentiment_dataset_train()
+    threshold = os.getenv("CASCADE_THRESHOLD")
+    if threshold is not None:
+        classifier = CascadeSentimentClassifier.from_trainset(trainset, float(threshold))
+    else:
+        cut = int(len(trainset) * 0.8)
+        classifier = CascadeSentimentClassifier.from_trainset(trainset[:cut])
+        classifier.threshold = choose_cascade_threshold(
+            classifier.local_model,
+            trainset[cut:],
+            float(os.getenv("CASCADE_TARGET_ACCURACY", "0.95")),
+        )
+    print(f"Iniciando avaliação em cascata (limiar={classifier.threshold:.3f})...")
+
+    scores = {"local": [], "llm": []}
+    for example in dataset:
+        prediction = classifier(text=example.text)
+        score = sentiment_accuracy(example, prediction)
+        scores[prediction.source].append(score)
+        print(f"Texto: {example.text}, Esperado: {example.sentiment}, Predito: {prediction.sentiment}, "
+              f"Fonte: {prediction.source} ({prediction.confidence:.2f}), Score: {score}")
+
+    all_scores = scores["local"] + scores["llm"]
+    accuracy = sum(all_scores) / len(all_scores)
+    model_name = getattr(dspy.settings.lm, "model", "unknown")
+    log_result(
+        phase="evaluation_cascade",
+        metric_name="accuracy",
+        metric_value=accuracy,
+        num_examples=len(all_scores),
+        model_name=model_name,
+        notes=f"threshold={classifier.threshold:.3f} llm_fraction={len(scores['llm']) / len(all_scores):.3f}"
+    )
+    for source, source_scores in scores.items():
+        if source_scores:
+            log_result(
+                phase="evaluation_cascade",
+                metric_name=f"accuracy_{source}",
+                metric_value=sum(source_scores) / len(source_scores),
+                num_examples=len(source_scores),
+                model_name="local/hashed-ngram-logreg" if source == "local" else model_name,
+                notes=f"threshold={classifier.threshold:.3f}"
+            )
+
+    print(f"Acurácia final: {accuracy:.2f} | respostas locais: {len(scores['local'])} | LLM: {len(scores['llm'])}")
+    return accuracy
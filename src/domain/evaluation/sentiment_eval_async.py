@@ -0,0 +1,65 @@
+import asyncio
+import os
+import time
+
+import dspy
+
+from domain.module.preprocess import text_budget_from_env
+from domain.module.sentiment import SentimentClassifier
+from domain.evaluation.logger import log_result
+
+
+async def _classify(classifier, example, semaphore: asyncio.Semaphore):
+    async with semaphore:
+        start = time.perf_counter()
+        prediction = await classifier.acall(text=example.text)
+        return example, prediction, time.perf_counter() - start
+
+
+async def evaluate_async(classifier, dataset, metric, max_concurrency: int = 8, verbose: bool = True) -> list[int]:
+    """
+    Classifica os exemplos com até `max_concurrency` chamadas em voo e coleta
+    os scores conforme as respostas chegam.
+
+    O ritmo é dado apenas pelo rate limiter instalado no LM (quando houver);
+    não há pausas fixas entre as chamadas.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    tasks = [asyncio.create_task(_classify(classifier, example, semaphore)) for example in dataset]
+
+    scores = []
+    for done in asyncio.as_completed(tasks):
+        example, prediction, latency = await done
+        score = metric(example, prediction)
+        scores.append(score)
+        if verbose:
+            print(f"[{len(scores)}/{len(tasks)}] Esperado: {example.sentiment}, "
+                  f"Predito: {prediction.sentiment}, Score: {score}, Latência: {latency:.2f}s")
+    return scores
+
+
+def run_async_evaluation(dataset=None):
+    """Equivalente assíncrono de `run_evaluation` (EVAL_MODE=async)."""
+    # Import local para evitar import circular com sentiment_eval
+    from domain.evaluation.sentiment_eval import demo_retriever, sentiment_accuracy, sentiment_dataset_test
+
+    classifier = SentimentClassifier(text_budget=text_budget_from_env(), demo_retriever=demo_retriever())
+    dataset = list(dataset) if dataset is not None else sentiment_dataset_test()
+    max_concurrency = int(os.getenv("EVAL_CONCURRENCY", "8"))
+
+    print(f"Iniciando avaliação assíncrona de sentimento ({max_concurrency} requisições em paralelo)...")
+    start = time.perf_counter()
+    scores = asyncio.run(evaluate_async(classifier, dataset, sentiment_accuracy, max_concurrency))
+    elapsed = time.perf_counter() - start
+
+    accuracy = sum(scores) / len(scores)
+    log_result(
+        phase="evaluation",
+        metric_name="accuracy",
+        metric_value=accuracy,
+        num_examples=len(scores),
+        model_name=getattr(dspy.settings.lm, "model", "unknown"),
+        notes=f"async concurrency={max_concurrency} throughput={len(scores) / elapsed:.2f}req/s"
+    )
+    print(f"Acurácia final: {accuracy:.2f} ({len(scores) / elapsed:.2f} req/s)")
+    return accuracy
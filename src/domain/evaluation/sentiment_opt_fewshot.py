@@ -1,58 +1,109 @@
 import dspy
+from domain.module.preprocess import text_budget_from_env
 from domain.module.sentiment import SentimentClassifier
+from domain.evaluation.budget import (
+    BOOTSTRAP_PHASES,
+    BudgetExceededError,
+    actual_calls,
+    budget_from_env,
+    predict_bootstrap_calls,
+    report,
+)
+from domain.evaluation.engine import engine_from_env
 from domain.evaluation.sentiment_eval import (
     sentiment_dataset_train,
     sentiment_accuracy,
 )
 from domain.evaluation.logger import log_result
+from domain.evaluation.optimizer_checkpoint import OptimizerCheckpoint, run_key
+from domain.evaluation.token_savings import report_text_budget
+from utils.instrumentation import metrics
 
-def run_optimization():
-    
-   # Pipeline original
-   base_program = SentimentClassifier()
+def run_optimization(resume: bool = False, over_budget: bool = False):
+   """
+   BootstrapFewShot + avaliação. Se nem cortando o trainset as chamadas cabem
+   no orçamento, só executa (com o trainset inteiro) com `over_budget=True`.
+   """
+   # Pipeline original (com TEXT_BUDGET_TOKENS, reviews e demos são cortados no orçamento)
+   base_program = SentimentClassifier(text_budget=text_budget_from_env())
    dataset = sentiment_dataset_train()
    
    if not dataset:
        print("Erro: Dataset vazio!")
        return base_program
+
+   # Com DSPY_BUDGET_REQUESTS / DSPY_BUDGET_MINUTES o trainset é cortado para caber no orçamento
+   budget = budget_from_env()
+   predicted = predict_bootstrap_calls(len(dataset), len(dataset), max_bootstrapped_demos=4)
+   if sum(predicted.values()) > budget.calls:
+       trimmed = dataset[:max(int(budget.calls) - predicted["bootstrap_compile"], 0)]
+       trimmed_predicted = predict_bootstrap_calls(len(trimmed), len(trimmed), max_bootstrapped_demos=4)
+       if trimmed and sum(trimmed_predicted.values()) <= budget.calls:
+           dataset, predicted = trimmed, trimmed_predicted
+       else:
+           message = (f"nem cortando o trainset as chamadas cabem no orçamento "
+                      f"({sum(predicted.values())} previstas com {len(dataset)} exemplos, orçamento de {budget.calls:.0f})")
+           if not over_budget:
+               raise BudgetExceededError(
+                   f"Abortado: {message}. Aumente DSPY_BUDGET_REQUESTS/DSPY_BUDGET_MINUTES ou use --over-budget"
+               )
+           print(f"Aviso: {message}; executando mesmo assim (--over-budget)")
+   print(f"Chamadas ao LM previstas: {sum(predicted.values())} ({len(dataset)} exemplos)")
    
-   # Otimizador
-   optimzer = dspy.BootstrapFewShot(
-       metric=sentiment_accuracy,
-       max_bootstrapped_demos=4
+   # O programa compilado é salvo em results/checkpoints/; com --resume a compilação é pulada
+   checkpoint = OptimizerCheckpoint.for_run(
+       "bootstrap",
+       run_key(base_program, dataset, max_bootstrapped_demos=4),
+       resume=resume,
    )
+   optimized_program = checkpoint.load_program(base_program.deepcopy())
    
-   # Treinamento com otimização
-   optimized_program = optimzer.compile(
-       base_program,
-       trainset=dataset
-   )
+   if optimized_program is None:
+       # Otimizador
+       optimzer = dspy.BootstrapFewShot(
+           metric=sentiment_accuracy,
+           max_bootstrapped_demos=4
+       )
+       
+       # Treinamento com otimização
+       with metrics.phase("bootstrap_compile"):
+           optimized_program = optimzer.compile(
+               base_program,
+               trainset=dataset
+           )
+       checkpoint.save_program(optimized_program)
    
    print("\n=== Resultados da Otimização ===\n")
    
-   scores = []
-   
-   for example in dataset:
-       prediction = optimized_program(text=example.text)
-       score = sentiment_accuracy(example, prediction)
-       scores.append(score)
+   # Avaliação paralela e retomável; o checkpoint é específico deste programa compilado
+   engine = engine_from_env(optimized_program, sentiment_accuracy, phase="evaluation_optimized")
+   with metrics.phase("evaluation_optimized"):
+       records = engine.run(dataset)
+   scores = [record["score"] for record in records]
    
+   for example, record in zip(dataset, records):
        print("Texto:", example.text)
        print("Esperado:", example.sentiment)
-       print("Predito :", prediction.sentiment)
-       print("Score   :", score)
+       print("Predito :", record["prediction"].get("sentiment"))
+       print("Score   :", record["score"])
        print("-" * 50)
        
    accuracy = sum(scores) / len(scores)
+   model_name = getattr(dspy.settings.lm, "model", "unknown")
    log_result(
         phase="evaluation_optimized",
         metric_name="accuracy_fewshot",
         metric_value=accuracy,
         num_examples=len(scores),
-        model_name="ollama/llama3.1",
+        model_name=model_name,
         notes="baseline"
     )   
    print(f"Acurácia final (otimizada): {accuracy:.2f}")
+   report_text_budget(optimized_program, dataset, records, sentiment_accuracy,
+                      phase="evaluation_optimized", model_name=model_name)
+
+   print("\n=== Chamadas ao LM: previstas x realizadas ===\n")
+   report(predicted, actual_calls(BOOTSTRAP_PHASES), budget)
    
    print("\n=== Exemplos Selecionados pelo Otimizador ===\n")
 
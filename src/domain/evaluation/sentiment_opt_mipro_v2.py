@@ -1,22 +1,38 @@
-import os
-import random # Importado para embaralhar os dados
 import dspy
-from dspy.teleprompt import MIPROv2
+from domain.module.preprocess import text_budget_from_env
 from domain.module.sentiment import SentimentClassifier
-from domain.evaluation.sentiment_eval import sentiment_dataset_train, sentiment_accuracy
+from domain.evaluation.budget import (
+    Budget,
+    BudgetExceededError,
+    MIPRO_PHASES,
+    MiproPlan,
+    actual_calls,
+    budget_from_env,
+    plan_mipro,
+    report,
+)
+from domain.evaluation.engine import engine_from_env
+from domain.evaluation.sentiment_eval import sentiment_dataset_train_compact, sentiment_accuracy
 
 from pathlib import Path
 from domain.evaluation.logger import log_result
-from dspy.evaluate import Evaluate
+from domain.evaluation.optimizer_checkpoint import OptimizerCheckpoint, ResumableMIPROv2, run_key
+from domain.evaluation.token_savings import report_text_budget
+from domain.evaluation.sequential_eval import (
+    is_sequential_mode,
+    log_sequential_result,
+    sequential_evaluator_from_env,
+)
+from utils.instrumentation import metrics
 
 RESULTS_DIR = Path("results")
-RESULTS_DIR.mkdir(exist_ok=True)
 
 class SentimentMiproManager:
     def __init__(self, train_size=0.8): # Adicionado parâmetro de proporção
         
-        full_dataset = sentiment_dataset_train()
-        self.base_program = SentimentClassifier()
+        # Exemplos são criados sob demanda a partir de arrays compactos
+        full_dataset = sentiment_dataset_train_compact()
+        self.base_program = SentimentClassifier(text_budget=text_budget_from_env())
 
         if not full_dataset:
             print("Erro: Dataset vazio!")
@@ -24,8 +40,8 @@ class SentimentMiproManager:
         
         # --- SEÇÃO DE SEPARAÇÃO (SPLIT) ---
         # Embaralhamos para garantir que a distribuição de classes seja aleatória
-        random.seed(42) 
-        random.shuffle(full_dataset)
+        # (apenas os índices são permutados, sem copiar os exemplos)
+        full_dataset = full_dataset.shuffled(seed=42)
         
         split_idx = int(len(full_dataset) * train_size)
         self.trainset = full_dataset[:split_idx]  # Usado para compilar/otimizar
@@ -38,55 +54,131 @@ class SentimentMiproManager:
     def _metric(self, example, pred, trace=None):
         return example.sentiment.lower() == pred.sentiment.lower()
 
-    def run_mipro_optimization(self, num_candidates: int = 2):
+    def plan(self, budget: Budget = None) -> MiproPlan:
+        """Hiperparâmetros que cabem no orçamento (DSPY_BUDGET_REQUESTS / DSPY_BUDGET_MINUTES)."""
+        return plan_mipro(
+            len(self.trainset),
+            len(self.testset),
+            budget or budget_from_env(),
+            num_predictors=len(self.base_program.predictors()),
+            max_bootstrapped_demos=2,
+            max_labeled_demos=2,
+        )
+
+    def run_mipro_optimization(self, plan: MiproPlan = None, resume: bool = False, over_budget: bool = False):
+        """
+        Compila e avalia o programa com o `plan` (padrão: o do orçamento atual).
+        Se o plano não cabe no orçamento, só executa com `over_budget=True`.
+        """
         if not dspy.settings.lm:
             raise ValueError("LM não configurado! Chame setup_llm() primeiro.")
-        
+
+        budget = budget_from_env()
+        plan = plan or self.plan(budget)
+        trainset = self.trainset[:plan.train_size]
+        valset = self.trainset[plan.train_size:plan.train_size + plan.val_size]
+        testset = self.testset[:plan.test_size]
+
         print(f"\n{'='*60}")
-        print(f"Iniciando Otimização MIPROv2 com {len(self.trainset)} exemplos...")
-        
-        teleprompter = MIPROv2(
-            metric=self._metric,
-            prompt_model=dspy.settings.lm,
-            task_model=dspy.settings.lm,
-            auto="light",
-            num_threads=1,
-            verbose=False
-        )
-        
-        # O MIPRO usa o trainset para criar os prompts e demonstrações
-        self.compiled_program = teleprompter.compile(
-            self.base_program,
-            trainset=self.trainset,
-            max_bootstrapped_demos=2,
-            max_labeled_demos=2
+        print(f"Iniciando Otimização MIPROv2 com {len(trainset)} exemplos de treino e {len(valset)} de validação...")
+        print(f"Plano: {plan.num_candidates} candidatos, {plan.num_trials} trials, "
+              f"minibatch {plan.minibatch_size if plan.minibatch else '-'}, {len(testset)} exemplos de teste, "
+              f"{plan.num_threads} threads -> {plan.total_calls} chamadas previstas")
+        if not plan.fits_budget:
+            message = (f"nem o plano mais enxuto cabe no orçamento ({plan.total_calls} chamadas previstas, "
+                       f"orçamento de {budget.calls:.0f})")
+            if not over_budget:
+                raise BudgetExceededError(
+                    f"Abortado: {message}. Aumente DSPY_BUDGET_REQUESTS/DSPY_BUDGET_MINUTES ou use --over-budget"
+                )
+            print(f"Aviso: {message}; executando mesmo assim (--over-budget)")
+
+        compile_settings = plan.compile_settings()
+        # Demos, instruções e scores dos trials são salvos a cada etapa em results/checkpoints/
+        checkpoint = OptimizerCheckpoint.for_run(
+            "mipro",
+            run_key(self.base_program, self.trainset, **compile_settings),
+            resume=resume,
         )
-        
+        self.compiled_program = checkpoint.load_program(self.base_program.deepcopy())
+
+        if self.compiled_program is None:
+            teleprompter = ResumableMIPROv2(
+                metric=self._metric,
+                prompt_model=dspy.settings.lm,
+                task_model=dspy.settings.lm,
+                auto=None,
+                num_candidates=plan.num_candidates,
+                num_threads=plan.num_threads,
+                verbose=False,
+                checkpoint=checkpoint,
+            )
+            # Como no auto do MIPROv2: com demos, metade dos candidatos são instruções
+            teleprompter.num_instruct_candidates = plan.num_instruct_candidates
+
+            # O MIPRO usa o trainset para criar os prompts e demonstrações
+            with metrics.phase("mipro_compile"):
+                self.compiled_program = teleprompter.compile(
+                    self.base_program,
+                    trainset=trainset,
+                    valset=valset,
+                    num_trials=plan.num_trials,
+                    minibatch=plan.minibatch,
+                    minibatch_size=plan.minibatch_size,
+                    minibatch_full_eval_steps=plan.minibatch_full_eval_steps,
+                    max_bootstrapped_demos=plan.max_bootstrapped_demos,
+                    max_labeled_demos=plan.max_labeled_demos,
+                )
+            checkpoint.save_program(self.compiled_program)
+
+        try:
+            self._evaluate_testset(testset)
+        finally:
+            print("\n--- Chamadas ao LM: previstas x realizadas ---")
+            report(plan.predicted_calls, actual_calls(MIPRO_PHASES), budget)
+
+    def _evaluate_testset(self, testset):
         # Avaliar no TESTSET (dados que o otimizador nunca viu)
         print("\n--- Avaliando no CONJUNTO DE TESTE (Inédito) ---")
-        evaluator = Evaluate(
-            devset=self.testset, # Aqui usamos o conjunto de teste separado no __init__
-            metric=self._metric,
-            num_threads=1,
-            display_progress=True,
-            display_table=False,
-        )
-        
-        test_accuracy = float(evaluator(self.compiled_program))
+        if is_sequential_mode():
+            # Para assim que o IC da acurácia estabiliza, economizando chamadas ao LM
+            evaluator = sequential_evaluator_from_env(self._metric)
+            with metrics.phase("mipro_evaluation"):
+                result = evaluator(self.compiled_program, testset)
+            print(f"\n Acurácia Final no Testset: {result.accuracy:.2%} "
+                  f"(IC [{result.ci_low:.2%}, {result.ci_high:.2%}], {result.num_examples} exemplos)\n")
+            log_sequential_result(
+                result,
+                phase="MIPROv2_evaluation",
+                metric_name="accuracy",
+                notes="Avaliação sequencial em testset separado",
+            )
+            return
+
+        # Mesmo engine das outras fases: exemplos já pontuados para este programa
+        # (inclusive em uma execução anterior) não chamam o LM de novo
+        engine = engine_from_env(self.compiled_program, self._metric, phase="MIPROv2_evaluation")
+        with metrics.phase("mipro_evaluation"):
+            records = engine.run(testset)
+        # Fração 0-1, como nas outras fases e no caminho sequencial
+        test_accuracy = sum(record["score"] for record in records) / len(records)
         print(f"\n Acurácia Final no Testset: {test_accuracy:.2%}\n")
         
-        self._log_final_results(test_accuracy)
+        self._log_final_results(test_accuracy, len(testset))
+        report_text_budget(self.compiled_program, testset, records, self._metric,
+                           phase="MIPROv2_evaluation", model_name=getattr(dspy.settings.lm, "model", "unknown"))
 
-    def _log_final_results(self, accuracy): 
+    def _log_final_results(self, accuracy, num_examples): 
         log_result(
             phase="MIPROv2_evaluation",
             metric_name="accuracy",
             metric_value=accuracy,
-            num_examples=len(self.testset),
-            model_name="gemini/gemini-1.5-flash", # Ajuste conforme seu setup
+            num_examples=num_examples,
+            model_name=getattr(dspy.settings.lm, "model", "unknown"),
             notes="Avaliação em testset separado"
         )
 
     def save_checkpoint(self, filename="sentiment_mipro_final.json"):
         if self.compiled_program:
+            RESULTS_DIR.mkdir(exist_ok=True)
             self.compiled_program.save(RESULTS_DIR / filename)
\ No newline at end of file
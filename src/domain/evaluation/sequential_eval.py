@@ -0,0 +1,145 @@
+import math
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import dspy
+
+from domain.evaluation.logger import log_result
+
+# Quantis da normal para os níveis de confiança mais comuns
+_Z_SCORES = {0.90: 1.6449, 0.95: 1.9600, 0.99: 2.5758}
+
+
+def wilson_interval(successes: int, n: int, confidence: float = 0.95) -> tuple[float, float]:
+    """
+    Intervalo de confiança de Wilson para uma proporção (acurácia).
+    Mais estável que o intervalo normal para n pequeno ou acurácia perto de 0/1.
+    """
+    if n == 0:
+        return 0.0, 1.0
+    z = _Z_SCORES.get(confidence, 1.96)
+    p = successes / n
+    denom = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denom
+    margin = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def stratified_order(examples, seed: int = 42) -> list[int]:
+    """
+    Ordena os índices de forma estratificada por `sentiment`: cada classe é
+    embaralhada e as classes são intercaladas proporcionalmente ao seu tamanho,
+    de modo que qualquer prefixo da ordem preserva a distribuição de classes.
+    """
+    rng = np.random.default_rng(seed)
+    by_class = {}
+    for idx, example in enumerate(examples):
+        by_class.setdefault(example.sentiment, []).append(idx)
+
+    keys, order = [], []
+    for indices in by_class.values():
+        shuffled = rng.permutation(indices)
+        # Posição relativa dentro da classe + jitter para desempatar entre classes
+        keys.extend(((np.arange(len(shuffled)) + rng.random(len(shuffled))) / len(shuffled)).tolist())
+        order.extend(shuffled.tolist())
+    return [order[i] for i in np.argsort(keys, kind="stable")]
+
+
+@dataclass
+class SequentialResult:
+    accuracy: float
+    ci_low: float
+    ci_high: float
+    num_examples: int
+    total_examples: int
+    stop_reason: str
+    confidence: float = 0.95
+
+    @property
+    def ci_width(self) -> float:
+        return self.ci_high - self.ci_low
+
+
+class SequentialEvaluator:
+    """
+    Avaliação sequencial com parada antecipada.
+
+    Percorre o devset em ordem estratificada e semeada, mantendo um intervalo
+    de confiança (Wilson) da acurácia. Para quando a largura do intervalo fica
+    abaixo de `ci_width` ou quando `max_requests` exemplos foram avaliados.
+    """
+
+    def __init__(
+        self,
+        metric,
+        ci_width: float = 0.10,
+        max_requests: int = None,
+        min_examples: int = 20,
+        confidence: float = 0.95,
+        seed: int = 42,
+    ):
+        self.metric = metric
+        self.ci_width = ci_width
+        self.max_requests = max_requests
+        self.min_examples = min_examples
+        self.confidence = confidence
+        self.seed = seed
+
+    def __call__(self, program, devset, verbose: bool = False) -> SequentialResult:
+        successes, n = 0, 0
+        low, high = 0.0, 1.0
+        stop_reason = "exhausted"
+
+        for idx in stratified_order(devset, self.seed):
+            if self.max_requests is not None and n >= self.max_requests:
+                stop_reason = "budget"
+                break
+
+            example = devset[idx]
+            prediction = program(**example.inputs())
+            successes += int(self.metric(example, prediction))
+            n += 1
+            low, high = wilson_interval(successes, n, self.confidence)
+
+            if verbose:
+                print(f"[{n}] acurácia={successes / n:.3f} IC=[{low:.3f}, {high:.3f}]")
+
+            if n >= self.min_examples and (high - low) <= self.ci_width:
+                stop_reason = "ci_width"
+                break
+
+        accuracy = successes / n if n else 0.0
+        return SequentialResult(accuracy, low, high, n, len(devset), stop_reason, self.confidence)
+
+
+def sequential_evaluator_from_env(metric) -> SequentialEvaluator:
+    """Cria o avaliador a partir de EVAL_CI_WIDTH / EVAL_MAX_REQUESTS / EVAL_MIN_EXAMPLES."""
+    max_requests = os.getenv("EVAL_MAX_REQUESTS")
+    return SequentialEvaluator(
+        metric=metric,
+        ci_width=float(os.getenv("EVAL_CI_WIDTH", "0.10")),
+        max_requests=int(max_requests) if max_requests else None,
+        min_examples=int(os.getenv("EVAL_MIN_EXAMPLES", "20")),
+    )
+
+
+def is_sequential_mode() -> bool:
+    return os.getenv("EVAL_MODE", "full").lower() == "sequential"
+
+
+def log_sequential_result(result: SequentialResult, phase: str, metric_name: str, notes: str = ""):
+    """Registra a acurácia junto com o intervalo e quantos exemplos foram usados."""
+    details = (
+        f"ci{round(result.confidence * 100)}=[{result.ci_low:.4f},{result.ci_high:.4f}] "
+        f"used={result.num_examples}/{result.total_examples} "
+        f"stop={result.stop_reason}"
+    )
+    log_result(
+        phase=phase,
+        metric_name=metric_name,
+        metric_value=result.accuracy,
+        num_examples=result.num_examples,
+        model_name=getattr(dspy.settings.lm, "model", "unknown"),
+        notes=f"{notes} {details}".strip(),
+    )
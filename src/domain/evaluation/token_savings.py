@@ -0,0 +1,94 @@
+import os
+
+from domain.evaluation.engine import engine_from_env
+from domain.evaluation.logger import log_result
+
+
+def _demo_texts(program) -> list[str]:
+    if getattr(program, "demo_retriever", None) is not None:
+        # Demos recuperadas por entrada: a lista fixa não é enviada
+        return []
+    return [
+        demo.text
+        for _, predictor in program.named_predictors()
+        for demo in predictor.demos
+        if "text" in demo
+    ]
+
+
+def compare_enabled() -> bool:
+    # A comparação reavalia exemplos sem o orçamento: chamadas fora do plano de cota
+    return os.getenv("TEXT_BUDGET_COMPARE", "false").lower() == "true"
+
+
+def report_text_budget(program, dataset, records, metric, phase: str, model_name: str) -> dict | None:
+    """
+    Economia de tokens e impacto na acurácia do orçamento de tokens do `program`.
+
+    A economia é medida sobre os reviews e demos do próprio dataset (com
+    demos recuperadas por entrada, só sobre os reviews). Com
+    TEXT_BUDGET_COMPARE=true também mede o impacto na acurácia: só os
+    exemplos cujo prompt o orçamento altera são avaliados de novo sem o
+    orçamento (todos, se alguma demo foi cortada ou se as demos são
+    recuperadas), já que nos demais a predição é a mesma. Os resultados vão
+    para o mesmo `log_result` da fase.
+    """
+    budget = getattr(program, "text_budget", None)
+    if budget is None or not records:
+        return None
+
+    demo_texts = _demo_texts(program)
+    stats = budget.measure([example.text for example in dataset], demo_texts)
+    print(
+        f"\nOrçamento de tokens ({budget.strategy}, {budget.max_tokens} por review, "
+        f"{budget.demo_max_tokens} por demo, tokenizer {budget.tokenizer.name}): "
+        f"{stats['truncated']}/{stats['calls']} reviews e {stats['demos_truncated']}/{len(demo_texts)} demos cortados | "
+        f"tokens de texto: {stats['original_tokens']} -> {stats['sent_tokens']} "
+        f"({stats['saved_fraction']:.1%} a menos)"
+    )
+    log_result(
+        phase=phase,
+        metric_name="prompt_tokens_saved",
+        metric_value=stats["saved_fraction"],
+        num_examples=stats["calls"],
+        model_name=model_name,
+        notes=f"{budget!r} original={stats['original_tokens']} sent={stats['sent_tokens']} "
+              f"truncated={stats['truncated']} demos_truncated={stats['demos_truncated']}",
+    )
+
+    if not compare_enabled():
+        return stats
+
+    if stats["demos_truncated"] or getattr(program, "demo_retriever", None) is not None:
+        affected = list(range(len(dataset)))
+    else:
+        affected = [i for i, example in enumerate(dataset) if budget.changes(example.text)]
+    scores = [record["score"] for record in records]
+    full_scores = list(scores)
+    if affected:
+        full_program = program.deepcopy()
+        full_program.text_budget = None
+        full_records = engine_from_env(full_program, metric, phase=f"{phase}_full_text").run(
+            [dataset[i] for i in affected]
+        )
+        for i, record in zip(affected, full_records):
+            full_scores[i] = record["score"]
+
+    accuracy = sum(scores) / len(scores)
+    full_accuracy = sum(full_scores) / len(full_scores)
+    changed = sum(scores[i] != full_scores[i] for i in affected)
+    stats.update(accuracy=accuracy, full_text_accuracy=full_accuracy, compared=len(affected), changed=changed)
+    print(
+        f"Acurácia com orçamento: {accuracy:.2%} | texto completo: {full_accuracy:.2%} "
+        f"(diferença {accuracy - full_accuracy:+.2%}; {changed} de {len(affected)} exemplos alterados mudaram de score)"
+    )
+    log_result(
+        phase=phase,
+        metric_name="accuracy_delta_text_budget",
+        metric_value=accuracy - full_accuracy,
+        num_examples=len(scores),
+        model_name=model_name,
+        notes=f"{budget!r} accuracy={accuracy:.4f} full_text={full_accuracy:.4f} "
+              f"compared={len(affected)} changed={changed}",
+    )
+    return stats
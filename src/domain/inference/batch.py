@@ -0,0 +1,385 @@
+import csv
+import io
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from domain.evaluation.engine import program_fingerprint
+from domain.module.preprocess import text_budget_from_env
+from domain.module.sentiment import SentimentClassifier, prediction_error
+
+# Coluna de texto procurada quando --text-column não é informado (a primeira é a do B2W)
+TEXT_COLUMNS = ("review_text", "text")
+
+OUTPUT_FIELDS = ("row", "id", "sentiment", "latency", "error")
+
+# Reviews do B2W podem passar do limite padrão de 128 KB por campo do módulo csv
+csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+
+
+def load_program(path) -> SentimentClassifier:
+    """
+    Carrega o programa otimizado salvo (instruções + demos) em um SentimentClassifier.
+    Com DEMO_RETRIEVAL_K, as demos salvas dão lugar às recuperadas do split de treino.
+    """
+    from domain.evaluation.sentiment_eval import demo_retriever
+
+    program = SentimentClassifier(text_budget=text_budget_from_env(), demo_retriever=demo_retriever())
+    program.load(str(path))
+    return program
+
+
+def iter_reviews(path, text_column: str = None, id_column: str = None):
+    """
+    Lê o CSV ou JSONL linha a linha e gera (número da linha, id, texto).
+    Sem `id_column`, o id é o número da linha (a partir de 0).
+    """
+    path = Path(path)
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.suffix.lower() in (".jsonl", ".ndjson"):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        for i, row in enumerate(rows):
+            if text_column is None:
+                text_column = next((c for c in TEXT_COLUMNS if c in row), None)
+                if text_column is None:
+                    raise ValueError(f"{path}: nenhuma coluna de texto ({', '.join(TEXT_COLUMNS)}); use --text-column")
+            text = row.get(text_column)
+            yield i, (row.get(id_column) if id_column else i), (str(text).strip() if text is not None else "")
+
+
+class _RowWriter:
+    """Escreve as linhas de saída (JSONL ou CSV, pela extensão) e controla o offset em bytes."""
+
+    def __init__(self, path: Path, offset: int = 0, include_text: bool = False):
+        self.fields = OUTPUT_FIELDS + (("text",) if include_text else ())
+        self.is_csv = path.suffix.lower() == ".csv"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, "r+b" if offset else "wb")
+        # Descarta o que foi escrito depois do último progresso gravado
+        self._file.truncate(offset)
+        self._file.seek(offset)
+        if self.is_csv and not offset:
+            self._write_csv(self.fields)
+
+    def _write_csv(self, values) -> None:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(values)
+        self._file.write(buffer.getvalue().encode("utf-8"))
+
+    def write(self, record: dict) -> None:
+        if self.is_csv:
+            self._write_csv([record.get(field, "") for field in self.fields])
+        else:
+            self._file.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    def flush(self) -> int:
+        """Grava em disco e retorna o offset atual."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _FailedRows:
+    """
+    Números das linhas cuja classificação falhou, um por linha, em ordem
+    crescente. Só recebe acréscimos; o offset gravado no progresso marca
+    até onde o arquivo vale (como o da saída).
+    """
+
+    def __init__(self, path: Path, offset: int = 0):
+        self._file = open(path, "r+b" if offset else "wb")
+        self._file.truncate(offset)
+        self._file.seek(offset)
+
+    def append(self, row: int) -> None:
+        self._file.write(f"{row}\n".encode("ascii"))
+
+    def flush(self) -> int:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self) -> None:
+        self._file.close()
+
+    @staticmethod
+    def read(path: Path, offset: int):
+        """Gera as linhas gravadas até `offset`, sem carregar o arquivo."""
+        if not offset:
+            return
+        consumed = 0
+        with open(path, "rb") as f:
+            for line in f:
+                consumed += len(line)
+                if consumed > offset:
+                    return
+                yield int(line)
+
+
+class BatchInference:
+    """
+    Classifica um arquivo de reviews com um programa carregado uma única vez.
+
+    Até `concurrency` reviews são classificados ao mesmo tempo (as threads
+    disputam o rate limiter instalado no LM) e no máximo `window` ficam em
+    memória: a entrada é lida conforme as vagas abrem e as saídas são
+    escritas na ordem da entrada, então a memória não depende do tamanho do
+    arquivo. As linhas cuja classificação falhou vão para `<saída>.failed`
+    e a cada `progress_every` linhas os offsets dos dois arquivos são
+    gravados em `<saída>.progress.json`. Com `resume=True` as linhas que
+    falharam são refeitas (a saída é reescrita registro a registro, com as
+    novas classificações) e a execução continua de onde parou (a entrada e
+    o programa precisam ser os mesmos).
+    """
+
+    def __init__(self, program, concurrency: int = 8, window: int = None, progress_every: int = 100,
+                 include_text: bool = False, latency_sample: int = 10000, seed: int = 0):
+        self.program = program
+        self.concurrency = concurrency
+        self.window = window or concurrency * 4
+        self.progress_every = progress_every
+        self.include_text = include_text
+        self.latency_sample = latency_sample
+        self._rng = random.Random(seed)
+
+    @staticmethod
+    def progress_path(output_path) -> Path:
+        output_path = Path(output_path)
+        return output_path.with_name(output_path.name + ".progress.json")
+
+    @staticmethod
+    def failed_path(output_path) -> Path:
+        output_path = Path(output_path)
+        return output_path.with_name(output_path.name + ".failed")
+
+    def _classify(self, text: str) -> tuple[str | None, float, str | None]:
+        if not text:
+            return None, 0.0, "texto vazio"
+        start = time.perf_counter()
+        try:
+            prediction = self.program(text=text)
+        except Exception as e:
+            return None, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+        # O classificador devolve "neutro" quando a chamada falha: vira erro, não rótulo
+        error = prediction_error(prediction)
+        if error is not None:
+            return None, time.perf_counter() - start, error
+        return prediction.sentiment, time.perf_counter() - start, None
+
+    def _load_progress(self, progress_path: Path, state: dict) -> dict:
+        if not progress_path.exists():
+            return {"rows": 0, "offset": 0, "failed_offset": 0}
+        with open(progress_path, encoding="utf-8") as f:
+            progress = json.load(f)
+        if progress.get("input") != state["input"] or progress.get("program") != state["program"]:
+            raise ValueError(
+                f"{progress_path} é de outra entrada ou de outro programa; rode sem --resume para recomeçar"
+            )
+        return progress
+
+    @staticmethod
+    def _save_progress(progress_path: Path, progress: dict) -> None:
+        tmp_path = progress_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(progress, f)
+        os.replace(tmp_path, progress_path)
+
+    @staticmethod
+    def _iter_output(output_path: Path):
+        """Gera os registros já gravados na saída, um a um."""
+        with open(output_path, encoding="utf-8", newline="") as f:
+            if output_path.suffix.lower() == ".csv":
+                yield from csv.DictReader(f)
+            else:
+                yield from (json.loads(line) for line in f if line.strip())
+
+    def _classify_in_order(self, pool, items):
+        """Classifica (linha, texto) com no máximo `window` pendentes e gera (linha, resultado) na ordem."""
+        pending = deque()
+        try:
+            for row, text in items:
+                pending.append((row, pool.submit(self._classify, text)))
+                if len(pending) >= self.window:
+                    row, future = pending.popleft()
+                    yield row, future.result()
+            while pending:
+                row, future = pending.popleft()
+                yield row, future.result()
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    def _retry_failed(self, input_path, output_path: Path, progress: dict, text_column: str = None,
+                      id_column: str = None) -> tuple[int, int]:
+        """
+        Reclassifica as linhas que falharam nas execuções anteriores e reescreve a
+        saída já gravada com os novos resultados. Entrada, saída e `.failed` estão
+        na ordem das linhas, então tudo é lido em paralelo, sem carregar nenhum
+        deles. Retorna (refeitas, recuperadas).
+        """
+        failed_path = self.failed_path(output_path)
+        failed = _FailedRows.read(failed_path, progress.get("failed_offset", 0))
+        target = next(failed, None)
+        if target is None:
+            return 0, 0
+
+        def failed_texts():
+            nonlocal target
+            for row, _, text in iter_reviews(input_path, text_column, id_column):
+                if target is None:
+                    return
+                if row == target:
+                    yield row, text
+                    target = next(failed, None)
+
+        # O que passou do último progresso gravado é descartado (e refeito depois)
+        with open(output_path, "r+b") as f:
+            f.truncate(progress["offset"])
+        # Mesma extensão da saída: o formato do _RowWriter vem dela
+        tmp_path = output_path.with_name(f"{output_path.stem}.tmp{output_path.suffix}")
+        tmp_failed_path = failed_path.with_name(failed_path.name + ".tmp")
+        writer = _RowWriter(tmp_path, include_text=self.include_text)
+        still_failed = _FailedRows(tmp_failed_path)
+        retried = recovered = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            results = self._classify_in_order(pool, failed_texts())
+            result = next(results, None)
+            for record in self._iter_output(output_path):
+                if result is not None and int(record["row"]) == result[0]:
+                    sentiment, latency, error = result[1]
+                    record.update(sentiment=sentiment, latency=round(latency, 4), error=error)
+                    retried += 1
+                    if error is None:
+                        recovered += 1
+                    else:
+                        still_failed.append(result[0])
+                    result = next(results, None)
+                writer.write(record)
+            results.close()
+        progress["offset"] = writer.flush()
+        progress["failed_offset"] = still_failed.flush()
+        writer.close()
+        still_failed.close()
+        os.replace(tmp_path, output_path)
+        os.replace(tmp_failed_path, failed_path)
+        return retried, recovered
+
+    def run(self, input_path, output_path, resume: bool = False, text_column: str = None,
+            id_column: str = None, limit: int = None) -> dict:
+        output_path = Path(output_path)
+        progress_path = self.progress_path(output_path)
+        progress = {
+            "input": str(Path(input_path).resolve()),
+            "program": program_fingerprint(self.program),
+            "rows": 0,
+            "offset": 0,
+            "failed_offset": 0,
+        }
+        retried = recovered = 0
+        if resume and output_path.exists():
+            progress.update(self._load_progress(progress_path, progress))
+            retried, recovered = self._retry_failed(input_path, output_path, progress, text_column, id_column)
+            if retried:
+                self._save_progress(progress_path, progress)
+                print(f"{recovered} de {retried} linhas que falharam antes foram reclassificadas")
+            print(f"Retomando a partir da linha {progress['rows']} de {input_path}")
+
+        skipped = progress["rows"]
+        labels, latencies = Counter(), []
+        classified = errors = 0
+        writer = _RowWriter(output_path, progress["offset"], self.include_text)
+        failed_rows = _FailedRows(self.failed_path(output_path), progress["failed_offset"])
+
+        def write(item, future):
+            nonlocal classified, errors
+            row, review_id, text = item
+            sentiment, latency, error = future.result()
+            record = {"row": row, "id": review_id, "sentiment": sentiment, "latency": round(latency, 4), "error": error}
+            if self.include_text:
+                record["text"] = text
+            writer.write(record)
+            classified += 1
+            labels[sentiment] += 1
+            errors += error is not None
+            if error is not None and text:
+                # Falha da chamada (não texto vazio): refeita no próximo --resume
+                failed_rows.append(row)
+            # Amostra de tamanho fixo (reservoir) para os percentis de latência
+            if error is None:
+                seen = classified - errors
+                if len(latencies) < self.latency_sample:
+                    latencies.append(latency)
+                else:
+                    slot = self._rng.randrange(seen)
+                    if slot < self.latency_sample:
+                        latencies[slot] = latency
+            progress["rows"] = row + 1
+            if progress["rows"] % self.progress_every == 0:
+                progress["offset"] = writer.flush()
+                progress["failed_offset"] = failed_rows.flush()
+                self._save_progress(progress_path, progress)
+
+        start = time.perf_counter()
+        pending = deque()
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                for item in iter_reviews(input_path, text_column, id_column):
+                    row, _, text = item
+                    if row < skipped:
+                        continue
+                    if limit is not None and row >= skipped + limit:
+                        break
+                    pending.append((item, pool.submit(self._classify, text)))
+                    # Escreve em ordem: espera a mais antiga só quando a janela enche
+                    while pending and (len(pending) >= self.window or pending[0][1].done()):
+                        write(*pending.popleft())
+                while pending:
+                    write(*pending.popleft())
+        finally:
+            for _, future in pending:
+                future.cancel()
+            progress["offset"] = writer.flush()
+            progress["failed_offset"] = failed_rows.flush()
+            writer.close()
+            failed_rows.close()
+            self._save_progress(progress_path, progress)
+
+        elapsed = time.perf_counter() - start
+        values = np.array(latencies, dtype=float)
+        summary = {
+            "rows": classified,
+            "resumed_from": skipped,
+            "retried": retried,
+            "recovered": recovered,
+            "errors": errors,
+            "seconds": elapsed,
+            "rows_per_second": classified / elapsed if elapsed else 0.0,
+            "labels": {str(label): count for label, count in labels.items()},
+        }
+        for q in (0.5, 0.95, 0.99):
+            summary[f"latency_p{int(q * 100)}"] = float(np.quantile(values, q)) if len(values) else 0.0
+        return summary
+
+
+def print_summary(summary: dict, output_path) -> None:
+    labels = ", ".join(f"{label}: {count}" for label, count in sorted(summary["labels"].items()))
+    print(
+        f"{summary['rows']} reviews classificados em {summary['seconds']:.1f}s "
+        f"({summary['rows_per_second']:.2f}/s; retomado da linha {summary['resumed_from']}, "
+        f"{summary['recovered']}/{summary['retried']} falhas anteriores recuperadas) | "
+        f"latência p50={summary['latency_p50']:.2f}s p95={summary['latency_p95']:.2f}s "
+        f"p99={summary['latency_p99']:.2f}s | erros {summary['errors']} | {labels}"
+    )
+    print(f"Saída em: {output_path}")
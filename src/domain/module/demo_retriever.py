@@ -0,0 +1,220 @@
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+
+import dspy
+import numpy as np
+
+from domain.dataset import cache
+from domain.module.local_model import HashedNgramVectorizer
+
+INDEX_VERSION = 1
+
+
+class DemoIndex:
+    """
+    Índice de similaridade (TF-IDF com hashing) sobre exemplos rotulados.
+
+    Os vetores são os do `HashedNgramVectorizer` (log1p + L2) reponderados
+    por IDF e normalizados de novo. O índice guarda as listas invertidas
+    (feature -> documentos, pesos): a busca só visita os documentos que
+    compartilham algum n-grama com a consulta, sem matriz densa. N-gramas
+    presentes em mais de `max_df` dos documentos ("produto", "de") ficam fora
+    das listas: têm IDF baixo e listas enormes, que dominariam o tempo da
+    busca. Os textos ficam em um único buffer UTF-8 e só os `k` escolhidos
+    são decodificados.
+    """
+
+    def __init__(self, idf: np.ndarray, postings_indptr: np.ndarray, postings_docs: np.ndarray,
+                 postings_data: np.ndarray, text_buffer: np.ndarray, text_offsets: np.ndarray,
+                 sentiment_codes: np.ndarray, labels: tuple[str, ...], key: str = ""):
+        self.vectorizer = HashedNgramVectorizer(n_features=len(idf))
+        self.idf = idf
+        self.postings_indptr = postings_indptr
+        self.postings_docs = postings_docs
+        self.postings_data = postings_data
+        self.text_buffer = text_buffer
+        self.text_offsets = text_offsets
+        self.sentiment_codes = sentiment_codes
+        self.labels = tuple(labels)
+        self.key = key
+
+    def __len__(self) -> int:
+        return len(self.sentiment_codes)
+
+    @classmethod
+    def build(cls, examples, n_features: int = 2 ** 18, max_df: float = 0.05, key: str = "") -> "DemoIndex":
+        texts = [example.text for example in examples]
+        sentiments = [example.sentiment for example in examples]
+        labels = tuple(sorted(set(sentiments)))
+        lookup = {label: i for i, label in enumerate(labels)}
+
+        vectorizer = HashedNgramVectorizer(n_features=n_features)
+        indptr, indices, data = vectorizer.transform(texts)
+        n_docs = len(texts)
+        document_frequency = np.bincount(indices, minlength=n_features)
+        idf = (np.log((1 + n_docs) / (1 + document_frequency)) + 1).astype(np.float32)
+
+        rows = np.repeat(np.arange(n_docs), np.diff(indptr))
+        data = data * idf[indices]
+        norms = np.sqrt(np.bincount(rows, weights=data.astype(np.float64) ** 2, minlength=n_docs))
+        data = (data / np.where(norms > 0, norms, 1)[rows]).astype(np.float32)
+
+        # CSR (documento -> features) para listas invertidas (feature -> documentos),
+        # sem as features comuns demais (a norma dos documentos já as inclui)
+        kept = document_frequency <= max(max_df * n_docs, 1)
+        mask = kept[indices]
+        indices, rows, data = indices[mask], rows[mask], data[mask]
+        order = np.argsort(indices, kind="stable")
+        postings_indptr = np.zeros(n_features + 1, dtype=np.int64)
+        np.cumsum(np.where(kept, document_frequency, 0), out=postings_indptr[1:])
+        text_buffer, text_offsets = cache.encode_strings(texts)
+        return cls(
+            idf,
+            postings_indptr,
+            rows[order].astype(np.int32),
+            data[order],
+            text_buffer,
+            text_offsets,
+            np.array([lookup[s] for s in sentiments], dtype=np.int8),
+            labels,
+            key,
+        )
+
+    def save(self, path) -> None:
+        cache.save_arrays(
+            Path(path),
+            idf=self.idf,
+            postings_indptr=self.postings_indptr,
+            postings_docs=self.postings_docs,
+            postings_data=self.postings_data,
+            text_buffer=self.text_buffer,
+            text_offsets=self.text_offsets,
+            sentiment_codes=self.sentiment_codes,
+            labels=np.array(self.labels),
+        )
+
+    @classmethod
+    def load(cls, path, key: str = "") -> "DemoIndex | None":
+        arrays = cache.load_arrays(Path(path))
+        if arrays is None:
+            return None
+        labels = tuple(arrays.pop("labels").tolist())
+        return cls(labels=labels, key=key, **arrays)
+
+    def text(self, i: int) -> str:
+        start, end = self.text_offsets[i], self.text_offsets[i + 1]
+        return self.text_buffer[start:end].tobytes().decode("utf-8")
+
+    def sentiment(self, i: int) -> str:
+        return self.labels[self.sentiment_codes[i]]
+
+    def search(self, text: str, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Índices e similaridades (cosseno) dos `k` exemplos mais próximos, do mais similar ao menos."""
+        _, features, weights = self.vectorizer.transform([text])
+        if not len(features) or not k:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        weights = weights * self.idf[features]
+        weights /= np.linalg.norm(weights) or 1.0
+
+        starts, ends = self.postings_indptr[features], self.postings_indptr[features + 1]
+        lengths = ends - starts
+        if not lengths.sum():
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        docs = self.postings_docs[positions]
+        scores = self.postings_data[positions] * np.repeat(weights, lengths)
+
+        # Soma por documento: ordenando os candidatos quando são poucos, com um
+        # vetor do tamanho do índice quando são muitos
+        if len(docs) * 8 < len(self):
+            candidates, inverse = np.unique(docs, return_inverse=True)
+            totals = np.bincount(inverse, weights=scores)
+        else:
+            totals = np.bincount(docs, weights=scores, minlength=len(self))
+            candidates = np.flatnonzero(totals)
+            totals = totals[candidates]
+        k = min(k, len(candidates))
+        top = np.argpartition(-totals, k - 1)[:k]
+        top = top[np.argsort(-totals[top], kind="stable")]
+        return candidates[top], totals[top].astype(np.float32)
+
+
+def trainset_key(trainset, n_features: int, max_df: float) -> str:
+    """Hash dos textos e rótulos do split (na ordem) e da configuração do índice."""
+    digest = hashlib.sha256(f"{INDEX_VERSION}\x1f{n_features}\x1f{max_df}".encode("utf-8"))
+    for example in trainset:
+        digest.update(f"\x1e{example.text}\x1f{example.sentiment}".encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+def load_or_build_index(trainset, cache_dir, n_features: int = 2 ** 18, max_df: float = 0.05) -> DemoIndex:
+    """Carrega o índice persistido para este split ou o constrói (uma vez) e salva em `cache_dir`."""
+    key = trainset_key(trainset, n_features, max_df)
+    path = Path(cache_dir) / f"demo_index_{key}.npz"
+    index = DemoIndex.load(path, key=key)
+    if index is not None:
+        print(f"Índice de demos carregado de {path} ({len(index)} exemplos)")
+        return index
+    start = time.perf_counter()
+    index = DemoIndex.build(trainset, n_features=n_features, max_df=max_df, key=key)
+    index.save(path)
+    print(f"Índice de demos construído em {time.perf_counter() - start:.1f}s ({len(index)} exemplos): {path}")
+    return index
+
+
+class DemoRetriever:
+    """
+    Seleciona, para cada entrada, os `k` exemplos rotulados mais similares
+    como demos (no lugar da lista fixa do predictor).
+
+    Conta as buscas e o tempo gasto nelas, para o resumo da avaliação.
+    """
+
+    def __init__(self, index: DemoIndex, k: int = 3):
+        self.index = index
+        self.k = k
+        self.lookups = 0
+        self.lookup_seconds = 0.0
+        self.max_lookup_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"DemoRetriever(k={self.k}, index={self.index.key!r})"
+
+    def __deepcopy__(self, memo):
+        # O índice é somente leitura: cópias do programa compartilham o retriever
+        return self
+
+    def __call__(self, text: str) -> list:
+        start = time.perf_counter()
+        ids, _ = self.index.search(text, self.k)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.lookups += 1
+            self.lookup_seconds += elapsed
+            self.max_lookup_seconds = max(self.max_lookup_seconds, elapsed)
+        return [
+            dspy.Example(text=self.index.text(i), sentiment=self.index.sentiment(i)).with_inputs("text")
+            for i in ids.tolist()
+        ]
+
+    def summary(self) -> str:
+        mean = self.lookup_seconds / self.lookups if self.lookups else 0.0
+        return (f"{self.k} demos por entrada (índice com {len(self.index)} exemplos) | "
+                f"{self.lookups} buscas, média {mean * 1000:.3f} ms, máximo {self.max_lookup_seconds * 1000:.3f} ms")
+
+
+def demo_retriever_from_env(load_trainset, cache_dir) -> DemoRetriever | None:
+    """
+    Retriever com DEMO_RETRIEVAL_K demos por entrada (desligado se ausente ou 0).
+    `load_trainset` só é chamado quando a recuperação está ligada.
+    """
+    k = int(os.getenv("DEMO_RETRIEVAL_K", "0") or 0)
+    if k <= 0:
+        return None
+    n_features = int(os.getenv("DEMO_RETRIEVAL_FEATURES", str(2 ** 18)))
+    max_df = float(os.getenv("DEMO_RETRIEVAL_MAX_DF", "0.05"))
+    return DemoRetriever(load_or_build_index(load_trainset(), cache_dir, n_features, max_df), k)
@@ -0,0 +1,146 @@
+import re
+import unicodedata
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> list[str]:
+    """Minúsculas, sem acentos, apenas palavras."""
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _TOKEN_RE.findall(text)
+
+
+class HashedNgramVectorizer:
+    """
+    Converte textos em vetores esparsos (CSR) de n-gramas de palavras com hashing.
+
+    Usa `zlib.crc32` (estável entre processos, ao contrário de `hash()`),
+    contagens log1p e normalização L2 por documento.
+    """
+
+    def __init__(self, n_features: int = 2 ** 18, ngram_range: tuple[int, int] = (1, 2)):
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+
+    def _features(self, text: str) -> list[int]:
+        tokens = tokenize(text)
+        low, high = self.ngram_range
+        grams = [
+            " ".join(tokens[i:i + n])
+            for n in range(low, high + 1)
+            for i in range(len(tokens) - n + 1)
+        ]
+        return [zlib.crc32(g.encode("utf-8")) % self.n_features for g in grams]
+
+    def transform(self, texts) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Retorna (indptr, indices, data) no formato CSR."""
+        indptr, indices, data = [0], [], []
+        for text in texts:
+            ids, counts = np.unique(self._features(text), return_counts=True)
+            values = np.log1p(counts.astype(np.float32))
+            norm = np.linalg.norm(values)
+            indices.extend(ids.tolist())
+            data.extend((values / norm if norm else values).tolist())
+            indptr.append(len(indices))
+        return (
+            np.asarray(indptr, dtype=np.int64),
+            np.asarray(indices, dtype=np.int64),
+            np.asarray(data, dtype=np.float32),
+        )
+
+
+class LocalSentimentModel:
+    """
+    Regressão logística multinomial em NumPy sobre n-gramas com hashing.
+
+    É um classificador barato (sub-milissegundo por review) usado na frente do
+    LLM: responde apenas quando a probabilidade da classe vencedora é alta.
+    """
+
+    def __init__(self, labels: tuple[str, ...], n_features: int = 2 ** 18, l2: float = 1e-6):
+        self.labels = tuple(labels)
+        self.vectorizer = HashedNgramVectorizer(n_features=n_features)
+        self.l2 = l2
+        self.weights = np.zeros((n_features, len(self.labels)), dtype=np.float32)
+        self.bias = np.zeros(len(self.labels), dtype=np.float32)
+
+    def _logits(self, indptr, indices, data) -> np.ndarray:
+        n_docs = len(indptr) - 1
+        contributions = self.weights[indices] * data[:, None]
+        rows = np.repeat(np.arange(n_docs), np.diff(indptr))
+        logits = np.zeros((n_docs, len(self.labels)), dtype=np.float32)
+        np.add.at(logits, rows, contributions)
+        return logits + self.bias
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        logits = logits - logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def fit(self, texts, labels, epochs: int = 5, batch_size: int = 256, learning_rate: float = 0.5, seed: int = 42):
+        """Treina com mini-batch SGD + Adagrad."""
+        lookup = {label: i for i, label in enumerate(self.labels)}
+        y = np.array([lookup[label] for label in labels], dtype=np.int64)
+        if len(y) == 0:
+            return self
+        indptr, indices, data = self.vectorizer.transform(texts)
+        rng = np.random.default_rng(seed)
+        grad_sq_w = np.full_like(self.weights, 1e-8)
+        grad_sq_b = np.full_like(self.bias, 1e-8)
+
+        for _ in range(epochs):
+            for batch in np.array_split(rng.permutation(len(y)), max(1, len(y) // batch_size)):
+                # Monta o sub-CSR do lote
+                starts, ends = indptr[batch], indptr[batch + 1]
+                nnz = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])
+                b_indptr = np.concatenate([[0], np.cumsum(ends - starts)])
+                b_indices, b_data = indices[nnz], data[nnz]
+
+                probs = self._softmax(self._logits(b_indptr, b_indices, b_data))
+                probs[np.arange(len(batch)), y[batch]] -= 1
+                probs /= len(batch)
+
+                rows = np.repeat(np.arange(len(batch)), np.diff(b_indptr))
+                grad_w = probs[rows] * b_data[:, None]
+                uniq, inverse = np.unique(b_indices, return_inverse=True)
+                grad_u = np.zeros((len(uniq), len(self.labels)), dtype=np.float32)
+                np.add.at(grad_u, inverse, grad_w)
+                grad_u += self.l2 * self.weights[uniq]
+
+                grad_sq_w[uniq] += grad_u ** 2
+                self.weights[uniq] -= learning_rate * grad_u / np.sqrt(grad_sq_w[uniq])
+                grad_b = probs.sum(axis=0)
+                grad_sq_b += grad_b ** 2
+                self.bias -= learning_rate * grad_b / np.sqrt(grad_sq_b)
+        return self
+
+    def predict_proba(self, texts) -> np.ndarray:
+        return self._softmax(self._logits(*self.vectorizer.transform(texts)))
+
+    def predict(self, texts) -> tuple[list[str], np.ndarray]:
+        """Retorna os rótulos previstos e a confiança (probabilidade máxima)."""
+        probs = self.predict_proba(texts)
+        return [self.labels[i] for i in probs.argmax(axis=1)], probs.max(axis=1)
+
+    def save(self, path) -> None:
+        np.savez(
+            Path(path),
+            weights=self.weights,
+            bias=self.bias,
+            labels=np.array(self.labels),
+            l2=np.array(self.l2),
+        )
+
+    @classmethod
+    def load(cls, path) -> "LocalSentimentModel":
+        with np.load(Path(path), allow_pickle=False) as data:
+            model = cls(tuple(data["labels"].tolist()), n_features=data["weights"].shape[0], l2=float(data["l2"]))
+            model.weights = data["weights"]
+            model.bias = data["bias"]
+        return model
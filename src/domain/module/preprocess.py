@@ -0,0 +1,142 @@
+import functools
+import os
+import re
+
+from utils.tokenizer import Tokenizer, get_tokenizer
+
+STRATEGIES = ("truncate", "head_tail", "compress")
+
+# Marca o trecho removido no meio do review (head_tail/compress)
+ELLIPSIS = " [...] "
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_REPEATED_CHAR_RE = re.compile(r"(\S)\1{3,}")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def compress_text(text: str) -> str:
+    """
+    Remove o que não ajuda a classificar: espaços repetidos, caracteres
+    repetidos ("!!!!!!" -> "!!!", "muuuuito" -> "muuuito") e frases repetidas.
+    """
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    text = _REPEATED_CHAR_RE.sub(r"\1\1\1", text)
+    seen, sentences = set(), []
+    for sentence in _SENTENCE_RE.split(text):
+        key = sentence.lower()
+        if key not in seen:
+            seen.add(key)
+            sentences.append(sentence)
+    return " ".join(sentences)
+
+
+class TextBudget:
+    """
+    Limita o texto de cada review (e de cada demo) a um orçamento de tokens.
+
+    Estratégias:
+    - "truncate": mantém o início do texto;
+    - "head_tail": mantém o início e o fim (a conclusão do review costuma
+      estar no final), com "[...]" no lugar do meio;
+    - "compress": limpa o texto com `compress_text` e, se ainda passar do
+      orçamento, aplica "head_tail".
+
+    O resultado é memoizado por texto: o mesmo review (ou demo) é contado e
+    cortado uma vez por execução, não a cada chamada ao LM.
+    """
+
+    def __init__(self, max_tokens: int, demo_max_tokens: int = None, strategy: str = "head_tail",
+                 tokenizer: Tokenizer = None, cache_size: int = 65536):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Estratégia de orçamento desconhecida: {strategy} (use {', '.join(STRATEGIES)})")
+        self.max_tokens = max_tokens
+        self.demo_max_tokens = demo_max_tokens or max_tokens
+        self.strategy = strategy
+        self.tokenizer = tokenizer if tokenizer is not None else get_tokenizer()
+        self._fit = functools.lru_cache(maxsize=cache_size)(self._fit_uncached)
+
+    def __repr__(self):
+        return (f"TextBudget(max_tokens={self.max_tokens}, demo_max_tokens={self.demo_max_tokens}, "
+                f"strategy={self.strategy!r}, tokenizer={self.tokenizer.model!r})")
+
+    def __deepcopy__(self, memo):
+        # Configuração imutável: cópias do programa (deepcopy do dspy) compartilham o cache
+        return self
+
+    def _head_tail(self, text: str, max_tokens: int) -> str:
+        budget = max_tokens - self.tokenizer.count(ELLIPSIS)
+        if budget < 2:
+            return self.tokenizer.head(text, max_tokens)
+        head_tokens = budget * 2 // 3
+        head = self.tokenizer.head(text, head_tokens).rstrip()
+        tail = self.tokenizer.tail(text, budget - head_tokens).lstrip()
+        return f"{head}{ELLIPSIS}{tail}"
+
+    def _fit_uncached(self, text: str, max_tokens: int) -> tuple[str, int, int]:
+        """(texto dentro do orçamento, tokens originais, tokens enviados)."""
+        original = self.tokenizer.count(text)
+        fitted = text
+        if self.strategy == "compress":
+            fitted = compress_text(text)
+        if self.tokenizer.count(fitted) > max_tokens:
+            if self.strategy == "truncate":
+                fitted = self.tokenizer.head(fitted, max_tokens)
+            else:
+                fitted = self._head_tail(fitted, max_tokens)
+        return fitted, original, self.tokenizer.count(fitted)
+
+    def __call__(self, text: str) -> str:
+        return self._fit(text, self.max_tokens)[0]
+
+    def demo_text(self, text: str) -> str:
+        return self._fit(text, self.demo_max_tokens)[0]
+
+    def demos(self, demos: list) -> list:
+        """Cópias das demos com o campo `text` dentro de `demo_max_tokens`."""
+        return [demo.copy(text=self.demo_text(demo.text)) if "text" in demo else demo for demo in demos]
+
+    def changes(self, text: str, demo: bool = False) -> bool:
+        """Se o orçamento altera este texto (ou seja, se a predição pode mudar)."""
+        fitted = self._fit(text, self.demo_max_tokens if demo else self.max_tokens)[0]
+        return fitted != text
+
+    def measure(self, texts, demo_texts=()) -> dict:
+        """
+        Tokens de review e de demos por chamada, com e sem o orçamento.
+        Cada chamada envia o review e todas as demos do predictor.
+        """
+        demo_stats = [self._fit(text, self.demo_max_tokens) for text in demo_texts]
+        demo_original = sum(original for _, original, _ in demo_stats)
+        demo_sent = sum(sent for _, _, sent in demo_stats)
+        calls = truncated = original = sent = 0
+        for text in texts:
+            fitted, text_original, text_sent = self._fit(text, self.max_tokens)
+            calls += 1
+            truncated += fitted != text
+            original += text_original + demo_original
+            sent += text_sent + demo_sent
+        return {
+            "calls": calls,
+            "truncated": truncated,
+            "demos_truncated": sum(fitted != text for (fitted, _, _), text in zip(demo_stats, demo_texts)),
+            "original_tokens": original,
+            "sent_tokens": sent,
+            "saved_fraction": (original - sent) / original if original else 0.0,
+        }
+
+
+def text_budget_from_env() -> TextBudget | None:
+    """
+    Orçamento a partir de TEXT_BUDGET_TOKENS (desligado se ausente),
+    TEXT_BUDGET_DEMO_TOKENS (padrão: o mesmo) e TEXT_BUDGET_STRATEGY
+    (truncate, head_tail ou compress; padrão head_tail).
+    """
+    max_tokens = os.getenv("TEXT_BUDGET_TOKENS")
+    if not max_tokens:
+        return None
+    demo_max_tokens = os.getenv("TEXT_BUDGET_DEMO_TOKENS")
+    return TextBudget(
+        int(max_tokens),
+        demo_max_tokens=int(demo_max_tokens) if demo_max_tokens else None,
+        strategy=os.getenv("TEXT_BUDGET_STRATEGY", "head_tail").lower(),
+    )
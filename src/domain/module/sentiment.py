@@ -1,10 +1,49 @@
 import dspy
-from domain.signature.sentiment import SentimentSignature
+import numpy as np
+from domain.module.demo_retriever import DemoRetriever
+from domain.module.local_model import LocalSentimentModel
+from domain.module.preprocess import TextBudget
+from domain.signature.sentiment import BatchSentimentSignature, SentimentSignature
+from utils.lm_cache import CacheMissError
+from utils.tokenizer import estimate_tokens
+
+VALID_SENTIMENTS = ("positivo", "negativo", "neutro")
+
+
+def fallback_prediction(error) -> dspy.Prediction:
+    """
+    "neutro" no lugar de uma predição que falhou, com o motivo em `error`:
+    quem guarda resultados (engine, inferência em lote) não deve tratá-la
+    como uma resposta do LM.
+    """
+    if isinstance(error, Exception):
+        error = f"{type(error).__name__}: {error}"
+    return dspy.Prediction(sentiment="neutro", error=str(error))
+
+
+def prediction_error(prediction) -> str | None:
+    """Motivo da falha, se a predição veio do fallback."""
+    return getattr(prediction, "error", None)
+
 
 class SentimentClassifier(dspy.Module):
-    def __init__(self):
+    def __init__(self, text_budget: TextBudget = None, demo_retriever: DemoRetriever = None):
         super().__init__()
         self.predict = dspy.Predict(SentimentSignature)
+        # Com orçamento, o review e as demos são cortados antes de montar o prompt
+        self.text_budget = text_budget
+        # Com retriever, as demos de cada chamada são os exemplos de treino mais
+        # similares ao review, no lugar da lista fixa de `predict.demos`
+        self.demo_retriever = demo_retriever
+
+    def _predict_inputs(self, text: str) -> dict:
+        inputs = {"text": text}
+        if self.demo_retriever is not None:
+            inputs["demos"] = self.demo_retriever(text)
+        if self.text_budget is not None:
+            inputs["text"] = self.text_budget(text)
+            inputs["demos"] = self.text_budget.demos(inputs.get("demos", self.predict.demos))
+        return inputs
 
     def forward(self, text: str = None, **kwargs):
         if text is None and 'text' in kwargs:
@@ -12,13 +51,159 @@ class SentimentClassifier(dspy.Module):
                        
         # Garantir que sempre retorna um Prediction válido
         try:
-            result = self.predict(text=text)
+            result = self.predict(**self._predict_inputs(text))
             # Validar se o resultado tem o atributo sentiment
             if not hasattr(result, 'sentiment'):
                 # Fallback: criar um Prediction manualmente
-                return dspy.Prediction(sentiment="neutro")
+                return fallback_prediction("resposta sem o campo sentiment")
             return result
+        except CacheMissError:
+            # Modo replay: um miss do cache interrompe a execução em vez de virar "neutro"
+            raise
         except Exception as e:
             print(f" Erro na predição: {e}")
             # Retornar prediction padrão em caso de erro
-            return dspy.Prediction(sentiment="neutro")
\ No newline at end of file
+            return fallback_prediction(e)
+
+    async def aforward(self, text: str = None, **kwargs):
+        """Versão assíncrona de `forward`, usada pela avaliação com asyncio."""
+        if text is None and 'text' in kwargs:
+            text = kwargs['text']
+
+        try:
+            result = await self.predict.acall(**self._predict_inputs(text))
+            if not hasattr(result, 'sentiment'):
+                return fallback_prediction("resposta sem o campo sentiment")
+            return result
+        except CacheMissError:
+            raise
+        except Exception as e:
+            print(f" Erro na predição: {e}")
+            return fallback_prediction(e)
+
+
+class BatchSentimentClassifier(dspy.Module):
+    """
+    Classifica até `batch_size` reviews por chamada ao LM.
+
+    Os reviews são agrupados respeitando `max_batch_tokens` e enviados com um
+    identificador cada; a resposta é um dicionário identificador -> sentimento.
+    Itens ausentes ou com rótulo inválido na resposta (ou o lote inteiro, se
+    a saída não puder ser lida) são reclassificados um a um pelo
+    `SentimentClassifier`.
+    """
+
+    def __init__(self, batch_size: int = 8, max_batch_tokens: int = 2000):
+        super().__init__()
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.predict = dspy.Predict(BatchSentimentSignature)
+        self.single = SentimentClassifier()
+        self.batch_calls = 0
+        self.fallback_calls = 0
+
+    def make_batches(self, texts: list[str]) -> list[list[int]]:
+        """Agrupa os índices dos textos em lotes limitados por quantidade e por tokens."""
+        batches, current, current_tokens = [], [], 0
+        for i, text in enumerate(texts):
+            tokens = estimate_tokens(text)
+            if current and (len(current) >= self.batch_size or current_tokens + tokens > self.max_batch_tokens):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    @staticmethod
+    def _parse_label(label) -> str | None:
+        label = str(label).strip().lower() if label is not None else ""
+        return label if label in VALID_SENTIMENTS else None
+
+    def _classify_batch(self, texts: list[str]) -> list[str | None]:
+        reviews = {str(i + 1): text for i, text in enumerate(texts)}
+        self.batch_calls += 1
+        try:
+            result = self.predict(reviews=reviews)
+            sentiments = getattr(result, "sentiments", None)
+            if not isinstance(sentiments, dict):
+                # Saída ilegível (lista, texto...): todos os itens vão para o fallback
+                return [None] * len(texts)
+            return [self._parse_label(sentiments.get(key)) for key in reviews]
+        except CacheMissError:
+            raise
+        except Exception as e:
+            print(f" Erro na predição em lote ({len(texts)} reviews): {e}")
+            return [None] * len(texts)
+
+    def forward(self, texts: list[str] = None, **kwargs):
+        if texts is None and 'texts' in kwargs:
+            texts = kwargs['texts']
+
+        sentiments = [None] * len(texts)
+        for batch in self.make_batches(texts):
+            labels = self._classify_batch([texts[i] for i in batch])
+            for i, label in zip(batch, labels):
+                sentiments[i] = label
+
+        # Fallback apenas para os itens afetados
+        for i, label in enumerate(sentiments):
+            if label is None:
+                self.fallback_calls += 1
+                sentiments[i] = self.single(text=texts[i]).sentiment
+        return dspy.Prediction(sentiments=sentiments)
+
+
+class CascadeSentimentClassifier(dspy.Module):
+    """
+    Cascata: um modelo local barato responde os casos óbvios e só os reviews
+    incertos (confiança < `threshold`) vão para o LLM.
+
+    Cada Prediction traz `source` ("local" ou "llm") e `confidence`, e o
+    módulo conta quantas respostas saíram de cada caminho.
+    """
+
+    def __init__(self, local_model: LocalSentimentModel, threshold: float = 0.9):
+        super().__init__()
+        self.local_model = local_model
+        self.threshold = threshold
+        self.llm = SentimentClassifier()
+        self.counts = {"local": 0, "llm": 0}
+
+    @classmethod
+    def from_trainset(cls, trainset, threshold: float = 0.9) -> "CascadeSentimentClassifier":
+        """Treina o modelo local no split de treino do B2WReviews."""
+        local_model = LocalSentimentModel(VALID_SENTIMENTS)
+        local_model.fit([ex.text for ex in trainset], [ex.sentiment for ex in trainset])
+        return cls(local_model, threshold)
+
+    def forward(self, text: str = None, **kwargs):
+        if text is None and 'text' in kwargs:
+            text = kwargs['text']
+
+        labels, confidence = self.local_model.predict([text])
+        if confidence[0] >= self.threshold:
+            self.counts["local"] += 1
+            return dspy.Prediction(sentiment=labels[0], source="local", confidence=float(confidence[0]))
+
+        self.counts["llm"] += 1
+        result = self.llm(text=text)
+        return dspy.Prediction(sentiment=result.sentiment, source="llm", confidence=float(confidence[0]))
+
+
+def choose_cascade_threshold(local_model: LocalSentimentModel, valset, target_accuracy: float = 0.95) -> float:
+    """
+    Menor limiar cujo acerto do modelo local, nos exemplos que ele responderia,
+    fica >= `target_accuracy` no valset (maximiza a fração sem LLM).
+    """
+    labels, confidence = local_model.predict([ex.text for ex in valset])
+    correct = np.array([label == ex.sentiment for label, ex in zip(labels, valset)])
+
+    # Ordenando por confiança, o acerto acumulado do prefixo é o acerto do caminho local
+    order = np.argsort(-confidence, kind="stable")
+    cumulative_accuracy = np.cumsum(correct[order]) / np.arange(1, len(order) + 1)
+    feasible = np.flatnonzero(cumulative_accuracy >= target_accuracy)
+    if not len(feasible):
+        return 1.0
+    return float(confidence[order][feasible.max()])
@@ -30,4 +30,15 @@ class SentimentClassifier(dspy.Module):
         except Exception as e:
             print(f" Erro na predição: {e}")
             # Retornar prediction padrão em caso de erro
-            return dspy.Prediction(sentiment="neutro")
\ No newline at end of file
+            return dspy.Prediction(sentiment="neutro")
+
+
+class BatchSentimentSignature(dspy.Signature):
+    """Classifica o sentimento de vários reviews em português de uma só vez"""
+
+    reviews: dict[str, str] = dspy.InputField(
+        desc="Reviews de clientes, indexados por um identificador"
+    )
+    sentiments: dict[str, str] = dspy.OutputField(
+        desc="Para cada identificador de review, classifique como: positivo, negativo ou neutro"
+    )
@@ -0,0 +1,322 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from utils.instrumentation import record_limiter_wait, record_retry
+from utils.rate_limiter import AsyncRateLimiter, RateLimitedLM, TokenBucketRateLimiter
+
+_DURATION_PART = re.compile(r"([\d.]+)(ms|h|m|s)")
+_RETRY_IN_MESSAGE = re.compile(r"retry(?:Delay|[ _-]?after| in)[\"'\s:=]*([\d.]+)\s*s", re.IGNORECASE)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Detecta 429/quota pelo status HTTP; o texto da mensagem é só o último recurso."""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status == 429:
+        return True
+    error_msg = str(error)
+    return (
+        "429" in error_msg or
+        "quota" in error_msg.lower() or
+        "RESOURCE_EXHAUSTED" in error_msg or
+        "RateLimitError" in type(error).__name__
+    )
+
+
+def parse_duration(value) -> float | None:
+    """Converte "20", "1.5s", "6m0s", "250ms" ou uma data HTTP em segundos."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    parts = _DURATION_PART.findall(value)
+    if parts:
+        scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(number) * scale[unit] for number, unit in parts)
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def normalize_headers(headers) -> dict[str, str]:
+    """Minúsculas e sem o prefixo "llm_provider-" que o litellm adiciona."""
+    if not headers:
+        return {}
+    return {str(k).lower().removeprefix("llm_provider-"): v for k, v in dict(headers).items()}
+
+
+def headers_from_response(response) -> dict[str, str]:
+    hidden = getattr(response, "_hidden_params", None) or {}
+    return normalize_headers(hidden.get("additional_headers"))
+
+
+def headers_from_error(error: Exception) -> dict[str, str]:
+    headers = getattr(error, "litellm_response_headers", None)
+    if headers is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+    return normalize_headers(headers)
+
+
+def retry_after_seconds(error: Exception) -> float | None:
+    """Lê `Retry-After` dos headers ou o `retryDelay` que o Gemini manda no corpo do erro."""
+    headers = headers_from_error(error)
+    for name in ("retry-after-ms", "retry-after", "x-ratelimit-reset-requests"):
+        if name in headers:
+            seconds = parse_duration(headers[name])
+            if seconds is not None:
+                return seconds / 1000 if name == "retry-after-ms" else seconds
+    match = _RETRY_IN_MESSAGE.search(str(error))
+    return float(match.group(1)) if match else None
+
+
+def _wake(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class AsyncWaiters:
+    """
+    Corrotinas à espera de um aviso que pode vir de qualquer thread.
+
+    Cada uma deixa um future no seu event loop (`add`); `notify_all` os
+    resolve via `call_soon_threadsafe`. Quem usa protege as chamadas com o
+    próprio lock, o mesmo da condição que as threads aguardam.
+    """
+
+    def __init__(self):
+        self._waiters = []
+
+    def add(self) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append((loop, waiter))
+        return waiter
+
+    def notify_all(self) -> None:
+        for loop, waiter in self._waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_wake, waiter)
+        self._waiters.clear()
+
+
+class AdaptiveConcurrency:
+    """
+    Semáforo cujo limite pode ser alterado em tempo de execução.
+
+    Compartilhado por threads (`acquire`) e corrotinas (`acquire_async`):
+    cada corrotina em espera deixa um future que `release`/`set_limit`
+    resolvem no event loop dela, sem polling.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._async_waiters = AsyncWaiters()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.in_flight >= self.limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    async def acquire_async(self) -> None:
+        """Como `acquire`, mas aguarda a vaga sem bloquear o event loop."""
+        while True:
+            with self._cond:
+                if self.in_flight < self.limit:
+                    self.in_flight += 1
+                    return
+                waiter = self._async_waiters.add()
+            await waiter
+
+    def _notify(self) -> None:
+        # Chamado com o lock: acorda threads e corrotinas para disputarem as vagas
+        self._cond.notify_all()
+        self._async_waiters.notify_all()
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._notify()
+
+    def set_limit(self, limit: int) -> None:
+        with self._cond:
+            self.limit = limit
+            self._notify()
+
+
+class AdaptiveRateController:
+    """
+    Controle AIMD (additive increase / multiplicative decrease) da taxa e da
+    concorrência sobre um `TokenBucketRateLimiter`.
+
+    - Sucesso: a taxa cresce `increase_step` requisições/janela e a concorrência
+      +1 a cada rodada completa de sucessos.
+    - 429: multiplica a taxa e a concorrência por `decrease_factor` e pausa
+      o balde até o `Retry-After` informado pelo provedor.
+    - Headers `x-ratelimit-remaining/limit/reset-requests` limitam a taxa ao
+      que o provedor diz estar disponível.
+    """
+
+    def __init__(
+        self,
+        limiter: TokenBucketRateLimiter,
+        min_requests: float = 1,
+        max_requests: float = None,
+        increase_step: float = 1,
+        decrease_factor: float = 0.5,
+        max_concurrency: int = 8,
+    ):
+        self.limiter = limiter
+        self.window_seconds = limiter.window_seconds
+        self.min_requests = min_requests
+        self.max_requests = max_requests
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.max_concurrency = max_concurrency
+        self.concurrency = AdaptiveConcurrency(1)
+        self.rate_limited_count = 0
+        self._concurrency_credit = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def _bucket(self):
+        return self.limiter.buckets["requests"]
+
+    @property
+    def current_limit(self) -> dict:
+        """Taxa e concorrência efetivas no momento."""
+        return {
+            "requests_per_window": round(self._bucket.rate * self.window_seconds, 3),
+            "window_seconds": self.window_seconds,
+            "concurrency": self.concurrency.limit,
+            "rate_limited_count": self.rate_limited_count,
+        }
+
+    def _set_requests_per_window(self, requests: float) -> None:
+        upper = self.max_requests if self.max_requests is not None else requests
+        requests = max(self.min_requests, min(upper, requests))
+        with self.limiter.lock:
+            bucket = self._bucket
+            bucket._refill(time.monotonic())
+            bucket.rate = requests / self.window_seconds
+
+    def on_success(self, headers: dict = None) -> None:
+        with self._lock:
+            # Como no TCP: cresce `increase_step` a cada janela cheia de sucessos
+            requests = self._bucket.rate * self.window_seconds
+            requests += self.increase_step / max(requests, 1.0)
+            quota = self._quota_from_headers(headers or {})
+            if quota is not None:
+                requests = min(requests, quota)
+            self._set_requests_per_window(requests)
+
+            self._concurrency_credit += 1 / self.concurrency.limit
+            if self._concurrency_credit >= 1:
+                self._concurrency_credit = 0.0
+                self.concurrency.set_limit(min(self.max_concurrency, self.concurrency.limit + 1))
+
+    def on_rate_limited(self, retry_after: float = None) -> None:
+        with self._lock:
+            self.rate_limited_count += 1
+            self._set_requests_per_window(self._bucket.rate * self.window_seconds * self.decrease_factor)
+            self.concurrency.set_limit(max(1, int(self.concurrency.limit * self.decrease_factor)))
+            self._concurrency_credit = 0.0
+            if retry_after:
+                # Ninguém usa o balde antes do fim do Retry-After
+                with self.limiter.lock:
+                    bucket = self._bucket
+                    bucket._refill(time.monotonic())
+                    bucket.tokens = min(bucket.tokens, -retry_after * bucket.rate)
+
+    def _quota_from_headers(self, headers: dict) -> float | None:
+        """Converte os headers de cota em requisições por janela, se presentes."""
+        remaining = headers.get("x-ratelimit-remaining-requests")
+        reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+        if remaining is not None and reset:
+            return float(remaining) / reset * self.window_seconds
+        return None
+
+    def backoff_delay(self, attempt: int, retry_after: float = None, base: float = 2.0, cap: float = 120.0) -> float:
+        """Espera antes do retry: Retry-After (se houver) + jitter, senão backoff exponencial com full jitter."""
+        if retry_after is not None:
+            return retry_after + random.uniform(0, base)
+        return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class AdaptiveRateLimitedLM(RateLimitedLM):
+    """
+    `RateLimitedLM` que ajusta taxa e concorrência pelo `AdaptiveRateController`
+    e refaz a chamada após 429 respeitando o `Retry-After`.
+    """
+
+    def __init__(self, lm, limiter: TokenBucketRateLimiter, controller: AdaptiveRateController = None, max_retries: int = 5):
+        super().__init__(lm, limiter)
+        self.controller = controller if controller is not None else AdaptiveRateController(limiter)
+        self.max_retries = max_retries
+
+    @property
+    def current_limit(self) -> dict:
+        return self.controller.current_limit
+
+    def _handle_rate_limit(self, error: Exception, attempt: int) -> float:
+        if not is_rate_limit_error(error) or attempt == self.max_retries:
+            raise error
+        retry_after = retry_after_seconds(error)
+        self.controller.on_rate_limited(retry_after)
+        delay = self.controller.backoff_delay(attempt, retry_after)
+        record_retry(delay)
+        print(f"\n Tentativa {attempt}/{self.max_retries}: Rate limit detectado. "
+              f"Aguardando {delay:.1f}s (limite atual: {self.current_limit})")
+        return delay
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        costs = self._costs(prompt, messages, **kwargs)
+        for attempt in range(1, self.max_retries + 1):
+            self.controller.concurrency.acquire()
+            try:
+                record_limiter_wait(self._limiter.wait_if_needed(**costs))
+                response = self._lm.forward(prompt=prompt, messages=messages, **kwargs)
+            except Exception as e:
+                delay = self._handle_rate_limit(e, attempt)
+            else:
+                self.controller.on_success(headers_from_response(response))
+                self._record_usage(response, costs)
+                return response
+            finally:
+                self.controller.concurrency.release()
+            time.sleep(delay)
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        costs = self._costs(prompt, messages, **kwargs)
+        for attempt in range(1, self.max_retries + 1):
+            await self.controller.concurrency.acquire_async()
+            try:
+                record_limiter_wait(await AsyncRateLimiter(self._limiter).wait_if_needed(**costs))
+                response = await self._lm.aforward(prompt=prompt, messages=messages, **kwargs)
+            except Exception as e:
+                delay = self._handle_rate_limit(e, attempt)
+            else:
+                self.controller.on_success(headers_from_response(response))
+                self._record_usage(response, costs)
+                return response
+            finally:
+                self.controller.concurrency.release()
+            await asyncio.sleep(delay)
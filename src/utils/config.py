@@ -1,6 +1,72 @@
 import dspy
 import os
-from utils.rate_limiter import RateLimitedLM, gemini_rate_limiter
+from utils.instrumentation import InstrumentedLM, metrics_enabled
+from utils.lm_cache import CachedLM, cache_from_env
+from utils.rate_limiter import RateLimitedLM, TokenBucketRateLimiter, get_default_limiter
+
+
+def _rate_limited(llm):
+    """Envolve o LM no rate limiter; com DSPY_API_ADAPTIVE=true a taxa se ajusta pelos 429."""
+    limiter = get_default_limiter()
+    adaptive = os.getenv("DSPY_API_ADAPTIVE", "false").lower() == "true"
+    if adaptive and isinstance(limiter, TokenBucketRateLimiter):
+        from utils.adaptive_limiter import AdaptiveRateController, AdaptiveRateLimitedLM
+
+        max_req = os.getenv("DSPY_API_ADAPTIVE_MAX_REQ")
+        controller = AdaptiveRateController(
+            limiter,
+            max_requests=float(max_req) if max_req else None,
+            max_concurrency=int(os.getenv("DSPY_API_MAX_CONCURRENCY", "8")),
+        )
+        return AdaptiveRateLimitedLM(llm, limiter, controller)
+    return RateLimitedLM(llm, limiter)
+
+def _ollama_lm():
+    return dspy.LM(
+        model="ollama/qwen2.5:0.5b",
+        chat=True,
+        max_tokens=256,
+        local_mode=True
+    )
+
+def _gemini_lm():
+    return dspy.LM(
+        model="gemini/gemini-3-flash-preview",
+        api_key=os.getenv("GOOGLE_API_KEY"),
+        chat=True,
+        max_tokens=2048
+    )
+
+def _openrouter_lm():
+    return dspy.LM(
+        model="openrouter/liquid/lfm-2.5-1.2b-instruct:free",
+        api_key=os.getenv("OPENROUTER_API_KEY"),
+        chat=True,
+        max_tokens=256
+    )
+
+# Backends disponíveis: (fábrica do LM, se é remoto e precisa de rate limiter)
+BACKENDS = {
+    "ollama": (_ollama_lm, False),
+    "gemini": (_gemini_lm, True),
+    "openrouter": (_openrouter_lm, True),
+}
+
+def _lm_pool(names):
+    """
+    Pool com vários backends ao mesmo tempo (DSPY_LM_POOL=gemini,openrouter).
+    Cada um tem limiter e concorrência próprios; DSPY_LM_POOL_ROUTING escolhe
+    entre "least_loaded" (padrão) e "weighted".
+    """
+    from utils.lm_pool import LMPool, backend_from_env
+
+    backends = []
+    for name in names:
+        if name not in BACKENDS:
+            raise ValueError(f"Backend desconhecido em DSPY_LM_POOL: {name}")
+        factory, remote = BACKENDS[name]
+        backends.append(backend_from_env(name, factory(), remote=remote))
+    return LMPool(backends, routing=os.getenv("DSPY_LM_POOL_ROUTING", "least_loaded").lower())
 
 class LLMConfig:
     _instance = None
@@ -12,31 +78,33 @@ class LLMConfig:
             
             gemini_api_key = os.getenv("GOOGLE_API_KEY")
             llm_local_mode = os.getenv("DSPY_AI_LOCAL_MODE").lower()
-            if llm_local_mode == "true":
-                llm = dspy.LM(
-                    model="ollama/qwen2.5:0.5b",
-                    chat=True,
-                    max_tokens=256,
-                    local_mode=True
-                )
+            pool_backends = [name.strip().lower() for name in os.getenv("DSPY_LM_POOL", "").split(",") if name.strip()]
+            if pool_backends:
+                llm = _lm_pool(pool_backends)
+                print(f"Usando pool de modelos: {', '.join(pool_backends)} (roteamento {llm.routing}).")
+            elif llm_local_mode == "true":
+                llm = _ollama_lm()
                 print("Usando modelo local (Ollama GLM4).")
             elif gemini_api_key:
-                llm = dspy.LM(
-                    model="gemini/gemini-3-flash-preview",
-                    api_key=gemini_api_key,
-                    chat=True,
-                    max_tokens=2048
-                )
+                llm = _gemini_lm()
+                # Cota remota: todas as chamadas passam pelo rate limiter compartilhado
+                llm = _rate_limited(llm)
                 print("Usando modelo remoto (Google Gemini).")
             else:
-                llm = dspy.LM(
-                    model="openrouter/liquid/lfm-2.5-1.2b-instruct:free",
-                    api_key=os.getenv("OPENROUTER_API_KEY"),
-                    chat=True,
-                    max_tokens=256
-                )
+                llm = _openrouter_lm()
+                llm = _rate_limited(llm)
                 print("Usando modelo remoto (Liquid LFM 2.5).")
             
+            # Cache persistente de respostas: camada mais externa, hits não gastam cota
+            lm_cache = cache_from_env()
+            if lm_cache is not None:
+                llm = CachedLM(llm, lm_cache)
+                print(f"Cache de respostas do LM: {lm_cache.path} (modo {lm_cache.mode})")
+
+            # Métricas por chamada (latência, tokens, espera no limiter, retries, cache hits)
+            if metrics_enabled():
+                llm = InstrumentedLM(llm)
+
             print(f"--- Inicializando conexão ---")
         
             dspy.settings.configure(lm=llm)
@@ -49,6 +117,9 @@ def setup_llm():
     return LLMConfig.get_instance()
 
 def get_data_path():
+    # B2W_DATA_PATH permite apontar para outro CSV (ex.: dataset sintético dos benchmarks)
+    if os.getenv("B2W_DATA_PATH"):
+        return os.getenv("B2W_DATA_PATH")
     # The path to the src directory
     src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     return os.path.join(src_dir, 'domain', 'dataset', 'data', 'b2w_reviews.csv')
\ No newline at end of file
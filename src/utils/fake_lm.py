@@ -0,0 +1,148 @@
+import asyncio
+import copy
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+
+import dspy
+import litellm
+from litellm import ModelResponse
+
+# O último campo de entrada é seguido pela instrução "Respond with ..." do ChatAdapter
+_FIELD_RE = re.compile(r"\[\[ ## (\w+) ## \]\]\n(.*?)(?=\n\n\[\[ ## |\n\nRespond with |\Z)", re.DOTALL)
+_OUTPUT_FIELDS_RE = re.compile(r"\d+\. `(\w+)`")
+
+DEFAULT_LABELS = ("negativo", "neutro", "positivo")
+
+
+def _uniform(*parts) -> float:
+    """Número em [0, 1) derivado por hash: o mesmo conteúdo sempre gera o mesmo valor."""
+    digest = hashlib.sha256("\x1f".join(map(str, parts)).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+
+class FakeSentimentLM(dspy.BaseLM):
+    """
+    LM local e determinístico para medir o pipeline sem gastar cota.
+
+    Responde no formato do ChatAdapter para qualquer assinatura: `sentiment`
+    recebe o rótulo verdadeiro (de `labels_by_text`) com probabilidade
+    `accuracy` e um rótulo errado caso contrário; `sentiments` (lotes) faz o
+    mesmo para cada review; os demais campos recebem um texto fixo.
+
+    A latência segue uma log-normal com mediana `latency` e dispersão
+    `latency_sigma`, e uma fração `rate_limit_rate` das chamadas gera
+    `litellm.RateLimitError` (429). Tudo é derivado por hash de `seed` +
+    conteúdo da chamada (+ número da tentativa), então os resultados não
+    dependem da ordem das threads.
+    """
+
+    def __init__(self, labels_by_text: dict[str, str] = None, accuracy: float = 0.8, latency: float = 0.05,
+                 latency_sigma: float = 0.5, rate_limit_rate: float = 0.0, seed: int = 0,
+                 labels: tuple[str, ...] = DEFAULT_LABELS, model: str = "fake/sentiment"):
+        super().__init__(model=model, model_type="chat", temperature=0.0, max_tokens=256)
+        self.labels_by_text = labels_by_text or {}
+        self.accuracy = accuracy
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.rate_limit_rate = rate_limit_rate
+        self.seed = seed
+        self.labels = tuple(labels)
+        self.stats = {"calls": 0, "rate_limited": 0}
+        self._attempts = {}
+        self._lock = threading.Lock()
+
+    def __deepcopy__(self, memo):
+        # `lm.copy()` (usado pelos otimizadores) compartilha contadores e tentativas com o original
+        clone = copy.copy(self)
+        clone.kwargs = dict(self.kwargs)
+        clone.history = []
+        return clone
+
+    @property
+    def calls(self) -> int:
+        return self.stats["calls"]
+
+    @property
+    def rate_limited(self) -> int:
+        return self.stats["rate_limited"]
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.stats.update(calls=0, rate_limited=0)
+
+    def _label_for(self, text: str) -> str:
+        truth = self.labels_by_text.get(text)
+        if truth is None:
+            return self.labels[int(_uniform(self.seed, "label", text) * len(self.labels))]
+        if _uniform(self.seed, "correct", text) < self.accuracy:
+            return truth
+        wrong = [label for label in self.labels if label != truth]
+        return wrong[int(_uniform(self.seed, "wrong", text) * len(wrong))]
+
+    def _field_value(self, name: str, inputs: dict):
+        if name == "sentiment":
+            return self._label_for(inputs.get("text", "").strip())
+        if name == "sentiments":
+            try:
+                reviews = json.loads(inputs.get("reviews", "{}"))
+            except ValueError:
+                reviews = {}
+            return json.dumps({key: self._label_for(str(text).strip()) for key, text in reviews.items()})
+        return f"Resposta simulada para {name}."
+
+    def _latency(self, key: str, attempt: int) -> float:
+        if self.latency <= 0:
+            return 0.0
+        # Box-Muller com uniformes derivados por hash
+        u1 = max(_uniform(self.seed, "lat1", key, attempt), 1e-12)
+        u2 = _uniform(self.seed, "lat2", key, attempt)
+        z = math.sqrt(-2 * math.log(u1)) * math.cos(2 * math.pi * u2)
+        return self.latency * math.exp(self.latency_sigma * z)
+
+    def _register(self, prompt, messages):
+        messages = messages or [{"role": "user", "content": prompt or ""}]
+        key = hashlib.sha256(json.dumps(messages, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        with self._lock:
+            self.stats["calls"] += 1
+            attempt = self._attempts.get(key, 0)
+            self._attempts[key] = attempt + 1
+        return key, attempt, messages
+
+    def _build(self, key, attempt, messages):
+        if _uniform(self.seed, "429", key, attempt) < self.rate_limit_rate:
+            with self._lock:
+                self.stats["rate_limited"] += 1
+            raise litellm.RateLimitError("Quota exceeded (simulada). retryDelay: 1s", llm_provider="fake", model=self.model)
+
+        system = next((m["content"] for m in messages if m["role"] == "system"), "")
+        section = system.split("Your output fields are:")[-1].split("All interactions")[0]
+        outputs = _OUTPUT_FIELDS_RE.findall(section) or ["sentiment"]
+        inputs = dict(_FIELD_RE.findall(str(messages[-1]["content"])))
+
+        content = "".join(f"[[ ## {name} ## ]]\n{self._field_value(name, inputs)}\n\n" for name in outputs)
+        content += "[[ ## completed ## ]]"
+        prompt_tokens = sum(len(str(m["content"])) for m in messages) // 4 + 1
+        completion_tokens = len(content) // 4 + 1
+        return ModelResponse(
+            model=self.model,
+            choices=[{"message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            usage={
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        )
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        key, attempt, messages = self._register(prompt, messages)
+        time.sleep(self._latency(key, attempt))
+        return self._build(key, attempt, messages)
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        key, attempt, messages = self._register(prompt, messages)
+        await asyncio.sleep(self._latency(key, attempt))
+        return self._build(key, attempt, messages)
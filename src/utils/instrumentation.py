@@ -0,0 +1,210 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+from utils.lm_wrapper import DelegatingLM
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Acumulador da chamada em andamento; cada thread/tarefa asyncio tem o seu
+_current_call = contextvars.ContextVar("dspy_lm_call", default=None)
+
+
+def record_limiter_wait(seconds: float) -> float:
+    """Soma o tempo de espera no rate limiter à chamada em andamento (se instrumentada)."""
+    call = _current_call.get()
+    if call is not None and seconds:
+        call["limiter_wait"] += seconds
+    return seconds
+
+
+def record_retry(backoff: float = 0.0) -> None:
+    """Conta um retry (429 ou failover) e o tempo de backoff antes dele."""
+    call = _current_call.get()
+    if call is not None:
+        call["retries"] += 1
+        call["backoff_wait"] += backoff
+
+
+class Metrics:
+    """
+    Registro thread-safe das chamadas ao LM, agrupadas por fase.
+
+    Ao fim de cada fase (`with metrics.phase("evaluation"):`) imprime
+    p50/p95/p99 de latência e espera no limiter, grava as chamadas em JSONL
+    e reescreve um textfile no formato do Prometheus (node_exporter).
+    """
+
+    def __init__(self, output_dir=None):
+        self.output_dir = Path(output_dir or os.getenv("DSPY_METRICS_DIR", "results/metrics"))
+        self.records: list[dict] = []
+        self.phase_durations: dict[str, float] = {}
+        self.current_phase = "default"
+        self._exported = 0
+        self._lock = threading.Lock()
+
+    def add(self, record: dict) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def phase_records(self, phase: str) -> list[dict]:
+        with self._lock:
+            return [r for r in self.records if r["phase"] == phase]
+
+    @contextmanager
+    def phase(self, name: str):
+        previous, self.current_phase = self.current_phase, name
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.phase_durations[name] = self.phase_durations.get(name, 0.0) + time.perf_counter() - start
+            self.current_phase = previous
+            self.report(name)
+            self.export()
+
+    def summary(self, phase: str) -> dict:
+        records = self.phase_records(phase)
+        summary = {
+            "phase": phase,
+            "calls": len(records),
+            "duration": self.phase_durations.get(phase, 0.0),
+            "prompt_tokens": sum(r["prompt_tokens"] for r in records),
+            "completion_tokens": sum(r["completion_tokens"] for r in records),
+            "retries": sum(r["retries"] for r in records),
+            "cache_hits": sum(r["cache_hit"] for r in records),
+            "errors": sum(r["error"] is not None for r in records),
+        }
+        for field in ("latency", "limiter_wait"):
+            values = np.array([r[field] for r in records], dtype=float)
+            summary[f"{field}_sum"] = float(values.sum()) if len(values) else 0.0
+            for q in QUANTILES:
+                summary[f"{field}_p{int(q * 100)}"] = float(np.quantile(values, q)) if len(values) else 0.0
+        return summary
+
+    def report(self, phase: str) -> None:
+        s = self.summary(phase)
+        if not s["calls"]:
+            return
+        print(
+            f"[métricas] {phase}: {s['calls']} chamadas em {s['duration']:.1f}s | "
+            f"latência p50={s['latency_p50']:.2f}s p95={s['latency_p95']:.2f}s p99={s['latency_p99']:.2f}s | "
+            f"espera no limiter p50={s['limiter_wait_p50']:.2f}s p95={s['limiter_wait_p95']:.2f}s "
+            f"p99={s['limiter_wait_p99']:.2f}s (total {s['limiter_wait_sum']:.1f}s) | "
+            f"tokens {s['prompt_tokens']}+{s['completion_tokens']} | retries {s['retries']} | "
+            f"cache hits {s['cache_hits']} | erros {s['errors']}"
+        )
+
+    def export(self) -> None:
+        """Acrescenta as chamadas novas ao JSONL e reescreve o textfile do Prometheus."""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            new_records = self.records[self._exported:]
+            self._exported = len(self.records)
+        with open(self.output_dir / "lm_calls.jsonl", "a", encoding="utf-8") as f:
+            for record in new_records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        prom_path = self.output_dir / "dspy_metrics.prom"
+        tmp_path = prom_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, prom_path)
+
+    def prometheus_text(self) -> str:
+        phases = sorted({r["phase"] for r in self.records} | set(self.phase_durations))
+        summaries = [self.summary(phase) for phase in phases]
+        lines = []
+
+        for metric, field, help_text in (
+            ("dspy_lm_call_latency_seconds", "latency", "Latência das chamadas ao LM"),
+            ("dspy_lm_limiter_wait_seconds", "limiter_wait", "Espera no rate limiter por chamada"),
+        ):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} summary"]
+            for s in summaries:
+                for q in QUANTILES:
+                    lines.append(f'{metric}{{phase="{s["phase"]}",quantile="{q}"}} {s[f"{field}_p{int(q * 100)}"]:.6f}')
+                lines.append(f'{metric}_sum{{phase="{s["phase"]}"}} {s[f"{field}_sum"]:.6f}')
+                lines.append(f'{metric}_count{{phase="{s["phase"]}"}} {s["calls"]}')
+
+        for metric, field, help_text in (
+            ("dspy_lm_prompt_tokens_total", "prompt_tokens", "Tokens de prompt enviados"),
+            ("dspy_lm_completion_tokens_total", "completion_tokens", "Tokens gerados"),
+            ("dspy_lm_retries_total", "retries", "Retries após 429 ou failover"),
+            ("dspy_lm_cache_hits_total", "cache_hits", "Respostas servidas pelo cache"),
+            ("dspy_lm_errors_total", "errors", "Chamadas que terminaram em erro"),
+        ):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            lines += [f'{metric}{{phase="{s["phase"]}"}} {s[field]}' for s in summaries]
+
+        lines += ["# HELP dspy_phase_duration_seconds Duração de cada fase", "# TYPE dspy_phase_duration_seconds gauge"]
+        lines += [f'dspy_phase_duration_seconds{{phase="{s["phase"]}"}} {s["duration"]:.3f}' for s in summaries]
+        return "\n".join(lines) + "\n"
+
+
+# Instância global, como o limiter padrão de `utils.rate_limiter`
+metrics = Metrics()
+
+
+class InstrumentedLM(DelegatingLM):
+    """
+    Camada mais externa: mede cada chamada (latência, tokens, espera no
+    limiter, retries e cache hit) e registra em `metrics` na fase atual.
+    As camadas internas reportam espera e retries via `record_limiter_wait`
+    e `record_retry`.
+    """
+
+    def __init__(self, lm, registry: Metrics = None):
+        super().__init__(lm)
+        self._metrics = registry if registry is not None else metrics
+
+    def _start(self):
+        call = {"limiter_wait": 0.0, "backoff_wait": 0.0, "retries": 0}
+        return call, _current_call.set(call), time.perf_counter()
+
+    def _finish(self, call, token, start, response=None, error=None):
+        _current_call.reset(token)
+        usage = dict(getattr(response, "usage", None) or {})
+        self._metrics.add({
+            "phase": self._metrics.current_phase,
+            "timestamp": time.time(),
+            "model": self.model,
+            "latency": round(time.perf_counter() - start, 6),
+            "limiter_wait": round(call["limiter_wait"], 6),
+            "backoff_wait": round(call["backoff_wait"], 6),
+            "retries": call["retries"],
+            "prompt_tokens": usage.get("prompt_tokens") or 0,
+            "completion_tokens": usage.get("completion_tokens") or 0,
+            "cache_hit": bool(getattr(response, "cache_hit", False)),
+            "error": type(error).__name__ if error is not None else None,
+        })
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        call, token, start = self._start()
+        try:
+            response = self._lm.forward(prompt=prompt, messages=messages, **kwargs)
+        except Exception as e:
+            self._finish(call, token, start, error=e)
+            raise
+        self._finish(call, token, start, response)
+        return response
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        call, token, start = self._start()
+        try:
+            response = await self._lm.aforward(prompt=prompt, messages=messages, **kwargs)
+        except Exception as e:
+            self._finish(call, token, start, error=e)
+            raise
+        self._finish(call, token, start, response)
+        return response
+
+
+def metrics_enabled() -> bool:
+    return os.getenv("DSPY_METRICS", "true").lower() == "true"
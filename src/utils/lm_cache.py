@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from litellm import ModelResponse
+
+from utils.lm_wrapper import DelegatingLM
+
+DEFAULT_CACHE_PATH = Path.home() / ".cache" / "dspy_ai_learning" / "lm_cache.sqlite"
+
+# Parâmetros que não mudam a resposta e não entram na chave
+_IGNORED_KWARGS = {"api_key", "api_base", "cache", "num_retries"}
+
+
+class CacheMissError(RuntimeError):
+    """Chamada não encontrada no cache em modo replay (somente leitura)."""
+
+
+class LMResponseCache:
+    """
+    Cache persistente (SQLite) de respostas do LM, endereçado por conteúdo.
+
+    A chave é o SHA-256 de modelo + mensagens renderizadas + parâmetros de
+    amostragem. O total em bytes fica em uma linha de `meta`, atualizada a
+    cada escrita; quando passa de `max_bytes`, as entradas menos usadas
+    recentemente (LRU) são removidas. No modo "replay" o cache é
+    somente leitura e um miss gera `CacheMissError`, permitindo repetir um
+    experimento totalmente offline.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes: int = 512 * 1024 * 1024, mode: str = "on"):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            # Caches criados antes do total em `meta`: soma uma única vez
+            conn.execute(
+                "INSERT OR IGNORE INTO meta (name, value) "
+                "SELECT 'total_bytes', COALESCE(SUM(size), 0) FROM responses"
+            )
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    @property
+    def read_only(self) -> bool:
+        return self.mode == "replay"
+
+    @staticmethod
+    def make_key(model: str, prompt, messages, kwargs: dict) -> str:
+        params = {k: v for k, v in kwargs.items() if k not in _IGNORED_KWARGS}
+        payload = json.dumps(
+            {"model": model, "prompt": prompt, "messages": messages, "params": params},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and not self.read_only:
+                conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        finally:
+            conn.close()
+
+        with self._lock:
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if row is None:
+            return None
+
+        response = ModelResponse(**json.loads(row[0]))
+        response.cache_hit = True
+        return response
+
+    def put(self, key: str, model: str, response) -> None:
+        if self.read_only:
+            return
+        value = json.dumps(response.model_dump(warnings=False), default=str)
+        now = time.time()
+        conn = self._connect()
+        try:
+            # Entrada e total na mesma transação (o arquivo é compartilhado entre processos)
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, value, size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, value, len(value), now, now),
+            )
+            total = self._add_total(conn, len(value) - (row[0] if row else 0))
+            if total > self.max_bytes:
+                self._evict(conn, total)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _add_total(conn: sqlite3.Connection, delta: int) -> int:
+        conn.execute("UPDATE meta SET value = value + ? WHERE name = 'total_bytes'", (delta,))
+        return conn.execute("SELECT value FROM meta WHERE name = 'total_bytes'").fetchone()[0]
+
+    def _evict(self, conn: sqlite3.Connection, total: int) -> None:
+        """Remove as entradas menos usadas até o total ficar em 90% de `max_bytes`."""
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        while total - removed > target:
+            # Em blocos, pelo índice de last_access: sem ler a tabela inteira
+            rows = conn.execute("SELECT key, size FROM responses ORDER BY last_access LIMIT 256").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total - removed <= target:
+                    break
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                removed += size
+        self._add_total(conn, -removed)
+
+    def stats(self) -> dict:
+        conn = self._connect()
+        try:
+            entries = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            size = conn.execute("SELECT value FROM meta WHERE name = 'total_bytes'").fetchone()[0]
+        finally:
+            conn.close()
+        lookups = self.hits + self.misses
+        return {
+            "mode": self.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+class CachedLM(DelegatingLM):
+    """
+    Wrapper que consulta o `LMResponseCache` antes de chamar o LM.
+
+    Deve ser a camada mais externa: um hit não passa pelo rate limiter
+    e não consome cota.
+    """
+
+    def __init__(self, lm, cache: LMResponseCache):
+        super().__init__(lm)
+        self._cache = cache
+
+    @property
+    def cache_stats(self) -> dict:
+        return self._cache.stats()
+
+    def _key(self, prompt, messages, kwargs):
+        return self._cache.make_key(self.model, prompt, messages, {**self.kwargs, **kwargs})
+
+    def _lookup(self, key):
+        response = self._cache.get(key)
+        if response is None and self._cache.read_only:
+            raise CacheMissError(f"Resposta não encontrada no cache (modo replay): {key[:12]}")
+        return response
+
+    def _store(self, key, response):
+        if isinstance(response, ModelResponse):
+            self._cache.put(key, self.model, response)
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        key = self._key(prompt, messages, kwargs)
+        response = self._lookup(key)
+        if response is None:
+            response = self._lm.forward(prompt=prompt, messages=messages, **kwargs)
+            self._store(key, response)
+        return response
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        key = self._key(prompt, messages, kwargs)
+        response = self._lookup(key)
+        if response is None:
+            response = await self._lm.aforward(prompt=prompt, messages=messages, **kwargs)
+            self._store(key, response)
+        return response
+
+
+def cache_from_env() -> LMResponseCache | None:
+    """
+    Cria o cache a partir de DSPY_LM_CACHE ("on", "replay" ou "off"),
+    DSPY_LM_CACHE_PATH e DSPY_LM_CACHE_MAX_MB.
+    """
+    mode = os.getenv("DSPY_LM_CACHE", "on").lower()
+    if mode == "off":
+        return None
+    return LMResponseCache(
+        path=os.getenv("DSPY_LM_CACHE_PATH", str(DEFAULT_CACHE_PATH)),
+        max_bytes=int(float(os.getenv("DSPY_LM_CACHE_MAX_MB", "512")) * 1024 * 1024),
+        mode=mode,
+    )
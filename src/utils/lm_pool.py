@@ -0,0 +1,200 @@
+import asyncio
+import os
+import random
+import threading
+import time
+
+import litellm
+
+from utils.adaptive_limiter import AsyncWaiters, is_rate_limit_error, retry_after_seconds
+from utils.instrumentation import record_retry
+from utils.lm_wrapper import DelegatingLM
+from utils.rate_limiter import RateLimitedLM, TokenBucketRateLimiter
+
+
+# Falhas do backend (e não da requisição), que justificam tentar outro
+_TRANSIENT_ERRORS = (litellm.Timeout, litellm.APIConnectionError, TimeoutError, ConnectionError)
+
+
+def is_transient_error(error: Exception) -> bool:
+    """429, 5xx, timeout ou erro de conexão: outro backend pode atender a mesma chamada."""
+    status = getattr(error, "status_code", None)
+    return (
+        is_rate_limit_error(error)
+        or isinstance(error, _TRANSIENT_ERRORS)
+        or (isinstance(status, int) and status >= 500)
+    )
+
+
+class PoolBackend:
+    """
+    Um backend do pool: LM próprio, limite de concorrência, peso e cooldown.
+
+    Depois de um 429 (ou 5xx, timeout, erro de conexão) o backend fica fora da rotação até
+    `cooldown_until`, e as chamadas seguintes vão para os demais.
+    """
+
+    def __init__(self, name: str, lm, max_concurrency: int = 4, weight: float = 1.0):
+        self.name = name
+        self.lm = lm
+        self.max_concurrency = max_concurrency
+        self.weight = weight
+        self.outstanding = 0
+        self.cooldown_until = 0.0
+        self.calls = 0
+        self.failures = 0
+
+    def available(self, now: float) -> bool:
+        return self.outstanding < self.max_concurrency and now >= self.cooldown_until
+
+    @property
+    def load(self) -> float:
+        return self.outstanding / (self.max_concurrency * self.weight)
+
+
+class LMPool(DelegatingLM):
+    """
+    Pool de LMs de backends diferentes, usado como um único `dspy.BaseLM`.
+
+    Cada backend tem o seu rate limiter (já aplicado no LM) e um limite de
+    chamadas simultâneas, então as cotas se somam. O roteamento é
+    "least_loaded" (menor ocupação relativa ao peso) ou "weighted" (sorteio
+    proporcional ao peso). Um 429, 5xx, timeout ou erro de conexão coloca o
+    backend em cooldown e a chamada é repetida no próximo; o erro só sobe
+    quando todos falharem. Outros erros (4xx, bugs) sobem direto, sem
+    cooldown.
+    """
+
+    def __init__(self, backends: list[PoolBackend], routing: str = "least_loaded",
+                 error_cooldown: float = 5.0, rate_limit_cooldown: float = 30.0, seed: int = None):
+        if not backends:
+            raise ValueError("O pool precisa de pelo menos um backend")
+        if routing not in ("least_loaded", "weighted"):
+            raise ValueError(f"Roteamento desconhecido: {routing}")
+        super().__init__(backends[0].lm)
+        self.backends = backends
+        self.routing = routing
+        self.error_cooldown = error_cooldown
+        self.rate_limit_cooldown = rate_limit_cooldown
+        self.model = "pool/" + "+".join(backend.name for backend in backends)
+        self._rng = random.Random(seed)
+        self._condition = threading.Condition()
+        self._async_waiters = AsyncWaiters()
+
+    def _choose(self, candidates: list[PoolBackend]) -> PoolBackend:
+        if self.routing == "weighted":
+            return self._rng.choices(candidates, weights=[b.weight for b in candidates])[0]
+        return min(candidates, key=lambda b: b.load)
+
+    def _try_acquire(self, excluded: set) -> tuple[PoolBackend | None, float]:
+        """Reserva uma vaga em um backend; sem vaga, retorna (None, segundos até o fim do cooldown mais próximo)."""
+        now = time.monotonic()
+        remaining = [b for b in self.backends if b.name not in excluded]
+        candidates = [b for b in remaining if b.available(now)]
+        if candidates:
+            backend = self._choose(candidates)
+            backend.outstanding += 1
+            backend.calls += 1
+            return backend, 0.0
+        cooling = [b.cooldown_until - now for b in remaining if b.cooldown_until > now]
+        return None, min(cooling) if cooling else 0.0
+
+    def _acquire(self, excluded: set) -> PoolBackend:
+        with self._condition:
+            while True:
+                backend, wait = self._try_acquire(excluded)
+                if backend:
+                    return backend
+                # Sem wait: todos ocupados, acorda quando alguma chamada terminar
+                self._condition.wait(timeout=wait or None)
+
+    async def _aacquire(self, excluded: set) -> PoolBackend:
+        while True:
+            with self._condition:
+                backend, wait = self._try_acquire(excluded)
+                if backend:
+                    return backend
+                waiter = self._async_waiters.add()
+            # Como em `_acquire`: acorda no fim de uma chamada ou, se houver, do cooldown
+            await asyncio.wait([waiter], timeout=wait or None)
+
+    def _release(self, backend: PoolBackend, error: Exception = None) -> None:
+        with self._condition:
+            backend.outstanding -= 1
+            if error is not None:
+                backend.failures += 1
+                if is_rate_limit_error(error):
+                    cooldown = retry_after_seconds(error) or self.rate_limit_cooldown
+                else:
+                    cooldown = self.error_cooldown
+                backend.cooldown_until = max(backend.cooldown_until, time.monotonic() + cooldown)
+            self._condition.notify_all()
+            self._async_waiters.notify_all()
+
+    def _on_failure(self, backend: PoolBackend, error: Exception, tried: set) -> None:
+        if not is_transient_error(error):
+            # A falha é da chamada, não do backend: repetir em outro não adianta
+            self._release(backend)
+            raise error
+        self._release(backend, error)
+        tried.add(backend.name)
+        print(f"Backend {backend.name} falhou ({type(error).__name__}); tentando outro backend...")
+        if len(tried) == len(self.backends):
+            raise error
+        record_retry()
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        tried = set()
+        while True:
+            backend = self._acquire(tried)
+            try:
+                response = backend.lm.forward(prompt=prompt, messages=messages, **kwargs)
+            except Exception as e:
+                self._on_failure(backend, e, tried)
+                continue
+            self._release(backend)
+            return response
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        tried = set()
+        while True:
+            backend = await self._aacquire(tried)
+            try:
+                response = await backend.lm.aforward(prompt=prompt, messages=messages, **kwargs)
+            except Exception as e:
+                self._on_failure(backend, e, tried)
+                continue
+            self._release(backend)
+            return response
+
+    def stats(self) -> dict:
+        return {
+            backend.name: {"calls": backend.calls, "failures": backend.failures, "outstanding": backend.outstanding}
+            for backend in self.backends
+        }
+
+
+def backend_from_env(name: str, lm, remote: bool = True) -> PoolBackend:
+    """
+    Monta um backend com limiter próprio a partir de DSPY_POOL_<NOME>_MAX_REQ,
+    _WINDOW, _BURST, _CONCURRENCY e _WEIGHT (padrões: variáveis DSPY_API_*).
+    Backends locais (remote=False) não passam por rate limiter.
+    """
+    prefix = f"DSPY_POOL_{name.upper()}_"
+
+    def setting(key, default):
+        return os.getenv(prefix + key, os.getenv(f"DSPY_API_{key}", default))
+
+    if remote:
+        limiter = TokenBucketRateLimiter(
+            max_requests=int(setting("MAX_REQ", "1")),
+            window_seconds=int(setting("WINDOW", "30")),
+            burst=int(setting("BURST", "1")),
+        )
+        lm = RateLimitedLM(lm, limiter)
+    return PoolBackend(
+        name,
+        lm,
+        max_concurrency=int(os.getenv(prefix + "CONCURRENCY", os.getenv("DSPY_API_MAX_CONCURRENCY", "4"))),
+        weight=float(os.getenv(prefix + "WEIGHT", "1")),
+    )
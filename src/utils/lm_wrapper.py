@@ -0,0 +1,38 @@
+import copy
+
+import dspy
+
+
+class DelegatingLM(dspy.BaseLM):
+    """
+    Base para wrappers de LM que podem ser usados em `dspy.settings.configure(lm=...)`.
+
+    O dspy exige uma instância de `dspy.BaseLM`; este wrapper delega `forward`,
+    `aforward` e qualquer atributo (model, kwargs, history...) ao LM original.
+    Subclasses sobrescrevem `forward`/`aforward` para adicionar comportamento.
+    """
+
+    def __init__(self, lm):
+        # Não chamamos BaseLM.__init__: o estado vem do LM original via __getattr__
+        self._lm = lm
+
+    def __getattr__(self, name):
+        if name == "_lm":
+            raise AttributeError(name)
+        return getattr(self._lm, name)
+
+    def __deepcopy__(self, memo):
+        # Copia apenas o LM interno; limitadores, caches e métricas continuam compartilhados
+        clone = object.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        clone._lm = copy.deepcopy(self._lm, memo)
+        return clone
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        return self._lm.forward(prompt=prompt, messages=messages, **kwargs)
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        return await self._lm.aforward(prompt=prompt, messages=messages, **kwargs)
+
+    def dump_state(self):
+        return self._lm.dump_state()
@@ -1,3 +1,4 @@
+import asyncio
 import os
 import time
 import functools
@@ -7,6 +8,10 @@ import threading
 
 import dspy
 
+from utils.instrumentation import record_limiter_wait
+from utils.lm_wrapper import DelegatingLM
+from utils.tokenizer import estimate_tokens
+
 
 class RateLimiter(dspy.LM):
     """
@@ -117,35 +122,235 @@ class RateLimiter(dspy.LM):
         return wrapper
 
 
-# Singleton global para usar em qualquer lugar
-_max_req = int(os.getenv("DSPY_API_MAX_REQ", "1"))
-_window = int(os.getenv("DSPY_API_WINDOW", "30"))
-gemini_rate_limiter = RateLimiter(max_requests=_max_req, window_seconds=_window)
+class TokenBucket:
+    """
+    Balde de tokens nomeado (ex.: "requests", "tokens").
+
+    Acumula até `capacity` unidades (rajada máxima) e repõe `refill_amount`
+    unidades a cada `refill_period` segundos, medidos com relógio monotônico.
+    O saldo pode ficar negativo: isso representa vagas já reservadas no futuro.
+    """
+
+    def __init__(self, name: str, refill_amount: float, refill_period: float, capacity: float = None):
+        self.name = name
+        self.rate = refill_amount / refill_period  # unidades por segundo
+        self.capacity = capacity if capacity is not None else refill_amount
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Reserva `amount` unidades e retorna quantos segundos aguardar até poder usá-las."""
+        self._refill(now)
+        self.tokens -= amount
+        return max(0.0, -self.tokens / self.rate)
+
+    def consume(self, amount: float, now: float) -> None:
+        """
+        Debita unidades já gastas (ex.: tokens da resposta), sem aguardar.
+        Um `amount` negativo devolve unidades reservadas a mais (até `capacity`).
+        """
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class TokenBucketRateLimiter(RateLimiter):
+    """
+    Rate limiter por balde de tokens, substituto direto do `RateLimiter`.
+
+    Diferenças em relação à janela deslizante:
+    - A vaga é reservada sob o lock, mas o `sleep` acontece fora dele,
+      então várias threads aguardam em paralelo cada uma pela sua vaga.
+    - Usa `time.monotonic()` (sem `datetime`/`timedelta` por chamada).
+    - Permite rajadas de até `burst` requisições.
+    - Suporta vários baldes nomeados, ex. requisições/min e tokens/min.
+
+    Uso:
+        limiter = TokenBucketRateLimiter(max_requests=5, window_seconds=60, burst=2)
+        limiter.add_bucket("tokens", refill_amount=250_000, refill_period=60)
+        limiter.wait_if_needed(tokens=1200)
+    """
+
+    def __init__(self, max_requests=5, window_seconds=60, burst=1):
+        """
+        Args:
+            max_requests: Requisições repostas por janela (padrão: 5)
+            window_seconds: Tamanho da janela em segundos (padrão: 60s = 1 min)
+            burst: Máximo de requisições seguidas sem espera (padrão: 1)
+        """
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.lock = threading.Lock()
+        self.buckets = {
+            "requests": TokenBucket("requests", max_requests, window_seconds, capacity=burst),
+        }
+        print(f"\n TokenBucketRateLimiter inicializado: {max_requests} req/{window_seconds}s (burst={burst})")
+
+    def add_bucket(self, name: str, refill_amount: float, refill_period: float, capacity: float = None) -> None:
+        with self.lock:
+            self.buckets[name] = TokenBucket(name, refill_amount, refill_period, capacity)
+
+    def reserve(self, **costs) -> float:
+        """
+        Reserva as unidades em todos os baldes e retorna a espera necessária.
+        Por padrão cada chamada custa 1 em "requests".
+        """
+        costs.setdefault("requests", 1)
+        with self.lock:
+            now = time.monotonic()
+            return max(
+                self.buckets[name].reserve(amount, now)
+                for name, amount in costs.items()
+                if name in self.buckets
+            )
+
+    def consume(self, **costs) -> None:
+        """Contabiliza custos conhecidos só depois da chamada (ex.: tokens usados)."""
+        with self.lock:
+            now = time.monotonic()
+            for name, amount in costs.items():
+                if name in self.buckets:
+                    self.buckets[name].consume(amount, now)
 
+    def wait_if_needed(self, **costs) -> float:
+        """
+        Aguarda (fora do lock) até a vaga reservada ficar disponível.
 
-class RateLimitedLM:
-    """Wrapper simples para um objeto LLM que aplica rate limiting por chamada.
+        Returns:
+            float: Segundos aguardados (0 se não teve espera)
+        """
+        wait_time = self.reserve(**costs)
+        if wait_time > 0:
+            time.sleep(wait_time)
+        return wait_time
+
+
+def _build_default_limiter() -> RateLimiter:
+    max_req = int(os.getenv("DSPY_API_MAX_REQ", "1"))
+    window = int(os.getenv("DSPY_API_WINDOW", "30"))
+    burst = int(os.getenv("DSPY_API_BURST", "1"))
+    kind = os.getenv("DSPY_API_LIMITER", "token_bucket").lower()
+    if kind == "sliding_window":
+        return RateLimiter(max_requests=max_req, window_seconds=window)
+
+    if kind == "shared":
+        # Cota única para todos os processos locais (ver utils/shared_limiter.py)
+        from utils.shared_limiter import DEFAULT_DB_PATH, SharedTokenBucketRateLimiter
+
+        limiter = SharedTokenBucketRateLimiter(
+            max_requests=max_req,
+            window_seconds=window,
+            burst=burst,
+            path=os.getenv("DSPY_API_LIMITER_DB", str(DEFAULT_DB_PATH)),
+            namespace=os.getenv("DSPY_API_LIMITER_NAMESPACE", "default"),
+        )
+    else:
+        limiter = TokenBucketRateLimiter(max_requests=max_req, window_seconds=window, burst=burst)
+    max_tokens = os.getenv("DSPY_API_MAX_TOKENS")
+    if max_tokens:
+        limiter.add_bucket("tokens", refill_amount=int(max_tokens), refill_period=window)
+    return limiter
+
+
+class AsyncRateLimiter:
+    """
+    Versão assíncrona do rate limiter, para uso com asyncio.
 
-    Usa o `gemini_rate_limiter` para aguardar entre invocações ao modelo.
-    O wrapper delega qualquer atributo ao objeto subjacente.
+    Compartilha a cota com o limiter síncrono que envolve: com o
+    `TokenBucketRateLimiter` a vaga é reservada (operação rápida, sem espera)
+    e a espera é feita com `asyncio.sleep`, sem bloquear o event loop.
+    Com o `RateLimiter` de janela deslizante a espera roda em uma thread.
     """
-    def __init__(self, lm, limiter: RateLimiter = gemini_rate_limiter):
-        self._lm = lm
-        self._limiter = limiter
 
-    def __getattr__(self, name):
-        return getattr(self._lm, name)
+    def __init__(self, limiter: RateLimiter):
+        self.limiter = limiter
 
-    def __call__(self, *args, **kwargs):
+    async def wait_if_needed(self, **costs) -> float:
+        if isinstance(self.limiter, TokenBucketRateLimiter):
+            wait_time = self.limiter.reserve(**costs)
+            if wait_time > 0:
+                await asyncio.sleep(wait_time)
+            return wait_time
+        return await asyncio.to_thread(self.limiter.wait_if_needed)
+
+
+# Singleton global para usar em qualquer lugar, criado no primeiro uso
+# (o limiter em SQLite abre o banco ao ser construído)
+_default_limiter = None
+_default_limiter_lock = threading.Lock()
+
+
+def get_default_limiter() -> RateLimiter:
+    global _default_limiter
+    with _default_limiter_lock:
+        if _default_limiter is None:
+            _default_limiter = _build_default_limiter()
+        return _default_limiter
+
+
+def __getattr__(name):
+    # Compatibilidade com `from utils.rate_limiter import gemini_rate_limiter`
+    if name == "gemini_rate_limiter":
+        return get_default_limiter()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class RateLimitedLM(DelegatingLM):
+    """Wrapper de LLM que aplica rate limiting por chamada.
+
+    Usa o limiter padrão (`get_default_limiter()`) para aguardar entre invocações ao modelo.
+    Por ser um `dspy.BaseLM`, pode ser instalado em `dspy.settings` e é
+    compartilhado por todas as threads de `Evaluate`/`MIPROv2`.
+    Quando o limiter tem um balde "tokens", cada chamada reserva antes uma
+    estimativa dos tokens (prompt + `max_tokens`) e aguarda por ela; depois
+    da resposta só a diferença para os tokens usados é debitada (ou
+    devolvida). Chamadas assíncronas (`acall`) aguardam a vaga via
+    `AsyncRateLimiter`, sem bloquear o event loop.
+    """
+    def __init__(self, lm, limiter: RateLimiter = None):
+        super().__init__(lm)
+        self._limiter = limiter if limiter is not None else get_default_limiter()
+
+    def _costs(self, prompt=None, messages=None, **kwargs) -> dict:
+        """Custos a reservar antes da chamada: a estimativa de tokens, se houver balde "tokens"."""
+        if not isinstance(self._limiter, TokenBucketRateLimiter) or "tokens" not in self._limiter.buckets:
+            return {}
+        text = prompt or ""
+        for message in messages or []:
+            content = message.get("content") if isinstance(message, dict) else message
+            text += content if isinstance(content, str) else str(content or "")
+        max_tokens = kwargs.get("max_tokens") or (getattr(self._lm, "kwargs", None) or {}).get("max_tokens") or 0
+        return {"tokens": estimate_tokens(text) + int(max_tokens)}
+
+    def _record_usage(self, response, costs: dict = None):
+        usage = getattr(response, "usage", None)
+        if isinstance(self._limiter, TokenBucketRateLimiter) and usage:
+            reserved = (costs or {}).get("tokens", 0)
+            self._limiter.consume(tokens=dict(usage).get("total_tokens", 0) - reserved)
+
+    def forward(self, prompt=None, messages=None, **kwargs):
         # Garantir que não ultrapassamos a cota antes de cada chamada
-        self._limiter.wait_if_needed()
-        return self._lm(*args, **kwargs)
+        costs = self._costs(prompt, messages, **kwargs)
+        record_limiter_wait(self._limiter.wait_if_needed(**costs))
+        response = self._lm.forward(prompt=prompt, messages=messages, **kwargs)
+        self._record_usage(response, costs)
+        return response
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        costs = self._costs(prompt, messages, **kwargs)
+        record_limiter_wait(await AsyncRateLimiter(self._limiter).wait_if_needed(**costs))
+        response = await self._lm.aforward(prompt=prompt, messages=messages, **kwargs)
+        self._record_usage(response, costs)
+        return response
 
     # Algumas implementações expõem métodos como `generate` ou `completion`
     def generate(self, *args, **kwargs):
-        self._limiter.wait_if_needed()
+        record_limiter_wait(self._limiter.wait_if_needed(**self._costs(**kwargs)))
         return getattr(self._lm, 'generate')(*args, **kwargs)
 
     def completion(self, *args, **kwargs):
-        self._limiter.wait_if_needed()
-        return getattr(self._lm, 'completion')(*args, **kwargs)
\ No newline at end of file
+        record_limiter_wait(self._limiter.wait_if_needed(**self._costs(**kwargs)))
+        return getattr(self._lm, 'completion')(*args, **kwargs)
@@ -0,0 +1,81 @@
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from utils.rate_limiter import TokenBucketRateLimiter
+
+DEFAULT_DB_PATH = Path(tempfile.gettempdir()) / "dspy_ai_learning_rate_limit.sqlite"
+
+
+class SharedTokenBucketRateLimiter(TokenBucketRateLimiter):
+    """
+    Balde de tokens com estado compartilhado entre processos do mesmo host.
+
+    O saldo de cada balde fica em um arquivo SQLite; cada reserva é uma
+    transação `BEGIN IMMEDIATE` (lock de escrita), então jobs rodando lado a
+    lado (ex.: EVALUATION e MIPRO na mesma API key) dividem uma única cota.
+    Como no `TokenBucketRateLimiter`, a espera acontece fora da transação.
+
+    `namespace` separa cotas diferentes no mesmo arquivo (ex.: uma por API key).
+    Todos os processos devem usar a mesma configuração de taxa.
+    """
+
+    def __init__(self, max_requests=5, window_seconds=60, burst=1, path=DEFAULT_DB_PATH, namespace="default"):
+        self.path = str(path)
+        self.namespace = namespace
+        super().__init__(max_requests=max_requests, window_seconds=window_seconds, burst=burst)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " name TEXT PRIMARY KEY,"
+                " tokens REAL NOT NULL,"
+                " updated REAL NOT NULL)"
+            )
+        finally:
+            conn.close()
+        print(f" Estado do rate limiter compartilhado em {self.path} (namespace={namespace})")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _apply(self, costs: dict) -> float:
+        """Atualiza atomicamente os saldos no SQLite e retorna a maior espera."""
+        waits = [0.0]
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Relógio de parede: time.monotonic() não é comparável entre processos
+            now = time.time()
+            for name, amount in costs.items():
+                bucket = self.buckets.get(name)
+                if bucket is None:
+                    continue
+                key = f"{self.namespace}:{name}"
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (key,)).fetchone()
+                tokens, updated = row if row else (bucket.capacity, now)
+                tokens = min(bucket.capacity, tokens + max(0.0, now - updated) * bucket.rate)
+                # Custo negativo (estimativa de tokens acima do usado) devolve até `capacity`
+                tokens = min(bucket.capacity, tokens - amount)
+                conn.execute(
+                    "INSERT INTO buckets (name, tokens, updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                    (key, tokens, now),
+                )
+                waits.append(max(0.0, -tokens / bucket.rate))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return max(waits)
+
+    def reserve(self, **costs) -> float:
+        costs.setdefault("requests", 1)
+        return self._apply(costs)
+
+    def consume(self, **costs) -> None:
+        self._apply(costs)
@@ -0,0 +1,87 @@
+import functools
+import os
+import threading
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa barata de tokens (~4 caracteres por token)."""
+    return len(text) // 4 + 1
+
+
+class Tokenizer:
+    """
+    Contagem e corte de texto em tokens, com memoização por texto.
+
+    Usa o tokenizer que o litellm escolhe para `model` (o cl100k do tiktoken,
+    embutido no litellm, quando o modelo não tem um próprio: funciona sem
+    rede). Se o tokenizer não puder ser carregado, cai na estimativa de
+    ~4 caracteres por token.
+    """
+
+    def __init__(self, model: str = "", cache_size: int = 65536):
+        self.model = model
+        self._encoding = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._encode = functools.lru_cache(maxsize=cache_size)(self._encode_uncached)
+
+    def _get_encoding(self):
+        with self._lock:
+            if not self._loaded:
+                try:
+                    from litellm.utils import _select_tokenizer
+
+                    self._encoding = _select_tokenizer(model=self.model)["tokenizer"]
+                except Exception as e:
+                    print(f" Tokenizer indisponível para '{self.model}' ({e}); usando estimativa por caracteres")
+                self._loaded = True
+            return self._encoding
+
+    def _encode_uncached(self, text: str) -> tuple | None:
+        encoding = self._get_encoding()
+        if encoding is None:
+            return None
+        if hasattr(encoding, "encode_ordinary"):
+            return tuple(encoding.encode_ordinary(text))
+        return tuple(encoding.encode(text).ids)
+
+    @property
+    def name(self) -> str:
+        encoding = self._get_encoding()
+        if encoding is None:
+            return "chars/4"
+        return getattr(encoding, "name", None) or self.model or type(encoding).__name__
+
+    def count(self, text: str) -> int:
+        tokens = self._encode(text)
+        return estimate_tokens(text) if tokens is None else len(tokens)
+
+    def head(self, text: str, max_tokens: int) -> str:
+        """Os primeiros `max_tokens` tokens do texto."""
+        tokens = self._encode(text)
+        if tokens is None:
+            return text[:max_tokens * 4]
+        return self._encoding.decode(list(tokens[:max_tokens]))
+
+    def tail(self, text: str, max_tokens: int) -> str:
+        """Os últimos `max_tokens` tokens do texto."""
+        if max_tokens <= 0:
+            return ""
+        tokens = self._encode(text)
+        if tokens is None:
+            return text[-max_tokens * 4:]
+        return self._encoding.decode(list(tokens[-max_tokens:]))
+
+
+_tokenizers = {}
+_tokenizers_lock = threading.Lock()
+
+
+def get_tokenizer(model: str = None) -> Tokenizer:
+    """Tokenizer compartilhado por modelo (TEXT_BUDGET_TOKENIZER_MODEL; padrão: cl100k)."""
+    if model is None:
+        model = os.getenv("TEXT_BUDGET_TOKENIZER_MODEL", "")
+    with _tokenizers_lock:
+        if model not in _tokenizers:
+            _tokenizers[model] = Tokenizer(model)
+        return _tokenizers[model]